@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import threading
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import dspy
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchItem:
+    """Outcome for one input text: a prediction or the error it raised."""
+
+    text: str
+    prediction: dspy.Prediction | None = None
+    error: Exception | None = None
+    cost: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def redacted_text(self) -> str | None:
+        return self.prediction.redacted_text if self.prediction is not None else None
+
+
+@dataclass
+class BatchResult:
+    """Per-item results in input order, plus batch-level throughput and cost."""
+
+    items: list[BatchItem] = field(default_factory=list)
+    elapsed: float = 0.0
+    cost: float = 0.0
+    unique: int = 0
+
+    @property
+    def throughput(self) -> float:
+        """Texts per second over the whole batch (duplicates included)."""
+        return len(self.items) / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def errors(self) -> list[BatchItem]:
+        return [item for item in self.items if not item.ok]
+
+
+def _lm_cost(lm: dspy.LM) -> float:
+    return sum(entry.get("cost", 0) or 0 for entry in lm.history)
+
+
+def _costed(
+    predict: Callable[[str], dspy.Prediction], lm: dspy.LM | None
+) -> Callable[[str], tuple[dspy.Prediction, float]]:
+    """Wrap predict to run on its own copy of lm and return (pred, cost).
+
+    The copy's history holds exactly this item's calls, so cost is exact no
+    matter how long the batch is or what else shares lm.
+    """
+
+    def run(text: str) -> tuple[dspy.Prediction, float]:
+        if lm is None:
+            return predict(text), 0.0
+        item_lm = lm.copy()
+        with dspy.context(lm=item_lm):
+            pred = predict(text)
+        return pred, _lm_cost(item_lm)
+
+    return run
+
+
+def redact_many(
+    texts: Iterable[str],
+    predict: Callable[[str], dspy.Prediction],
+    lm: dspy.LM | None = None,
+    num_threads: int = 8,
+    max_in_flight: int | None = None,
+) -> BatchResult:
+    """Redact a batch of texts through a bounded thread pool.
+
+    Identical inputs are sent to the model once and share the prediction.
+    At most max_in_flight requests (default: 2 * num_threads) are submitted
+    at a time, so a very large iterable is consumed lazily instead of being
+    queued up front.  A failing item records its exception in
+    BatchItem.error; the rest of the batch still completes.
+
+    predict is any callable text -> Prediction that calls the LM of the
+    calling dspy context (e.g. a program's __call__).  If lm is given, each
+    item runs with its own copy of lm bound, and the cost in that copy's
+    history is reported per item (BatchItem.cost) and summed on the result.
+    """
+    max_in_flight = max_in_flight or 2 * num_threads
+    slots = threading.BoundedSemaphore(max_in_flight)
+    run = _costed(predict, lm)
+
+    inputs: list[str] = []
+    futures: dict[str, Future] = {}
+    start = time.perf_counter()
+
+    def release(_future: Future) -> None:
+        slots.release()
+
+    with ThreadPoolExecutor(max_workers=num_threads) as pool:
+        for text in texts:
+            inputs.append(text)
+            if text in futures:
+                continue
+            slots.acquire()
+            future = pool.submit(run, text)
+            future.add_done_callback(release)
+            futures[text] = future
+
+    return _finish(inputs, futures, start)
+
+
+def _finish(
+    inputs: list[str],
+    outcomes: dict[str, Future | asyncio.Future],
+    start: float,
+) -> BatchResult:
+    """Fan unique outcomes back out to input order and log batch stats.
+
+    A duplicate shares its first occurrence's prediction; the cost is
+    counted once, on the first occurrence.
+    """
+    items: list[BatchItem] = []
+    seen: set[str] = set()
+    for text in inputs:
+        outcome = outcomes[text]
+        error = outcome.exception()
+        if error is not None:
+            items.append(BatchItem(text=text, error=error))
+            continue
+        pred, cost = outcome.result()
+        items.append(
+            BatchItem(text=text, prediction=pred, cost=0.0 if text in seen else cost)
+        )
+        seen.add(text)
+
+    result = BatchResult(
+        items=items,
+        elapsed=time.perf_counter() - start,
+        cost=sum(item.cost for item in items),
+        unique=len(outcomes),
+    )
+    logger.info(
+        "Redacted %d texts (%d unique, %d failed) in %.2fs — %.1f texts/s, $%.4f",
+        len(items),
+        result.unique,
+        len(result.errors),
+        result.elapsed,
+        result.throughput,
+        result.cost,
+    )
+    return result
+
+
+async def aredact_many(
+    texts: Iterable[str],
+    apredict: Callable[[str], Awaitable[dspy.Prediction]],
+    lm: dspy.LM | None = None,
+    concurrency: int = 100,
+) -> BatchResult:
+    """Async counterpart of redact_many for a single event loop.
+
+    Each unique text becomes a task; an asyncio.Semaphore caps how many LM
+    requests are awaiting a response at once, so hundreds of calls can be in
+    flight without a thread per request.  Ordering, dedupe, per-item errors
+    and cost reporting behave as in redact_many.
+    """
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run(text: str) -> tuple[dspy.Prediction, float]:
+        async with limit:
+            if lm is None:
+                return await apredict(text), 0.0
+            item_lm = lm.copy()
+            with dspy.context(lm=item_lm):
+                pred = await apredict(text)
+            return pred, _lm_cost(item_lm)
+
+    inputs = list(texts)
+    start = time.perf_counter()
+    tasks = {text: asyncio.ensure_future(run(text)) for text in dict.fromkeys(inputs)}
+    await asyncio.gather(*tasks.values(), return_exceptions=True)
+    return _finish(inputs, tasks, start)
@@ -0,0 +1,134 @@
+import logging
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import dspy
+import numpy as np
+
+from evaluator import _evaluate_journaled, _load_program, prepare_eval_examples
+from optimizer import download_dataset, pii_metric
+from ratelimit import ScheduledLM, scheduler_for
+from redactor import STRATEGIES
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class VariantResult:
+    strategy: str
+    score: float
+    examples: int
+    failed: int
+    output_tokens: int
+    cost: float
+    p50: float
+    p90: float
+    p99: float
+
+    @property
+    def tokens_per_example(self) -> float:
+        return self.output_tokens / self.examples if self.examples else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.strategy:<9} score {self.score:6.2f}  "
+            f"out tokens/ex {self.tokens_per_example:7.1f}  "
+            f"latency p50 {self.p50:5.2f}s p90 {self.p90:5.2f}s "
+            f"p99 {self.p99:5.2f}s  "
+            f"${self.cost:.4f}  ({self.failed} failed)"
+        )
+
+
+def run_variant(
+    program: dspy.Module,
+    strategy: str,
+    examples: Sequence[dspy.Example],
+    lm: dspy.LM,
+    num_threads: int = 20,
+) -> VariantResult:
+    """Run program on every example and collect its score and call stats.
+
+    Examples that raise score 0, as in evaluate().
+    """
+    scores: list[float] = []
+    latencies: list[float] = []
+    costs: list[float] = []
+    tokens: list[int] = []
+
+    def record(i, example, pred, *, cost, latency, output_tokens) -> None:
+        scores.append(pii_metric(example, dspy.Prediction(**pred)).score)
+        latencies.append(latency)
+        costs.append(cost)
+        tokens.append(output_tokens)
+
+    _evaluate_journaled(program, list(enumerate(examples)), lm, record, num_threads)
+    if latencies:
+        p50, p90, p99 = (float(p) for p in np.percentile(latencies, [50, 90, 99]))
+    else:
+        p50 = p90 = p99 = float("nan")
+    return VariantResult(
+        strategy=strategy,
+        score=round(100 * sum(scores) / len(examples), 2) if examples else 0.0,
+        examples=len(examples),
+        failed=len(examples) - len(scores),
+        output_tokens=sum(tokens),
+        cost=sum(costs),
+        p50=round(p50, 3),
+        p90=round(p90, 3),
+        p99=round(p99, 3),
+    )
+
+
+def pick_variant(
+    results: Sequence[VariantResult], min_score: float
+) -> VariantResult | None:
+    """The variant with the lowest p90 latency among those scoring min_score."""
+    passing = [r for r in results if r.score >= min_score]
+    return min(passing, key=lambda r: (r.p90, r.output_tokens), default=None)
+
+
+def benchmark(
+    api_key: str,
+    model: str,
+    strategies: Sequence[str] = STRATEGIES,
+    entities_only: bool = False,
+    randomize: bool = False,
+    stratify: bool = False,
+    min_score: float | None = None,
+) -> list[VariantResult]:
+    """Compare PIIRedactor module strategies on the same eval slice.
+
+    Each strategy's program (optimized if saved, else base; see
+    evaluator._load_program) runs over the examples evaluate() would use,
+    with the LM cache off so latencies are real calls.  Logs output
+    tokens, latency percentiles, cost and hybrid score per variant and,
+    with min_score, the fastest variant (by p90) that meets it.
+    """
+    scheduler = scheduler_for(model)
+    eval_set = prepare_eval_examples(
+        download_dataset(), randomize=randomize, stratify=stratify
+    )
+    results = []
+    for strategy in strategies:
+        lm = ScheduledLM(model, api_key=api_key, scheduler=scheduler, cache=False)
+        program = _load_program(entities_only, strategy)
+        logger.info("Benchmarking %s on %d examples", strategy, len(eval_set))
+        result = run_variant(
+            program, strategy, eval_set, lm, num_threads=scheduler.max_concurrency
+        )
+        logger.info("%s", result)
+        results.append(result)
+
+    logger.info(
+        "Benchmark (%s, %d examples):\n%s",
+        model,
+        len(eval_set),
+        "\n".join(str(r) for r in results),
+    )
+    if min_score is not None:
+        best = pick_variant(results, min_score)
+        if best is None:
+            logger.info("No variant reached a score of %.2f", min_score)
+        else:
+            logger.info("Fastest variant scoring >= %.2f: %s", min_score, best.strategy)
+    return results
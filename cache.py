@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+import dspy
+
+from redactor import prediction_dict, program_hash
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = "./cache/redactions.sqlite"
+
+
+def cache_key(text: str, model: str, program_digest: str, config: str = "") -> str:
+    """Content address for a redaction: hash of (text, model, program state,
+    wrapper configuration)."""
+    h = hashlib.sha256()
+    for part in (model, program_digest, config, text):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class RedactionCache:
+    """Two-tier redaction result cache: in-memory LRU over a SQLite file.
+
+    Entries older than ttl seconds are ignored and eventually deleted; the
+    disk tier is trimmed to max_disk_entries (least recently used first).
+    Each row records the program hash it was produced with, so
+    purge_programs() can drop results from superseded programs.
+    """
+
+    def __init__(
+        self,
+        path: str | None = CACHE_PATH,
+        max_entries: int = 1024,
+        ttl: float = 7 * 24 * 3600,
+        max_disk_entries: int = 100_000,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._memory: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db: sqlite3.Connection | None = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS redactions ("
+                "key TEXT PRIMARY KEY, program TEXT, value TEXT, "
+                "created REAL, accessed REAL)"
+            )
+            self._db.commit()
+
+    def __deepcopy__(self, memo: dict) -> "RedactionCache":
+        # Shared by design: program copies (e.g. inside optimizers) reuse it.
+        return self
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created FROM redactions WHERE key = ? AND created >= ?",
+                    (key, now - self.ttl),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE redactions SET accessed = ? WHERE key = ?", (now, key)
+                    )
+                    # don't hold the write lock other connections need
+                    self._db.commit()
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: dict[str, Any], program: str = "") -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO redactions VALUES (?, ?, ?, ?, ?)",
+                (key, program, json.dumps(value), now, now),
+            )
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._evict(now)
+            self._db.commit()
+
+    def _remember(self, key: str, created: float, value: dict[str, Any]) -> None:
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now: float) -> None:
+        self._db.execute("DELETE FROM redactions WHERE created < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM redactions WHERE key NOT IN ("
+            "SELECT key FROM redactions ORDER BY accessed DESC LIMIT ?)",
+            (self.max_disk_entries,),
+        )
+
+    def purge_programs(self, programs: Iterable[str]) -> int:
+        """Delete cached results produced by any of the given program hashes."""
+        programs = list(programs)
+        with self._lock:
+            self._memory.clear()
+            if self._db is None or not programs:
+                return 0
+            marks = ", ".join("?" * len(programs))
+            deleted = self._db.execute(
+                f"DELETE FROM redactions WHERE program IN ({marks})", programs
+            ).rowcount
+            self._db.commit()
+        return deleted
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses}
+
+
+class CachedRedactor(dspy.Module):
+    """Serve repeated inputs from a RedactionCache instead of the LM.
+
+    The key covers the input text, the model name, the hash of the wrapped
+    program's state and config, a description of the wrappers around it
+    (repair, cascade, chunking, ...) that change its output, so a new
+    optimized program, a different model or session setup never returns
+    stale results.
+    """
+
+    def __init__(
+        self,
+        program: dspy.Module,
+        model: str,
+        cache: RedactionCache,
+        config: str = "",
+    ) -> None:
+        super().__init__()
+        self.program = program
+        self.model = model
+        self.cache = cache
+        self.config = config
+        self.program_digest = program_hash(program)
+
+    def _lookup(self, text: str) -> tuple[str, dspy.Prediction | None]:
+        key = cache_key(text, self.model, self.program_digest, self.config)
+        value = self.cache.get(key)
+        return key, dspy.Prediction(**value) if value is not None else None
+
+    def forward(self, text: str) -> dspy.Prediction:
+        key, cached = self._lookup(text)
+        if cached is not None:
+            return cached
+        pred = self.program(text=text)
+        self.cache.put(key, prediction_dict(pred), self.program_digest)
+        return pred
+
+    async def aforward(self, text: str) -> dspy.Prediction:
+        key, cached = self._lookup(text)
+        if cached is not None:
+            return cached
+        pred = await self.program.acall(text=text)
+        self.cache.put(key, prediction_dict(pred), self.program_digest)
+        return pred
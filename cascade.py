@@ -0,0 +1,98 @@
+import logging
+import threading
+from collections import Counter
+
+import dspy
+
+from rules import RuleEngine
+from validation import Issue, validate
+
+logger = logging.getLogger(__name__)
+
+_stats_lock = threading.Lock()
+
+
+class CascadeRedactor(dspy.Module):
+    """Try a cheap model first and escalate only outputs that fail validation.
+
+    Each text is redacted with cheap_lm; the prediction is checked locally
+    with validation.validate and, if any issue is found (or the cheap call
+    fails), redacted again with the LM of the calling context, normally the
+    stronger model.  Cheap-model cost and output tokens are counted in
+    cheap_cost and cheap_output_tokens.  The cheap calls are also appended
+    to the calling LM's history, within dspy's max_history_size (and not at
+    all with disable_history), so a per-call LM copy's totals cover both
+    models while a long-lived LM's history stays bounded.
+    """
+
+    def __init__(self, program: dspy.Module, cheap_lm: dspy.LM) -> None:
+        super().__init__()
+        self.program = program
+        self.cheap_lm = cheap_lm
+        self.engine = RuleEngine()
+        self.calls = 0
+        self.escalations = 0
+        self.issues: Counter[str] = Counter()
+        self.cheap_cost = 0.0
+        self.cheap_output_tokens = 0
+
+    def _check(self, text: str, pred: dspy.Prediction | None) -> bool:
+        """Count the call; True if pred needs the stronger model."""
+        issues = [Issue("error", "cheap model call failed")]
+        if pred is not None:
+            issues = validate(text, pred, self.engine)
+        with _stats_lock:
+            self.calls += 1
+            if issues:
+                self.escalations += 1
+                self.issues.update(issue.kind for issue in issues)
+        if issues:
+            logger.debug("Escalating: %s", issues)
+        return bool(issues)
+
+    def _track(self, cheap_lm: dspy.LM) -> None:
+        cost = sum(entry.get("cost") or 0 for entry in cheap_lm.history)
+        tokens = sum(
+            (entry.get("usage") or {}).get("completion_tokens", 0) or 0
+            for entry in cheap_lm.history
+        )
+        with _stats_lock:
+            self.cheap_cost += cost
+            self.cheap_output_tokens += tokens
+
+        lm = dspy.settings.lm
+        limit = dspy.settings.max_history_size
+        if lm is None or dspy.settings.disable_history or not limit:
+            return
+        lm.history.extend(cheap_lm.history)
+        del lm.history[:-limit]
+
+    def forward(self, text: str) -> dspy.Prediction:
+        cheap_lm = self.cheap_lm.copy()
+        pred = None
+        try:
+            with dspy.context(lm=cheap_lm):
+                pred = self.program(text=text)
+        except Exception as e:
+            logger.debug("Cheap model failed: %s", e)
+        self._track(cheap_lm)
+        if self._check(text, pred):
+            return self.program(text=text)
+        return pred
+
+    async def aforward(self, text: str) -> dspy.Prediction:
+        cheap_lm = self.cheap_lm.copy()
+        pred = None
+        try:
+            with dspy.context(lm=cheap_lm):
+                pred = await self.program.acall(text=text)
+        except Exception as e:
+            logger.debug("Cheap model failed: %s", e)
+        self._track(cheap_lm)
+        if self._check(text, pred):
+            return await self.program.acall(text=text)
+        return pred
+
+    @property
+    def escalation_rate(self) -> float:
+        return self.escalations / self.calls if self.calls else 0.0
@@ -0,0 +1,178 @@
+import asyncio
+import contextvars
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import dspy
+
+from redactor import (
+    PIIEntitySpan,
+    align_placeholders,
+    apply_entities,
+    as_entity_span,
+)
+
+logger = logging.getLogger(__name__)
+
+# Paragraph breaks, line breaks and sentence ends; a unit ends after the match.
+_BOUNDARY_RE = re.compile(r"\n\s*\n|\n|(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting."""
+    return max(1, len(text) // 4)
+
+
+@dataclass(frozen=True)
+class Chunk:
+    start: int
+    end: int
+    text: str
+
+
+def _units(text: str, max_tokens: int) -> list[tuple[int, int]]:
+    """Split text into sentence/paragraph units as (start, end) offsets.
+
+    Units longer than max_tokens are hard-split at whitespace (or at the
+    character budget when there is none).
+    """
+    bounds: list[tuple[int, int]] = []
+    pos = 0
+    for m in _BOUNDARY_RE.finditer(text):
+        if m.end() > pos:
+            bounds.append((pos, m.end()))
+            pos = m.end()
+    if pos < len(text):
+        bounds.append((pos, len(text)))
+
+    max_chars = max_tokens * 4
+    units: list[tuple[int, int]] = []
+    for start, end in bounds:
+        while end - start > max_chars:
+            cut = text.rfind(" ", start + 1, start + max_chars)
+            cut = cut + 1 if cut > start else start + max_chars
+            units.append((start, cut))
+            start = cut
+        units.append((start, end))
+    return units
+
+
+def split_into_chunks(
+    text: str, max_tokens: int = 1500, overlap_tokens: int = 100
+) -> list[Chunk]:
+    """Pack sentence/paragraph units into chunks of at most max_tokens.
+
+    Consecutive chunks share up to overlap_tokens of trailing units, so an
+    entity near a boundary appears whole in at least one chunk.
+    """
+    units = _units(text, max_tokens)
+    max_chars = max_tokens * 4
+    overlap_chars = overlap_tokens * 4
+    chunks: list[Chunk] = []
+    i = 0
+    while i < len(units):
+        j = i + 1
+        while j < len(units) and units[j][1] - units[i][0] <= max_chars:
+            j += 1
+        start, end = units[i][0], units[j - 1][1]
+        chunks.append(Chunk(start=start, end=end, text=text[start:end]))
+        if j == len(units):
+            break
+        # Step back over trailing units that fit in the overlap budget
+        k = j
+        while k - 1 > i and end - units[k - 1][0] <= overlap_chars:
+            k -= 1
+        i = k
+    return chunks
+
+
+def merge_chunk_entities(
+    chunks: list[Chunk], predictions: list[dspy.Prediction]
+) -> list[PIIEntitySpan]:
+    """Collect chunk entities with document offsets, deduplicated.
+
+    Besides each chunk's listed entities, the spans its redacted_text
+    placeholders cover (recovered with align_placeholders) are included, so
+    a value the model replaced but did not list is still redacted.  Offsets
+    are shifted from chunk to document coordinates, so an entity reported
+    by two overlapping chunks is kept once.
+    """
+    seen: set[tuple[str, int | None]] = set()
+    merged: list[PIIEntitySpan] = []
+    for chunk, pred in zip(chunks, predictions, strict=True):
+        spans = [as_entity_span(entity) for entity in pred.entities or []]
+        aligned = align_placeholders(chunk.text, pred.get("redacted_text") or "")
+        for start, end, label in aligned or []:
+            spans.append(
+                PIIEntitySpan(value=chunk.text[start:end], label=label, start=start)
+            )
+        for span in spans:
+            if span.start is not None:
+                span.start += chunk.start
+            key = (span.value, span.start)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(span)
+    return merged
+
+
+class ChunkedRedactor(dspy.Module):
+    """Redact long documents chunk by chunk, in parallel.
+
+    Texts within max_tokens go straight to the wrapped program.  Longer texts
+    are split by split_into_chunks(), the chunks are redacted concurrently,
+    and the document is stitched back together by applying the merged entity
+    list (listed entities plus the spans each chunk's placeholders cover) to
+    the original text, so overlap regions are never redacted twice
+    and an entity found in any chunk is redacted everywhere.
+    """
+
+    def __init__(
+        self,
+        program: dspy.Module,
+        max_tokens: int = 1500,
+        overlap_tokens: int = 100,
+        num_threads: int = 8,
+    ) -> None:
+        super().__init__()
+        self.program = program
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.num_threads = num_threads
+
+    def _stitch(
+        self, text: str, chunks: list[Chunk], predictions: list[dspy.Prediction]
+    ) -> dspy.Prediction:
+        entities = merge_chunk_entities(chunks, predictions)
+        return dspy.Prediction(
+            entities=entities, redacted_text=apply_entities(text, entities)
+        )
+
+    def forward(self, text: str) -> dspy.Prediction:
+        if estimate_tokens(text) <= self.max_tokens:
+            return self.program(text=text)
+        chunks = split_into_chunks(text, self.max_tokens, self.overlap_tokens)
+        logger.debug(
+            "Redacting %d chunks of a %d-char document", len(chunks), len(text)
+        )
+        with ThreadPoolExecutor(max_workers=self.num_threads) as pool:
+            # Each task runs in a copy of the caller's context so dspy.context()
+            # settings (e.g. the session LM) reach the worker threads.
+            futures = [
+                pool.submit(contextvars.copy_context().run, self.program, text=c.text)
+                for c in chunks
+            ]
+            predictions = [f.result() for f in futures]
+        return self._stitch(text, chunks, predictions)
+
+    async def aforward(self, text: str) -> dspy.Prediction:
+        if estimate_tokens(text) <= self.max_tokens:
+            return await self.program.acall(text=text)
+        chunks = split_into_chunks(text, self.max_tokens, self.overlap_tokens)
+        predictions = await asyncio.gather(
+            *(self.program.acall(text=c.text) for c in chunks)
+        )
+        return self._stitch(text, chunks, list(predictions))
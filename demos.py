@@ -0,0 +1,151 @@
+import hashlib
+import json
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any
+
+import dspy
+
+from chunking import estimate_tokens
+from rules import LABEL_CUES, RuleEngine
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"[a-z0-9'-]+|[^\sa-z0-9]")
+
+
+def _hashed_ngrams(text: str, n: int, dims: int) -> Counter:
+    """Count hashed character n-grams (lower-cased, whitespace collapsed)."""
+    text = " ".join(text.lower().split())
+    counts: Counter = Counter()
+    for i in range(max(1, len(text) - n + 1)):
+        gram = text[i : i + n].encode("utf-8")
+        counts[
+            int.from_bytes(hashlib.blake2b(gram, digest_size=8).digest()) % dims
+        ] += 1
+    return counts
+
+
+def _demo_labels(demo: Any) -> set[str]:
+    return {
+        e["label"] if isinstance(e, dict) else e.label
+        for e in demo.get("entities") or []
+    }
+
+
+def _demo_tokens(demo: Any) -> int:
+    fields = {k: demo.get(k) for k in ("text", "entities", "redacted_text")}
+    return estimate_tokens(json.dumps(fields, default=str))
+
+
+def cue_labels(text: str) -> set[str]:
+    """Labels hinted at by the query: regex rule hits plus keyword cues."""
+    labels = {label for _, _, label in RuleEngine().find(text)}
+    words = set(_WORD_RE.findall(text.lower()))
+    lowered = text.lower()
+    for label, cues in LABEL_CUES.items():
+        if any((cue in words) if " " not in cue else (cue in lowered) for cue in cues):
+            labels.add(label)
+    return labels
+
+
+class DemoSelector:
+    """Pick the few-shot demos most relevant to each input.
+
+    Demos are indexed once as TF-IDF vectors over hashed character n-grams
+    (CPU only, no model).  select() returns the k demos with the highest
+    cosine similarity, plus up to max_fillers demos that cover labels hinted
+    at by the query (see cue_labels) but missing from the top-k.
+
+    tokens_saved compares the demo tokens each call sends with baseline, the
+    demos the predictor would send without selection (the whole pool if not
+    given).  It goes negative when selection adds demos to a predictor that
+    sends none, e.g. a base program.
+    """
+
+    def __init__(
+        self,
+        demos: list[Any],
+        k: int = 4,
+        max_fillers: int = 2,
+        ngram: int = 3,
+        dims: int = 1 << 18,
+        baseline: list[Any] | None = None,
+    ) -> None:
+        self.demos = list(demos)
+        self.k = k
+        self.max_fillers = max_fillers
+        self.ngram = ngram
+        self.dims = dims
+        counts = [_hashed_ngrams(d.get("text", ""), ngram, dims) for d in self.demos]
+        df: Counter = Counter()
+        for c in counts:
+            df.update(c.keys())
+        n = len(self.demos)
+        self._idf = {g: math.log((1 + n) / (1 + f)) + 1 for g, f in df.items()}
+        self._vectors = [self._weigh(c) for c in counts]
+        self._labels = [_demo_labels(d) for d in self.demos]
+        self._tokens = [_demo_tokens(d) for d in self.demos]
+        self.total_demo_tokens = sum(self._tokens)
+        self.baseline_tokens = (
+            self.total_demo_tokens
+            if baseline is None
+            else sum(_demo_tokens(d) for d in baseline)
+        )
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.tokens_sent = 0
+        self.tokens_saved = 0
+
+    def __deepcopy__(self, memo: dict) -> "DemoSelector":
+        # The index is immutable after construction; copies can share it.
+        return self
+
+    def _weigh(self, counts: Counter) -> dict[int, float]:
+        vec = {g: c * self._idf.get(g, 0.0) for g, c in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {g: v / norm for g, v in vec.items() if v}
+
+    def select(self, text: str) -> list[Any]:
+        query = self._weigh(_hashed_ngrams(text, self.ngram, self.dims))
+        scores = [
+            sum(w * vec.get(g, 0.0) for g, w in query.items()) for vec in self._vectors
+        ]
+        ranked = sorted(range(len(self.demos)), key=lambda i: scores[i], reverse=True)
+        chosen = ranked[: self.k]
+
+        covered = set().union(*(self._labels[i] for i in chosen)) if chosen else set()
+        missing = cue_labels(text) - covered
+        for i in ranked[self.k :]:
+            if len(chosen) >= self.k + self.max_fillers or not missing:
+                break
+            if self._labels[i] & missing:
+                chosen.append(i)
+                missing -= self._labels[i]
+
+        sent = sum(self._tokens[i] for i in chosen)
+        saved = self.baseline_tokens - sent
+        with self._lock:
+            self.calls += 1
+            self.tokens_sent += sent
+            self.tokens_saved += saved
+        logger.debug(
+            "Selected %d/%d demos, ~%d demo tokens sent (%+d vs baseline)",
+            len(chosen),
+            len(self.demos),
+            sent,
+            -saved,
+        )
+        return [self.demos[i] for i in sorted(chosen)]
+
+    @property
+    def tokens_saved_per_call(self) -> float:
+        return self.tokens_saved / self.calls if self.calls else 0.0
+
+
+def as_demo_list(demos: list[Any]) -> list[dspy.Example]:
+    """Demos loaded from a saved program are dicts; normalise to Examples."""
+    return [d if isinstance(d, dspy.Example) else dspy.Example(**d) for d in demos]
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import logging
+import threading
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+import dspy
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_DIR = "./logs/eval_journal"
+
+
+def selection_key(examples: Sequence[dspy.Example], **settings: Any) -> str:
+    """Identify an eval run: the selected examples plus model/program settings.
+
+    A dataset-backed ExampleSequence is identified by its dataset fingerprint
+    and row ids, so no example is built; other sequences by their texts.
+    """
+    h = hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode())
+    fingerprint = getattr(examples, "fingerprint", None)
+    if fingerprint is not None:
+        h.update(fingerprint.encode())
+        h.update(json.dumps(examples.row_ids).encode())
+        return h.hexdigest()[:16]
+    for example in examples:
+        h.update(example.text.encode("utf-8"))
+        h.update(b"\0")
+        h.update(example.redacted_text.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+class EvalJournal:
+    """Append-only JSONL journal of per-example evaluation results.
+
+    One line per scored example: index, prediction, score, cost, latency and
+    output tokens.  Lines are flushed as they are written, so an interrupted
+    run keeps everything scored so far; reopening the same path loads those
+    rows so a rerun only evaluates what is missing.  A torn last line (from
+    a kill mid-write) is ignored.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.rows: dict[int, dict[str, Any]] = {}
+        if self.path.exists():
+            for line in self.path.read_text().splitlines():
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.rows[row["index"]] = row
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("a")
+        self._lock = threading.Lock()
+
+    def __contains__(self, index: int) -> bool:
+        return index in self.rows
+
+    def record(self, index: int, **fields: Any) -> None:
+        row = {"index": index, **fields}
+        with self._lock:
+            self.rows[index] = row
+            self._file.write(json.dumps(row) + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def journal_path(key: str, directory: str = JOURNAL_DIR) -> Path:
+    return Path(directory) / f"{key}.jsonl"
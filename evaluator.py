@@ -1,13 +1,25 @@
 import logging
 import os
 import random
+import time
+from collections.abc import Callable, Iterable, Sequence
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from typing import Any
 
 import dspy
+import numpy as np
 from datasets import Dataset
+from dspy.evaluate.evaluate import EvaluationResult
 
+from eval_journal import JOURNAL_DIR, EvalJournal, journal_path, selection_key
+from example_store import ExampleSequence
+from label_index import LABEL_INDEX_PATH, load_label_index
 from optimizer import _sum_lm_cost, download_dataset, load_optimized_model, pii_metric
-from redactor import PIIRedactor
+from prediction_store import STORE_PATH, PredictionStore
+from ratelimit import ScheduledLM, scheduler_for
+from redactor import PIIRedactor, prediction_dict, program_hash
+from scoring import score_batch, score_interval
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +29,10 @@ def prepare_eval_examples(
     eval_size: int | None = None,
     offset: int | None = None,
     randomize: bool = False,
-) -> list[dspy.Example]:
+    stratify: bool = False,
+    min_per_label: int | None = None,
+    label_index_path: str = LABEL_INDEX_PATH,
+) -> ExampleSequence:
     """Pick a held-out evaluation set from the HF dataset.
 
     Selects eval_size samples starting at offset (after the optimization
@@ -28,76 +43,242 @@ def prepare_eval_examples(
     When randomize=True, randomly samples eval_size indices from the pool of
     indices after the optimization window instead of picking sequentially.
     Uses EVALUATE_SEED env var for reproducibility if set.
+
+    When stratify=True, samples from the same pool with a LabelIndex (cached
+    at label_index_path) so every PII label appears in at least
+    min_per_label examples (env EVALUATE_MIN_PER_LABEL, default 10), then
+    fills up to eval_size uniformly.  Rare labels get stable numbers from a
+    much smaller set; the per-label example counts are logged.
+
+    Examples are built lazily from the memory-mapped dataset as they are
+    accessed, so evaluation starts without materialising the whole window;
+    evaluate() keys the run by row ids and builds each example only when it
+    is submitted.
     """
     eval_size = eval_size or int(os.environ.get("EVALUATE_SIZE", "500"))
     exclude_count = int(os.environ.get("OPTIMIZE_TRAIN_SIZE", "450")) + int(
         os.environ.get("OPTIMIZE_VAL_SIZE", "50")
     )
 
-    if randomize:
+    if stratify:
+        min_per_label = min_per_label or int(
+            os.environ.get("EVALUATE_MIN_PER_LABEL", "10")
+        )
+        pool = range(exclude_count, len(dataset))
+        seed = os.environ.get("EVALUATE_SEED")
+        rng = np.random.default_rng(int(seed) if seed is not None else None)
+        index = load_label_index(dataset, label_index_path)
+        row_ids = index.stratified_sample(pool, eval_size, min_per_label, rng).tolist()
+        subset = dataset.select(row_ids)
+        logger.info(
+            "Prepared %d eval examples (stratified from pool of %d, >= %d per label)",
+            len(row_ids),
+            len(pool),
+            min_per_label,
+        )
+        logger.info(
+            "Examples per label: %s",
+            ", ".join(f"{k} {v}" for k, v in index.label_counts(row_ids).items()),
+        )
+    elif randomize:
         pool = range(exclude_count, len(dataset))
         sample_size = min(eval_size, len(pool))
         seed = os.environ.get("EVALUATE_SEED")
         rng = random.Random(int(seed)) if seed is not None else random.Random()
-        indices = sorted(rng.sample(pool, sample_size))
-        subset = dataset.select(indices)
+        row_ids = sorted(rng.sample(pool, sample_size))
+        subset = dataset.select(row_ids)
         logger.info(
             "Prepared %d eval examples (randomized from pool of %d)",
-            len(indices),
+            len(row_ids),
             len(pool),
         )
     else:
         if offset is None:
             offset = int(os.environ.get("EVALUATE_OFFSET", str(exclude_count)))
         end = min(offset + eval_size, len(dataset))
-        subset = dataset.select(range(offset, end))
+        row_ids = range(offset, end)
+        subset = dataset.select(row_ids)
         logger.info("Prepared %d eval examples (offset=%d)", len(subset), offset)
 
-    examples = [
-        dspy.Example(
-            text=row["source_text"],
-            redacted_text=row["target_text"],
-        ).with_inputs("text")
-        for row in subset
-    ]
-    return examples
+    # row_id (the dataset index) keys stored predictions across runs
+    return ExampleSequence(subset, row_ids)
 
 
-def evaluate(api_key: str, model: str, randomize: bool = False) -> float:
-    """Evaluate the PII redactor on a held-out test set using dspy.Evaluate.
+def evaluate(
+    api_key: str,
+    model: str,
+    randomize: bool = False,
+    entities_only: bool = False,
+    pack_tokens: int | None = None,
+    fresh: bool = False,
+    stratify: bool = False,
+    ci_width: float | None = None,
+    max_cost: float | None = None,
+    max_seconds: float | None = None,
+    wave_size: int = 50,
+    cascade_model: str | None = None,
+    repair: bool = False,
+    strategy: str = "cot",
+    journal_dir: str = JOURNAL_DIR,
+    store_path: str | None = STORE_PATH,
+) -> float:
+    """Evaluate the PII redactor on a held-out test set.
 
     Uses examples from the HF dataset that are disjoint from the optimization
     train/val split.  Loads the optimized model if available, otherwise falls
-    back to the base PIIRedactor.
+    back to the base PIIRedactor, for the given module strategy (see
+    redactor.STRATEGIES).  entities_only selects the entities-only output
+    mode so its score, latency and output tokens can be compared with the
+    default signature.  stratify=True draws a label-stratified sample
+    (see prepare_eval_examples).  With pack_tokens set, short examples are packed
+    into multi-document calls (see packing.PackedRedactor) and each split
+    prediction is scored with pii_metric as usual.
+
+    Each scored example is appended to a journal in journal_dir keyed by the
+    eval selection, model and program state (see eval_journal.py).  Rerunning
+    the same selection skips journaled examples and merges them into the
+    score; fresh=True discards the journal first.  Examples that raise are
+    scored 0 and retried on the next run.
+
+    Predictions are also kept in a PredictionStore at store_path keyed by
+    (program hash, model, dataset row id), so a run with a different
+    selection, or after changing only the model or program, reuses every
+    unchanged prediction; fresh=True bypasses the lookup.  store_path=None
+    disables the store.
+
+    With ci_width, max_cost or max_seconds set, evaluation is sequential:
+    pending examples run in waves of wave_size, the 95% confidence interval
+    of the score is logged after each wave, and the run stops once the
+    interval is at most ci_width points wide (after at least
+    MIN_SEQUENTIAL_EXAMPLES), this run's LM cost reaches max_cost dollars or
+    max_seconds have passed.  The score then covers only the examples
+    scored, so use a random or stratified selection.
+
+    With cascade_model set, each example is first redacted by that cheaper
+    model and escalated to model only when local validation fails (see
+    cascade.CascadeRedactor); the escalation rate and the cost per 1k texts
+    of both models together are logged with the score.
+
+    With repair=True, predictions are checked and repaired locally before
+    scoring (see validation.ValidatedRedactor); the repaired and still
+    flagged counts are logged.
 
     Returns the overall score (0-100).
     """
-    lm = dspy.LM(model, api_key=api_key)
+    scheduler = scheduler_for(model)
+    lm = ScheduledLM(model, api_key=api_key, scheduler=scheduler)
     dspy.configure(lm=lm)
 
     dataset = download_dataset()
-    eval_set = prepare_eval_examples(dataset, randomize=randomize)
+    eval_set = prepare_eval_examples(dataset, randomize=randomize, stratify=stratify)
+    redactor = _load_program(entities_only, strategy)
+    program_key = _program_key(redactor, pack_tokens, cascade_model, repair)
+    if repair:
+        from validation import ValidatedRedactor
 
-    redactor = load_optimized_model()
-    if redactor is None:
-        logger.info("No optimized model found, evaluating base PIIRedactor")
-        redactor = PIIRedactor()
-    else:
-        logger.info("Evaluating optimized model")
-
-    evaluator = dspy.Evaluate(
-        devset=eval_set,
-        metric=lambda gold, pred, **kw: pii_metric(gold, pred, **kw).score,
-        num_threads=20,
-        display_progress=True,
-        display_table=0,
-    )
-    result = evaluator(redactor)
-    score = result.score if hasattr(result, "score") else float(result)
+        redactor = validated = ValidatedRedactor(redactor)
+    if cascade_model:
+        from cascade import CascadeRedactor
+
+        redactor = CascadeRedactor(
+            redactor, ScheduledLM(cascade_model, api_key=api_key)
+        )
+
+    key = selection_key(eval_set, model=model, program=program_key)
+    path = journal_path(key, journal_dir)
+    if fresh:
+        path.unlink(missing_ok=True)
+    journal = EvalJournal(path)
+    # indices only; each example is built when it is submitted
+    pending = [i for i in range(len(eval_set)) if i not in journal]
+    if len(pending) < len(eval_set):
+        logger.info(
+            "Resuming from %s: %d/%d examples already scored",
+            path,
+            len(eval_set) - len(pending),
+            len(eval_set),
+        )
+
+    store = PredictionStore(store_path) if store_path else None
+
+    def record(i: int, example: dspy.Example, pred: dict, **stats: Any) -> None:
+        score = pii_metric(example, dspy.Prediction(**pred)).score
+        journal.record(i, prediction=pred, score=score, **stats)
+        row_id = example.get("row_id")
+        if store is not None and row_id is not None and not stats.get("reused"):
+            store.put(program_key, model, row_id, pred, **stats)
+
+    # the scheduler paces the calls; threads only bound its ceiling
+    num_threads = scheduler.max_concurrency
+
+    def run(wave: list[int]) -> None:
+        examples = ((i, eval_set[i]) for i in wave)
+        if pack_tokens:
+            _evaluate_packed(redactor, examples, pack_tokens, record, num_threads)
+        else:
+            _evaluate_journaled(redactor, examples, lm, record, num_threads)
+
+    sequential = bool(ci_width or max_cost or max_seconds)
+    start = time.perf_counter()
+    try:
+        if store is not None and not fresh:
+            pending = _reuse_stored(
+                store, program_key, model, eval_set, pending, record
+            )
+        if sequential:
+            _evaluate_sequential(
+                run, pending, journal, lm, ci_width, max_cost, max_seconds, wave_size
+            )
+        else:
+            run(pending)
+    finally:
+        journal.close()
+        if store is not None:
+            store.close()
+    elapsed = time.perf_counter() - start
+
+    result = _journal_result(eval_set, journal, only_scored=sequential)
+    score = result.score
     cost = _sum_lm_cost(lm)
 
-    logger.info("Evaluation score: %.2f", score)
-    logger.info("Evaluation cost: $%.4f", cost)
+    if sequential:
+        interval = score_interval([row["score"] for row in journal.rows.values()])
+        logger.info("Evaluation score: %s", interval)
+    else:
+        logger.info("Evaluation score: %.2f", score)
+    logger.info(
+        "Evaluation cost: $%.4f this run, $%.4f including resumed examples",
+        cost,
+        sum(row.get("cost") or 0 for row in journal.rows.values()),
+    )
+    logger.info(
+        "Evaluation time: %.1fs, output tokens: %d",
+        elapsed,
+        _sum_output_tokens(lm),
+    )
+    logger.info("LM scheduler: %s", scheduler.stats())
+    if repair:
+        logger.info(
+            "Validation: %d/%d predictions repaired locally, %d still flagged",
+            validated.repaired,
+            validated.calls,
+            validated.flagged,
+        )
+    if cascade_model and redactor.calls:
+        logger.info(
+            "Cascade %s -> %s: %.1f%% escalated (%d/%d), $%.4f per 1k texts "
+            "($%.4f and %d output tokens on %s), issues: %s",
+            cascade_model,
+            model,
+            100 * redactor.escalation_rate,
+            redactor.escalations,
+            redactor.calls,
+            1000 * cost / redactor.calls,
+            redactor.cheap_cost,
+            redactor.cheap_output_tokens,
+            cascade_model,
+            dict(redactor.issues),
+        )
 
     if os.environ.get("GENERATE_LOGS", "").lower() in ("1", "true", "yes"):
         _write_eval_log(result, score, cost, lm)
@@ -105,6 +286,315 @@ def evaluate(api_key: str, model: str, randomize: bool = False) -> float:
     return score
 
 
+def _run_example(
+    redactor: dspy.Module, example: dspy.Example, lm: dspy.LM
+) -> tuple[dspy.Prediction, float, dspy.LM]:
+    """Predict and score one example on its own LM copy, so the copy's
+    history holds exactly this example's calls (cost, tokens)."""
+    example_lm = lm.copy()
+    start = time.perf_counter()
+    with dspy.context(lm=example_lm):
+        pred = redactor(**example.inputs())
+    latency = time.perf_counter() - start
+    return pred, latency, example_lm
+
+
+def rescore(
+    model: str,
+    randomize: bool = False,
+    entities_only: bool = False,
+    pack_tokens: int | None = None,
+    store_path: str = STORE_PATH,
+    stratify: bool = False,
+    cascade_model: str | None = None,
+    repair: bool = False,
+    strategy: str = "cot",
+) -> float:
+    """Re-score stored predictions with the current metric, without LM calls.
+
+    Uses the same eval selection and program as evaluate() with the same
+    arguments, scores every stored prediction at once with the vectorized
+    scoring.score_batch (same score as pii_metric) and logs a per-label
+    recall/precision and confusion table.  Examples with no stored
+    prediction are left out of the score (and reported), so run evaluate()
+    first to fill the store.
+
+    Returns the score (0-100) over the stored examples.
+    """
+    eval_set = prepare_eval_examples(
+        download_dataset(), randomize=randomize, stratify=stratify
+    )
+    program_key = _program_key(
+        _load_program(entities_only, strategy), pack_tokens, cascade_model, repair
+    )
+    store = PredictionStore(store_path)
+    try:
+        stored = store.get_many(
+            program_key, model, (ex.get("row_id") for ex in eval_set)
+        )
+    finally:
+        store.close()
+
+    scored = [ex for ex in eval_set if ex.get("row_id") in stored]
+    if len(scored) < len(eval_set):
+        logger.warning(
+            "%d of %d examples have no stored prediction for this program and "
+            "model; run --evaluate to fill them in",
+            len(eval_set) - len(scored),
+            len(eval_set),
+        )
+    batch = score_batch(
+        [ex.redacted_text.strip() for ex in scored],
+        [stored[ex.get("row_id")]["redacted_text"].strip() for ex in scored],
+    )
+    score = round(100 * batch.score, 2)
+    logger.info("Rescored %d stored predictions: %.2f", len(scored), score)
+    logger.info("Per-label results:\n%s", batch.format_label_table())
+    return score
+
+
+def _load_program(entities_only: bool, strategy: str = "cot") -> dspy.Module:
+    redactor = load_optimized_model(entities_only=entities_only, strategy=strategy)
+    if redactor is None:
+        logger.info(
+            "No optimized %s model found, evaluating base PIIRedactor", strategy
+        )
+        return PIIRedactor(entities_only=entities_only, strategy=strategy)
+    logger.info("Evaluating optimized %s model", strategy)
+    return redactor
+
+
+def _program_key(
+    redactor: dspy.Module,
+    pack_tokens: int | None,
+    cascade_model: str | None = None,
+    repair: bool = False,
+) -> str:
+    """Program hash, plus the packing budget, cascade model and repair stage
+    since they change the outputs."""
+    key = program_hash(redactor)
+    if pack_tokens:
+        key += f"+pack{pack_tokens}"
+    if repair:
+        key += "+repair"
+    if cascade_model:
+        key += f"+cascade:{cascade_model}"
+    return key
+
+
+def _row_id(eval_set: Sequence[dspy.Example], i: int) -> int | None:
+    """Row id of eval_set[i], without building the example when possible."""
+    if isinstance(eval_set, ExampleSequence):
+        return eval_set.row_id(i)
+    return eval_set[i].get("row_id")
+
+
+def _reuse_stored(
+    store: PredictionStore,
+    program_key: str,
+    model: str,
+    eval_set: Sequence[dspy.Example],
+    pending: list[int],
+    record: Callable[..., None],
+) -> list[int]:
+    """Record stored predictions for pending indices; return those still missing.
+
+    Only examples with a stored prediction are built (to be scored).
+    """
+    row_ids = {i: _row_id(eval_set, i) for i in pending}
+    stored = store.get_many(program_key, model, row_ids.values())
+    missing = []
+    for i in pending:
+        pred = stored.get(row_ids[i])
+        if pred is None:
+            missing.append(i)
+        else:
+            record(i, eval_set[i], pred, reused=True)
+    if stored:
+        logger.info(
+            "Reused %d stored predictions; %d need the LM", len(stored), len(missing)
+        )
+    return missing
+
+
+def _evaluate_journaled(
+    redactor: dspy.Module,
+    pending: Iterable[tuple[int, dspy.Example]],
+    lm: dspy.LM,
+    record: Callable[..., None],
+    num_threads: int = 20,
+) -> None:
+    """Evaluate pending examples concurrently, recording each as it completes.
+
+    pending is consumed as the examples are submitted, so a lazy iterable
+    starts the first call before the rest are built.
+    """
+    pool = ThreadPoolExecutor(max_workers=num_threads)
+    futures = {
+        pool.submit(_run_example, redactor, example, lm): (i, example)
+        for i, example in pending
+    }
+    done = failed = 0
+    step = max(1, len(futures) // 10)
+    try:
+        for future in as_completed(futures):
+            i, example = futures[future]
+            done += 1
+            try:
+                pred, latency, example_lm = future.result()
+            except Exception as e:
+                failed += 1
+                logger.warning("Example %d failed: %s", i, e)
+                continue
+            lm.history.extend(example_lm.history)
+            record(
+                i,
+                example,
+                prediction_dict(pred),
+                cost=_sum_lm_cost(example_lm),
+                latency=round(latency, 3),
+                output_tokens=_sum_output_tokens(example_lm),
+            )
+            if done % step == 0:
+                logger.info("Scored %d/%d (%d failed)", done, len(futures), failed)
+    except KeyboardInterrupt:
+        pool.shutdown(wait=False, cancel_futures=True)
+        logger.warning("Interrupted; results so far are journaled")
+        raise
+    pool.shutdown()
+
+
+MIN_SEQUENTIAL_EXAMPLES = 30
+
+
+def _evaluate_sequential(
+    run: Callable[[list[int]], None],
+    pending: list[int],
+    journal: EvalJournal,
+    lm: dspy.LM,
+    ci_width: float | None,
+    max_cost: float | None,
+    max_seconds: float | None,
+    wave_size: int,
+) -> None:
+    """Run pending examples in waves until the score interval or a budget stops it.
+
+    Journaled (resumed or reused) scores count towards the interval.
+    """
+    start = time.perf_counter()
+    while True:
+        interval = score_interval([row["score"] for row in journal.rows.values()])
+        cost = _sum_lm_cost(lm)
+        elapsed = time.perf_counter() - start
+        if (
+            ci_width
+            and interval.n >= MIN_SEQUENTIAL_EXAMPLES
+            and interval.width <= ci_width
+        ):
+            reason = f"interval width {interval.width:.2f} <= {ci_width}"
+        elif max_cost and cost >= max_cost:
+            reason = f"cost ${cost:.4f} reached the ${max_cost} budget"
+        elif max_seconds and elapsed >= max_seconds:
+            reason = f"{elapsed:.0f}s reached the {max_seconds}s budget"
+        elif not pending:
+            reason = "every example scored"
+        else:
+            wave, pending = pending[:wave_size], pending[wave_size:]
+            run(wave)
+            logger.info(
+                "Wave of %d done: %s, %d left",
+                len(wave),
+                score_interval([row["score"] for row in journal.rows.values()]),
+                len(pending),
+            )
+            continue
+        logger.info(
+            "Stopped sequential evaluation after %.0fs, $%.4f: %s",
+            elapsed,
+            cost,
+            reason,
+        )
+        return
+
+
+def _evaluate_packed(
+    redactor: dspy.Module,
+    pending: Iterable[tuple[int, dspy.Example]],
+    pack_tokens: int,
+    record: Callable[..., None],
+    num_threads: int = 20,
+) -> None:
+    """Evaluate pending examples with a PackedRedactor, recording each
+    example as soon as its pack completes.
+
+    Cost and latency are per pack, not per example, so they are not recorded.
+    Examples whose call failed are logged and left unrecorded, as in
+    _evaluate_journaled, so the next run retries them.  Packing needs every
+    text's length up front, so the pending examples are all built first.
+    """
+    from packing import PackedRedactor
+
+    pending = list(pending)
+
+    packer = PackedRedactor(redactor, max_tokens=pack_tokens, num_threads=num_threads)
+    results = packer.redact_as_completed([example.text for _, example in pending])
+    done = failed = 0
+    step = max(1, len(pending) // 10)
+    try:
+        for j, pred in results:
+            i, example = pending[j]
+            done += 1
+            if isinstance(pred, Exception):
+                failed += 1
+                logger.warning("Example %d failed: %s", i, pred)
+                continue
+            record(i, example, prediction_dict(pred))
+            if done % step == 0:
+                logger.info("Scored %d/%d (%d failed)", done, len(pending), failed)
+    except KeyboardInterrupt:
+        results.close()
+        logger.warning("Interrupted; results so far are journaled")
+        raise
+    logger.info(
+        "Packed evaluation: %d examples, %d multi-document calls, %d fallbacks, "
+        "%d failed",
+        len(pending),
+        packer.packs,
+        packer.fallbacks,
+        failed,
+    )
+
+
+def _journal_result(
+    eval_set: list[dspy.Example], journal: EvalJournal, only_scored: bool = False
+) -> EvaluationResult:
+    """Merge journaled rows into a 0-100 score.
+
+    Missing examples count as 0, or are left out with only_scored=True.
+    """
+    results = [
+        (
+            example,
+            dspy.Prediction(**journal.rows[i]["prediction"]),
+            journal.rows[i]["score"],
+        )
+        for i, example in enumerate(eval_set)
+        if i in journal
+    ]
+    total = sum(score for *_, score in results)
+    count = len(results) if only_scored else len(eval_set)
+    score = 100 * total / count if count else 0.0
+    return EvaluationResult(score=round(score, 2), results=results)
+
+
+def _sum_output_tokens(lm: dspy.LM) -> int:
+    """Sum completion tokens from an LM's history entries."""
+    return sum(
+        (entry.get("usage") or {}).get("completion_tokens", 0) or 0
+        for entry in lm.history
+    )
+
+
 def _extract_prompt(lm: dspy.LM) -> str:
     """Extract the prompt template from the first LM history entry."""
     if not lm.history:
@@ -0,0 +1,74 @@
+from collections.abc import Iterator, Sequence
+from typing import Any, overload
+
+import dspy
+from datasets import Dataset
+
+EXAMPLE_COLUMNS = ["source_text", "target_text", "id"]
+
+
+class ExampleSequence(Sequence):
+    """Read-only sequence of dspy.Examples built on demand from dataset rows.
+
+    rows is usually an Arrow-backed Dataset from load_from_disk (memory
+    mapped, so nothing is read until accessed), pruned to EXAMPLE_COLUMNS;
+    any sequence of row dicts works too.  Item i is built from rows[i] when
+    it is accessed and carries row_id=row_ids[i], the index in the full
+    dataset.  Slicing returns another lazy view over the same rows.
+    row_ids and fingerprint identify the selection without reading a row.
+    """
+
+    def __init__(
+        self,
+        rows: Dataset | Sequence[dict[str, Any]],
+        row_ids: Sequence[int],
+        _positions: Sequence[int] | None = None,
+    ) -> None:
+        if isinstance(rows, Dataset):
+            keep = [c for c in EXAMPLE_COLUMNS if c in rows.column_names]
+            if keep != rows.column_names:
+                rows = rows.select_columns(keep)
+        self._rows = rows
+        self._row_ids = row_ids
+        self._positions = range(len(row_ids)) if _positions is None else _positions
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    @property
+    def row_ids(self) -> list[int]:
+        return [self._row_ids[position] for position in self._positions]
+
+    @property
+    def fingerprint(self) -> str | None:
+        """The Arrow dataset's fingerprint (None for plain row sequences)."""
+        return getattr(self._rows, "_fingerprint", None)
+
+    def row_id(self, i: int) -> int:
+        return self._row_ids[self._positions[i]]
+
+    @overload
+    def __getitem__(self, i: int) -> dspy.Example: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> "ExampleSequence": ...
+
+    def __getitem__(self, i: int | slice) -> "dspy.Example | ExampleSequence":
+        if isinstance(i, slice):
+            return ExampleSequence(self._rows, self._row_ids, self._positions[i])
+        position = self._positions[i]
+        return _example(self._rows[position], self._row_ids[position])
+
+    def __iter__(self) -> Iterator[dspy.Example]:
+        for position in self._positions:
+            yield _example(self._rows[position], self._row_ids[position])
+
+    def __repr__(self) -> str:
+        return f"ExampleSequence(len={len(self)})"
+
+
+def _example(row: dict[str, Any], row_id: int) -> dspy.Example:
+    fields = {"text": row["source_text"], "redacted_text": row["target_text"]}
+    if "id" in row:
+        fields["id"] = row["id"]
+    return dspy.Example(**fields, row_id=row_id).with_inputs("text")
@@ -0,0 +1,205 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+import dspy
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class HedgeStats:
+    requests: int
+    hedges: int
+    hedge_wins: int
+    hedge_rate: float
+    p50: float | None
+    p99: float | None
+    saved_seconds: float
+
+
+class Hedger:
+    """Latency tracking and hedge budget shared by every copy of a HedgedRedactor.
+
+    The hedge delay is the given percentile of the last window call
+    latencies (no hedging until min_samples have been seen).  A hedge is
+    only fired while hedges / requests stays within max_rate, so at most
+    that share of extra LM calls is paid for.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        max_rate: float = 0.05,
+        window: int = 200,
+        min_samples: int = 20,
+        max_workers: int = 32,
+    ) -> None:
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._returned: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.saved_seconds = 0.0
+
+    def __deepcopy__(self, memo: dict) -> "Hedger":
+        # Shared by design: copies of the program hedge against one history.
+        return self
+
+    def delay(self) -> float | None:
+        """Seconds to wait before hedging, or None while there is no history."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            return float(np.percentile(self._latencies, self.percentile))
+
+    def _start(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def _allow_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.max_rate * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def _observe(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+
+    def _returned_after(self, latency: float, hedge_won: bool) -> None:
+        with self._lock:
+            self._returned.append(latency)
+            self.hedge_wins += hedge_won
+
+    def _saved(self, seconds: float) -> None:
+        with self._lock:
+            self.saved_seconds += max(0.0, seconds)
+
+    def stats(self) -> HedgeStats:
+        """Hedge rate and returned-latency percentiles; saved_seconds adds up,
+        for every hedge that won, how much later the original call finished."""
+        with self._lock:
+            returned = list(self._returned)
+            return HedgeStats(
+                requests=self.requests,
+                hedges=self.hedges,
+                hedge_wins=self.hedge_wins,
+                hedge_rate=self.hedges / self.requests if self.requests else 0.0,
+                p50=float(np.percentile(returned, 50)) if returned else None,
+                p99=float(np.percentile(returned, 99)) if returned else None,
+                saved_seconds=round(self.saved_seconds, 3),
+            )
+
+
+class HedgedRedactor(dspy.Module):
+    """Fire a duplicate call when the first one is slower than usual.
+
+    If the wrapped program has not answered within the hedger's latency
+    percentile, the same text is sent again and whichever call finishes
+    first is returned; the other one is left to finish in the background
+    (its cost is still paid, which max_rate bounds).
+    """
+
+    def __init__(self, program: dspy.Module, hedger: Hedger | None = None) -> None:
+        super().__init__()
+        self.program = program
+        self.hedger = hedger or Hedger()
+
+    def _timed(self, text: str) -> tuple[dspy.Prediction, float]:
+        start = time.perf_counter()
+        pred = self.program(text=text)
+        latency = time.perf_counter() - start
+        self.hedger._observe(latency)
+        return pred, latency
+
+    def _submit(self, text: str) -> Future:
+        return self.hedger._pool.submit(
+            contextvars.copy_context().run, self._timed, text
+        )
+
+    def forward(self, text: str) -> dspy.Prediction:
+        hedger = self.hedger
+        hedger._start()
+        delay = hedger.delay()
+        if delay is None:
+            pred, latency = self._timed(text)
+            hedger._returned_after(latency, hedge_won=False)
+            return pred
+        start = time.perf_counter()
+        primary = self._submit(text)
+        if wait([primary], timeout=delay).done or not hedger._allow_hedge():
+            pred, _ = primary.result()
+            hedger._returned_after(time.perf_counter() - start, hedge_won=False)
+            return pred
+
+        logger.debug("Hedging a call still running after %.2fs", delay)
+        hedge = self._submit(text)
+        done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        winner = primary if primary in done else hedge
+        try:
+            pred, _ = winner.result()
+        except Exception:
+            # the other call may still succeed
+            winner = hedge if winner is primary else primary
+            pred, _ = winner.result()
+        returned = time.perf_counter() - start
+        hedger._returned_after(returned, hedge_won=winner is hedge)
+        if winner is hedge:
+            primary.add_done_callback(_record_saved(hedger, returned))
+        return pred
+
+    async def _atimed(self, text: str) -> tuple[dspy.Prediction, float]:
+        start = time.perf_counter()
+        pred = await self.program.acall(text=text)
+        latency = time.perf_counter() - start
+        self.hedger._observe(latency)
+        return pred, latency
+
+    async def aforward(self, text: str) -> dspy.Prediction:
+        hedger = self.hedger
+        hedger._start()
+        start = time.perf_counter()
+        primary = asyncio.ensure_future(self._atimed(text))
+        delay = hedger.delay()
+        if delay is not None:
+            await asyncio.wait([primary], timeout=delay)
+        if primary.done() or delay is None or not hedger._allow_hedge():
+            pred, _ = await primary
+            hedger._returned_after(time.perf_counter() - start, hedge_won=False)
+            return pred
+
+        hedge = asyncio.ensure_future(self._atimed(text))
+        done, _ = await asyncio.wait([primary, hedge], return_when=FIRST_COMPLETED)
+        winner = primary if primary in done else hedge
+        if winner.exception() is not None:
+            # the other call may still succeed
+            winner = hedge if winner is primary else primary
+        pred, _ = await winner
+        returned = time.perf_counter() - start
+        hedger._returned_after(returned, hedge_won=winner is hedge)
+        if winner is hedge:
+            primary.add_done_callback(_record_saved(hedger, returned))
+        return pred
+
+
+def _record_saved(hedger: Hedger, returned: float):
+    """Done-callback for a call a hedge beat: credit the time the hedge saved."""
+
+    def callback(future: Future | asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            hedger._saved(future.result()[1] - returned)
+
+    return callback
@@ -0,0 +1,235 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+import dspy
+
+from redactor import PIIEntity, as_entity_span
+
+logger = logging.getLogger(__name__)
+
+
+def _is_word(c: str) -> bool:
+    return c.isalnum() or c == "_"
+
+
+class EntityMatcher:
+    """Aho-Corasick automaton over known entity values.
+
+    Finds every known value in a single pass over the text, then keeps the
+    leftmost-longest non-overlapping matches that do not cut into words.
+    """
+
+    def __init__(self, values: dict[str, str]) -> None:
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[str]] = [[]]
+        self._labels = dict(values)
+        for value in values:
+            self._insert(value)
+        self._build()
+
+    def _insert(self, value: str) -> None:
+        node = 0
+        for c in value:
+            nxt = self._goto[node].get(c)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][c] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(value)
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and c not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(c, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def _raw_matches(self, text: str) -> Iterator[tuple[int, int, str]]:
+        node = 0
+        for i, c in enumerate(text):
+            while node and c not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(c, 0)
+            for value in self._out[node]:
+                yield i + 1 - len(value), i + 1, value
+
+    def find(self, text: str) -> list[tuple[int, int, str]]:
+        """Non-overlapping (start, end, label) matches, sorted by start."""
+        candidates = []
+        for start, end, value in self._raw_matches(text):
+            if _is_word(value[0]) and start > 0 and _is_word(text[start - 1]):
+                continue
+            if _is_word(value[-1]) and end < len(text) and _is_word(text[end]):
+                continue
+            candidates.append((start, -(end - start), value))
+        spans: list[tuple[int, int, str]] = []
+        last_end = 0
+        for start, neg_len, value in sorted(candidates):
+            if start >= last_end:
+                spans.append((start, start - neg_len, self._labels[value]))
+                last_end = start - neg_len
+        return spans
+
+
+class ScopeExpiredError(RuntimeError):
+    """An EntityScope was used after its ttl; reopen it from the EntityStore."""
+
+
+class EntityScope:
+    """Confirmed entity values -> labels for one document, batch or tenant.
+
+    Holds at most max_entries values (least recently confirmed are dropped
+    first) and expires ttl seconds after creation when ttl is set.  Values
+    shorter than min_length are not learned, so single letters such as a SEX
+    value of "F" never turn into redact-everywhere patterns.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 10_000,
+        ttl: float | None = None,
+        min_length: int = 3,
+    ) -> None:
+        self.name = name
+        self.max_entries = max_entries
+        self.min_length = min_length
+        self.expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._values: OrderedDict[str, str] = OrderedDict()
+        self._matcher: EntityMatcher | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __deepcopy__(self, memo: dict) -> "EntityScope":
+        # A scope is shared state by design; program copies keep using it.
+        return self
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def add(self, entities: Iterable[PIIEntity | dict[str, Any]]) -> None:
+        """Learn confirmed entity values (re-adding refreshes their recency)."""
+        with self._lock:
+            for entity in entities:
+                span = as_entity_span(entity)
+                value = span.value.strip()
+                if len(value) < self.min_length:
+                    continue
+                self._values[value] = span.label
+                self._values.move_to_end(value)
+                self._matcher = None
+            while len(self._values) > self.max_entries:
+                self._values.popitem(last=False)
+
+    def _current_matcher(self) -> EntityMatcher | None:
+        with self._lock:
+            if self._matcher is None and self._values:
+                self._matcher = EntityMatcher(self._values)
+            return self._matcher
+
+    def redact(self, text: str) -> tuple[str, list[PIIEntity]]:
+        """Replace known values in text with [LABEL]; return the text and hits."""
+        matcher = self._current_matcher()
+        if matcher is None:
+            return text, []
+        parts: list[str] = []
+        found: list[PIIEntity] = []
+        pos = 0
+        for start, end, label in matcher.find(text):
+            parts.append(text[pos:start])
+            parts.append(f"[{label}]")
+            found.append(PIIEntity(value=text[start:end], label=label))
+            pos = end
+        parts.append(text[pos:])
+        return "".join(parts), found
+
+
+class EntityStore:
+    """Registry of named EntityScopes with explicit lifetimes."""
+
+    def __init__(self) -> None:
+        self._scopes: dict[str, EntityScope] = {}
+        self._lock = threading.Lock()
+
+    def open(self, name: str, **scope_kwargs: Any) -> EntityScope:
+        """Return the live scope called name, creating it if missing or expired.
+
+        Expired scopes of every name are dropped on the way.
+        """
+        with self._lock:
+            for key in [k for k, s in self._scopes.items() if s.expired]:
+                del self._scopes[key]
+            scope = self._scopes.get(name)
+            if scope is None:
+                scope = EntityScope(name, **scope_kwargs)
+                self._scopes[name] = scope
+            return scope
+
+    def close(self, name: str) -> None:
+        with self._lock:
+            self._scopes.pop(name, None)
+
+    @contextmanager
+    def scoped(self, name: str, **scope_kwargs: Any) -> Iterator[EntityScope]:
+        """Scope that lives for one with-block, e.g. a single document or batch."""
+        scope = self.open(name, **scope_kwargs)
+        try:
+            yield scope
+        finally:
+            self.close(name)
+
+
+class KnownEntityRedactor(dspy.Module):
+    """Pre-redact values already confirmed in a scope, then call the program.
+
+    Known values are replaced in one automaton pass before the LLM sees the
+    text, entities the model confirms (values present in the input) are added
+    to the scope, and the output is passed through the scope again so a known
+    value can never leak.  A scope past its ttl raises ScopeExpiredError
+    instead of pre-redacting or learning.
+    """
+
+    def __init__(self, program: dspy.Module, scope: EntityScope) -> None:
+        super().__init__()
+        self.program = program
+        self.scope = scope
+
+    def _finish(
+        self, text: str, known: list[PIIEntity], pred: dspy.Prediction
+    ) -> dspy.Prediction:
+        entities = list(pred.entities or [])
+        self.scope.add(e for e in entities if as_entity_span(e).value in text)
+        redacted, _ = self.scope.redact(pred.redacted_text)
+        return dspy.Prediction(entities=known + entities, redacted_text=redacted)
+
+    def _check_live(self) -> None:
+        if self.scope.expired:
+            raise ScopeExpiredError(f"entity scope {self.scope.name!r} has expired")
+
+    def forward(self, text: str) -> dspy.Prediction:
+        self._check_live()
+        masked, known = self.scope.redact(text)
+        return self._finish(text, known, self.program(text=masked))
+
+    async def aforward(self, text: str) -> dspy.Prediction:
+        self._check_live()
+        masked, known = self.scope.redact(text)
+        return self._finish(text, known, await self.program.acall(text=masked))
@@ -0,0 +1,116 @@
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+from datasets import Dataset
+
+from optimizer import PII_LABELS
+
+logger = logging.getLogger(__name__)
+
+LABEL_INDEX_PATH = "./data/label_index.npz"
+
+
+class LabelIndex:
+    """Rows of the processed dataset that contain each PII label.
+
+    Built once from the label_mask column (see optimizer.download_dataset)
+    and stored as one sorted row array per label, concatenated, with
+    offsets.  masks keeps the per-row bitmaps for counting labels in a
+    sample.
+    """
+
+    def __init__(self, masks: np.ndarray, rows: np.ndarray, offsets: np.ndarray):
+        self.masks = masks
+        self._rows = rows
+        self._offsets = offsets
+
+    @classmethod
+    def build(cls, masks: np.ndarray) -> "LabelIndex":
+        masks = np.asarray(masks, dtype=np.uint32)
+        per_label = [np.flatnonzero(masks & (1 << i)) for i in range(len(PII_LABELS))]
+        offsets = np.cumsum([0] + [len(r) for r in per_label])
+        return cls(masks, np.concatenate(per_label), offsets)
+
+    def rows(self, label: str) -> np.ndarray:
+        i = PII_LABELS.index(label)
+        return self._rows[self._offsets[i] : self._offsets[i + 1]]
+
+    def label_counts(self, row_ids: np.ndarray | list[int]) -> dict[str, int]:
+        """How many of row_ids contain each label."""
+        masks = self.masks[np.asarray(row_ids, dtype=int)]
+        return {
+            label: int(np.count_nonzero(masks & (1 << i)))
+            for i, label in enumerate(PII_LABELS)
+        }
+
+    def stratified_sample(
+        self,
+        pool: range,
+        size: int,
+        min_per_label: int,
+        rng: np.random.Generator,
+    ) -> np.ndarray:
+        """Sorted row ids from pool with at least min_per_label rows per label.
+
+        Labels are covered rarest first, counting rows already picked for
+        other labels, so common labels are mostly covered by co-occurrence.
+        The rest of size is then filled uniformly from the pool.  Coverage
+        wins over size: the sample is larger than size if the minimums need
+        it, and a label with fewer rows in the pool gets all of them.
+        """
+        chosen = np.zeros(len(self.masks), dtype=bool)
+        in_pool = {
+            label: rows[(rows >= pool.start) & (rows < pool.stop)]
+            for label in PII_LABELS
+            for rows in [self.rows(label)]
+        }
+        for label in sorted(PII_LABELS, key=lambda label: len(in_pool[label])):
+            rows = in_pool[label]
+            need = min_per_label - int(np.count_nonzero(chosen[rows]))
+            if need > 0:
+                free = rows[~chosen[rows]]
+                chosen[rng.choice(free, min(need, len(free)), replace=False)] = True
+        rest = size - int(np.count_nonzero(chosen))
+        if rest > 0:
+            free = np.flatnonzero(~chosen[pool.start : pool.stop]) + pool.start
+            chosen[rng.choice(free, min(rest, len(free)), replace=False)] = True
+        return np.flatnonzero(chosen)
+
+    def save(self, path: str | Path, fingerprint: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                masks=self.masks,
+                rows=self._rows,
+                offsets=self._offsets,
+                labels=np.array(PII_LABELS),
+                fingerprint=np.array(fingerprint),
+            )
+
+
+def load_label_index(dataset: Dataset, path: str = LABEL_INDEX_PATH) -> LabelIndex:
+    """The LabelIndex for dataset, from path if it was built for this dataset.
+
+    The cached file is keyed by the dataset fingerprint and the label
+    vocabulary; anything else rebuilds it from the label_mask column.
+    """
+    fingerprint = dataset._fingerprint
+    if Path(path).exists():
+        with np.load(path) as data:
+            if str(data["fingerprint"]) == fingerprint and tuple(
+                data["labels"].tolist()
+            ) == tuple(PII_LABELS):
+                return LabelIndex(data["masks"], data["rows"], data["offsets"])
+    start = time.perf_counter()
+    index = LabelIndex.build(dataset.with_format("numpy")["label_mask"])
+    index.save(path, fingerprint)
+    logger.info(
+        "Built label index for %d rows in %.2fs (%s)",
+        len(index.masks),
+        time.perf_counter() - start,
+        path,
+    )
+    return index
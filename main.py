@@ -1,38 +1,49 @@
 import argparse
 import logging
 import os
+import sys
+from collections.abc import Iterable
+from typing import TYPE_CHECKING, Any
 
 import dspy
 from dotenv import load_dotenv
 
-from redactor import PIIRedactor
+from redactor import STRATEGIES
+from session import get_default_redactor
+
+if TYPE_CHECKING:
+    from batch import BatchResult
 
 logger = logging.getLogger(__name__)
 
 
 def redact(text: str) -> str:
-    load_dotenv()
-    api_key = os.getenv("GOOGLE_API_KEY")
-    model = os.getenv("DSPY_MODEL", "gemini/gemini-2.0-flash")
-    logger.info("Using model: %s", model)
+    session = get_default_redactor()
+    logger.info("Using model: %s", session.model)
     logger.info("Input text: %s", text)
-    lm = dspy.LM(model, api_key=api_key)
-    dspy.configure(lm=lm)
-
-    from optimizer import load_optimized_model
-
-    redactor = load_optimized_model()
-    if redactor is None:
-        redactor = PIIRedactor()
 
-    result = redactor(text=text)
+    result, cost = session.predict_with_cost(text)
     logger.debug("Entities found: %s", result.entities)
     logger.debug("Redacted text: %s", result.redacted_text)
-    cost = sum(entry.get("cost", 0) or 0 for entry in lm.history)
-    logger.debug("Cost: $%.4f", cost)
+    logger.debug("Cost: $%.4f (session total $%.4f)", cost, session.cost)
     return result.redacted_text
 
 
+async def aredact(text: str) -> str:
+    """Async redact() for asyncio services, using the default session."""
+    return await get_default_redactor().aredact(text)
+
+
+def redact_many(texts: Iterable[str], **kwargs: Any) -> "BatchResult":
+    """Redact a batch of texts with the default session (see batch.redact_many)."""
+    return get_default_redactor().redact_many(texts, **kwargs)
+
+
+async def aredact_many(texts: Iterable[str], **kwargs: Any) -> "BatchResult":
+    """Async redact_many() with the default session (see batch.aredact_many)."""
+    return await get_default_redactor().aredact_many(texts, **kwargs)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Redact PII from text")
     parser.add_argument("text", nargs="?", default="Call John Smith at 555-123-4567")
@@ -50,15 +61,169 @@ if __name__ == "__main__":
         action="store_true",
         help="Evaluate the PII redactor on a held-out test set",
     )
+    parser.add_argument(
+        "--benchmark",
+        nargs="*",
+        choices=STRATEGIES,
+        metavar="STRATEGY",
+        help="Compare module strategies (default: all of "
+        f"{', '.join(STRATEGIES)}) on the eval set: output tokens, latency "
+        "percentiles and score",
+    )
+    parser.add_argument(
+        "--min-score",
+        type=float,
+        help="With --benchmark, report the fastest strategy scoring at least this",
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=STRATEGIES,
+        default="cot",
+        help="PIIRedactor module: ChainOfThought, plain Predict, or entities "
+        "then redacted text in two calls (default: cot)",
+    )
     parser.add_argument(
         "--randomize",
         action="store_true",
         help="Randomly sample evaluation set instead of sequential selection",
     )
+    parser.add_argument(
+        "--stratify",
+        action="store_true",
+        help="Sample the evaluation set so every PII label gets at least "
+        "EVALUATE_MIN_PER_LABEL examples",
+    )
+    parser.add_argument(
+        "--ci-width",
+        type=float,
+        metavar="W",
+        help="With --evaluate, evaluate in waves and stop once the 95%% "
+        "confidence interval of the score is at most W points wide",
+    )
+    parser.add_argument(
+        "--max-cost",
+        type=float,
+        metavar="USD",
+        help="With --evaluate, stop after the wave that reaches this LM cost",
+    )
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        metavar="S",
+        help="With --evaluate, stop after the wave that reaches this run time",
+    )
+    parser.add_argument(
+        "--wave-size",
+        type=int,
+        default=50,
+        help="Examples per wave with --ci-width/--max-cost/--max-seconds (default: 50)",
+    )
+    parser.add_argument(
+        "--rescore",
+        action="store_true",
+        help="Re-score stored evaluation predictions with the current metric "
+        "(no LM calls)",
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="Discard the evaluation journal and re-score every example",
+    )
+    parser.add_argument(
+        "--entities-only",
+        action="store_true",
+        help="Ask the model for entities only and rebuild the redacted text locally",
+    )
+    parser.add_argument(
+        "--pack-tokens",
+        type=int,
+        metavar="N",
+        help="With --evaluate, pack short examples into multi-document calls of "
+        "up to N tokens",
+    )
+    parser.add_argument(
+        "--cascade-model",
+        metavar="MODEL",
+        help="With --evaluate, redact with MODEL first and escalate to DSPY_MODEL "
+        "only outputs that fail local validation",
+    )
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="Repair predictions whose entities and redacted text disagree "
+        "locally, without another LLM call",
+    )
+    parser.add_argument(
+        "--stream",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="Redact newline-delimited text or JSONL from FILE (default: stdin), "
+        "writing one JSON result per line to stdout",
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=16,
+        help="Maximum in-flight requests in --stream mode (default: 16)",
+    )
+    parser.add_argument(
+        "--ordered",
+        action="store_true",
+        help="Emit --stream results in input order instead of completion order",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        metavar="PATH",
+        help="Journal finished --stream records to PATH and skip them on rerun",
+    )
+    parser.add_argument(
+        "--text-field",
+        default="text",
+        help="JSONL field holding the text in --stream mode (default: text)",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run the HTTP redaction server (POST /redact, /redact/batch)",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="--serve bind address")
+    parser.add_argument("--port", type=int, default=8080, help="--serve port")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Concurrent redactions in --serve mode (default: 8)",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=32,
+        help="Requests allowed to wait for a worker before 429 (default: 32)",
+    )
     args = parser.parse_args()
 
-    if args.randomize and not args.evaluate:
-        parser.error("--randomize requires --evaluate")
+    sampling = args.evaluate or args.rescore or args.benchmark is not None
+    if args.randomize and not sampling:
+        parser.error("--randomize requires --evaluate, --rescore or --benchmark")
+    if args.stratify and not sampling:
+        parser.error("--stratify requires --evaluate, --rescore or --benchmark")
+    if args.stratify and args.randomize:
+        parser.error("--stratify and --randomize are mutually exclusive")
+    if args.fresh and not args.evaluate:
+        parser.error("--fresh requires --evaluate")
+    if (args.ci_width or args.max_cost or args.max_seconds) and not args.evaluate:
+        parser.error("--ci-width, --max-cost and --max-seconds require --evaluate")
+    if args.pack_tokens and not (args.evaluate or args.rescore):
+        parser.error("--pack-tokens requires --evaluate or --rescore")
+    if args.cascade_model and not (args.evaluate or args.rescore):
+        parser.error("--cascade-model requires --evaluate or --rescore")
+    if args.cascade_model and args.pack_tokens:
+        parser.error("--cascade-model and --pack-tokens are mutually exclusive")
+    if args.min_score is not None and args.benchmark is None:
+        parser.error("--min-score requires --benchmark")
+    if (args.ordered or args.checkpoint) and args.stream is None:
+        parser.error("--ordered and --checkpoint require --stream")
 
     level = logging.DEBUG if args.debug else logging.INFO
     logging.basicConfig(level=level, format="%(name)s %(levelname)s: %(message)s")
@@ -71,7 +236,43 @@ if __name__ == "__main__":
 
         from optimizer import optimize
 
-        optimize(api_key=api_key, model=model, reflection_model=reflection_model)
+        optimize(
+            api_key=api_key,
+            model=model,
+            reflection_model=reflection_model,
+            strategy=args.strategy,
+        )
+        raise SystemExit(0)
+
+    if args.benchmark is not None:
+        load_dotenv()
+        from benchmark import benchmark
+
+        benchmark(
+            api_key=os.getenv("GOOGLE_API_KEY"),
+            model=os.getenv("DSPY_MODEL", "gemini/gemini-2.0-flash"),
+            strategies=args.benchmark or STRATEGIES,
+            entities_only=args.entities_only,
+            randomize=args.randomize,
+            stratify=args.stratify,
+            min_score=args.min_score,
+        )
+        raise SystemExit(0)
+
+    if args.rescore:
+        load_dotenv()
+        from evaluator import rescore
+
+        rescore(
+            model=os.getenv("DSPY_MODEL", "gemini/gemini-2.0-flash"),
+            randomize=args.randomize,
+            entities_only=args.entities_only,
+            pack_tokens=args.pack_tokens,
+            stratify=args.stratify,
+            cascade_model=args.cascade_model,
+            repair=args.repair,
+            strategy=args.strategy,
+        )
         raise SystemExit(0)
 
     if args.evaluate:
@@ -81,9 +282,56 @@ if __name__ == "__main__":
 
         from evaluator import evaluate
 
-        evaluate(api_key=api_key, model=model, randomize=args.randomize)
+        evaluate(
+            api_key=api_key,
+            model=model,
+            randomize=args.randomize,
+            entities_only=args.entities_only,
+            pack_tokens=args.pack_tokens,
+            fresh=args.fresh,
+            stratify=args.stratify,
+            ci_width=args.ci_width,
+            max_cost=args.max_cost,
+            max_seconds=args.max_seconds,
+            wave_size=args.wave_size,
+            cascade_model=args.cascade_model,
+            repair=args.repair,
+            strategy=args.strategy,
+        )
         raise SystemExit(0)
 
+    if args.entities_only:
+        os.environ["REDACT_ENTITIES_ONLY"] = "true"
+    if args.repair:
+        os.environ["REDACT_REPAIR"] = "true"
+    if args.strategy != "cot":
+        os.environ["REDACT_STRATEGY"] = args.strategy
+
+    if args.serve:
+        from server import serve
+
+        serve(args.host, args.port, args.workers, args.queue_size)
+        raise SystemExit(0)
+
+    if args.stream is not None:
+        from stream import run_stream
+
+        session = get_default_redactor()
+        logger.info("Using model: %s", session.model)
+        source = sys.stdin if args.stream == "-" else open(args.stream)
+        with source:
+            _, failed = run_stream(
+                source,
+                sys.stdout,
+                session.predict,
+                window=args.window,
+                ordered=args.ordered,
+                checkpoint=args.checkpoint,
+                text_field=args.text_field,
+            )
+        logger.info("Cost: $%.4f", session.cost)
+        raise SystemExit(1 if failed else 0)
+
     result = redact(args.text)
     logger.info("Redacted result: %s", result)
 
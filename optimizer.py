@@ -1,16 +1,21 @@
 import logging
 import os
 import re
+import shutil
+import time
 from collections import Counter
-from typing import Any
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Any
 
 import dspy
-from datasets import Dataset, load_dataset, load_from_disk
+from datasets import Dataset, Features, Value, load_dataset, load_from_disk
 from dspy.evaluate.metrics import f1_score
 
+from example_store import ExampleSequence
 from examples import FEWSHOT_ROW_IDS
-from redactor import PIIRedactor
+from ratelimit import ScheduledLM
+from redactor import STRATEGIES, PIIRedactor, program_hash
 
 logger = logging.getLogger(__name__)
 
@@ -19,64 +24,116 @@ PROCESSED_DATASET_DIR = "./data/ai4privacy_processed"
 OPTIMIZED_MODEL_PATH = "./optimized_model/pii_redactor.json"
 
 
+PROCESSED_COLUMNS = ["id", "source_text", "target_text"]
+
+
 def download_dataset(
     data_dir: str = DATASET_DIR,
     processed_dir: str = PROCESSED_DATASET_DIR,
+    num_proc: int | None = None,
 ) -> Dataset:
     """Download ai4privacy/pii-masking-300k if not cached locally.
 
-    Returns the English-only train split with few-shot rows excluded.
+    Returns the English-only train split with few-shot rows excluded, pruned
+    to PROCESSED_COLUMNS plus a precomputed length column (characters of
+    source_text) and a label_mask column (see label_mask()).
     On first call, downloads from HF Hub, filters, and saves the processed
     dataset to disk.  Subsequent calls load directly from disk without
-    contacting HF Hub.
+    contacting HF Hub.  Filtering and the derived columns run batched in
+    num_proc processes (DATASET_NUM_PROC env var, default: all CPUs).
     """
     if Path(processed_dir).exists():
         logger.info("Loading processed dataset from %s", processed_dir)
-        return load_from_disk(processed_dir)
-
+        start = time.perf_counter()
+        processed = load_from_disk(processed_dir)
+        if "label_mask" in processed.column_names:
+            logger.info(
+                "Loaded %d rows in %.2fs", len(processed), time.perf_counter() - start
+            )
+            return processed
+        logger.info("Processed dataset predates label_mask; rebuilding")
+        shutil.rmtree(processed_dir)
+
+    num_proc = num_proc or int(os.environ.get("DATASET_NUM_PROC", os.cpu_count()))
+    # datasets starts a process pool for any num_proc, even 1
+    pool = num_proc if num_proc > 1 else None
     logger.info("Downloading dataset from HF Hub (cache_dir=%s)...", data_dir)
     ds = load_dataset(
         "ai4privacy/pii-masking-300k",
         split="train",
         cache_dir=data_dir,
     )
-    english = ds.filter(lambda row: row["language"] == "English")
-    logger.info("Filtered to %d English samples", len(english))
-    # Exclude few-shot demo rows to prevent data leakage
-    excluded = FEWSHOT_ROW_IDS
-    filtered = english.filter(lambda row: row["id"] not in excluded)
+    start = time.perf_counter()
+    # English only, and exclude few-shot demo rows to prevent data leakage
+    filtered = ds.filter(
+        _keep_rows,
+        input_columns=["language", "id"],
+        batched=True,
+        fn_kwargs={"excluded": FEWSHOT_ROW_IDS},
+        num_proc=pool,
+    )
+    logger.info("Filtered %d rows to %d English non-demo rows", len(ds), len(filtered))
+    processed = filtered.select_columns(PROCESSED_COLUMNS).map(
+        _length_and_labels,
+        input_columns=["source_text", "target_text"],
+        batched=True,
+        features=Features(
+            {
+                **{c: filtered.features[c] for c in PROCESSED_COLUMNS},
+                "length": Value("int32"),
+                "label_mask": Value("uint32"),
+            }
+        ),
+        num_proc=pool,
+    )
+    processed.save_to_disk(processed_dir)
     logger.info(
-        "Excluded %d few-shot rows, %d remaining",
-        len(english) - len(filtered),
-        len(filtered),
+        "Saved processed dataset to %s in %.1fs (%d processes): %.1f MB, "
+        "source %.1f MB",
+        processed_dir,
+        time.perf_counter() - start,
+        num_proc,
+        _dir_size(Path(processed_dir)) / 1e6,
+        sum(Path(f["filename"]).stat().st_size for f in ds.cache_files) / 1e6,
     )
-    filtered.save_to_disk(processed_dir)
-    logger.info("Saved processed dataset to %s", processed_dir)
-    return filtered
+    return load_from_disk(processed_dir)
+
+
+def _keep_rows(languages: list[str], ids: list[str], excluded: set[str]) -> list[bool]:
+    return [
+        lang == "English" and row_id not in excluded
+        for lang, row_id in zip(languages, ids)
+    ]
+
+
+def _length_and_labels(sources: list[str], targets: list[str]) -> dict[str, list[int]]:
+    return {
+        "length": [len(text) for text in sources],
+        "label_mask": [label_mask(text) for text in targets],
+    }
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
 
 
 def prepare_examples(
     dataset: Dataset,
     train_size: int | None = None,
     val_size: int | None = None,
-) -> tuple[list[dspy.Example], list[dspy.Example]]:
+) -> tuple[ExampleSequence, ExampleSequence]:
     """Convert HF dataset rows to DSPy Examples.
 
     Takes train_size + val_size samples, maps source_text -> text (input)
-    and target_text -> redacted_text (output).
+    and target_text -> redacted_text (output).  The returned sequences are
+    lazy: each Example is built from the dataset when it is accessed.
     Sizes default to env vars OPTIMIZE_TRAIN_SIZE / OPTIMIZE_VAL_SIZE (450/50).
     """
     train_size = train_size or int(os.environ.get("OPTIMIZE_TRAIN_SIZE", "450"))
     val_size = val_size or int(os.environ.get("OPTIMIZE_VAL_SIZE", "50"))
     n = train_size + val_size
-    subset = dataset.select(range(min(n, len(dataset))))
-    examples = [
-        dspy.Example(
-            text=row["source_text"],
-            redacted_text=row["target_text"],
-        ).with_inputs("text")
-        for row in subset
-    ]
+    row_ids = range(min(n, len(dataset)))
+    examples = ExampleSequence(dataset.select(row_ids), row_ids)
     trainset = examples[:train_size]
     valset = examples[train_size:]
     logger.info("Prepared %d train, %d val examples", len(trainset), len(valset))
@@ -91,10 +148,80 @@ def extract_pii_labels(text: str) -> list[str]:
     return PII_LABEL_RE.findall(text)
 
 
-def hybrid_pii_score(gold_text: str, pred_text: str) -> tuple[float, float, float, int]:
-    """Compute hybrid PII detection + classification score.
-
-    Score = 0.75 * detection_recall + 0.25 * classification_accuracy
+# Label vocabulary of ai4privacy/pii-masking-300k, in IdentifyPII order; the
+# position of a label is its bit in label_mask().
+PII_LABELS = (
+    "GIVENNAME1",
+    "GIVENNAME2",
+    "LASTNAME1",
+    "LASTNAME2",
+    "LASTNAME3",
+    "TITLE",
+    "TEL",
+    "EMAIL",
+    "USERNAME",
+    "SOCIALNUMBER",
+    "IDCARD",
+    "DRIVERLICENSE",
+    "PASSPORT",
+    "STREET",
+    "BUILDING",
+    "CITY",
+    "STATE",
+    "POSTCODE",
+    "COUNTRY",
+    "SECADDRESS",
+    "GEOCOORD",
+    "SEX",
+    "BOD",
+    "PASS",
+    "IP",
+    "DATE",
+    "TIME",
+)
+_LABEL_BITS = {label: 1 << i for i, label in enumerate(PII_LABELS)}
+
+
+def label_mask(text: str) -> int:
+    """Bitmap of the PII_LABELS present in a redacted text (unknown ones ignored)."""
+    mask = 0
+    for label in PII_LABEL_RE.findall(text):
+        mask |= _LABEL_BITS.get(label, 0)
+    return mask
+
+
+def mask_labels(mask: int) -> list[str]:
+    """The PII_LABELS set in a label_mask() bitmap."""
+    return [label for label, bit in _LABEL_BITS.items() if mask & bit]
+
+
+DETECTION_WEIGHT = 0.75
+CLASSIFICATION_WEIGHT = 0.25
+
+
+@dataclass(frozen=True)
+class PIIScoreBreakdown:
+    """Label counts and scores for one gold/predicted redaction pair."""
+
+    gold_counts: Counter
+    pred_counts: Counter
+    detected: int
+    num_correct: int
+    detection_recall: float
+    classification_acc: float
+    hybrid_score: float
+
+    @property
+    def total_gold(self) -> int:
+        return sum(self.gold_counts.values())
+
+    @property
+    def total_pred(self) -> int:
+        return sum(self.pred_counts.values())
+
+
+def score_pii(gold_text: str, pred_text: str) -> PIIScoreBreakdown:
+    """Single-pass hybrid scoring kernel: extract and count labels once.
 
     Detection recall (label-agnostic): how many gold PII items were
     redacted with ANY label.  Over-redaction is acceptable — no precision
@@ -102,73 +229,65 @@ def hybrid_pii_score(gold_text: str, pred_text: str) -> tuple[float, float, floa
 
     Classification accuracy: of the detected items, how many have the
     exact correct label?
-
-    Returns (detection_recall, classification_accuracy, hybrid_score,
-             num_correct_labels).
     """
-    gold_labels = extract_pii_labels(gold_text)
-    pred_labels = extract_pii_labels(pred_text)
-
-    if not gold_labels and not pred_labels:
-        return 1.0, 1.0, 1.0, 0
-    if gold_labels and not pred_labels:
-        return 0.0, 0.0, 0.0, 0
-    if not gold_labels and pred_labels:
-        return 1.0, 1.0, 1.0, 0
-
-    gold_counts = Counter(gold_labels)
-    pred_counts = Counter(pred_labels)
-
+    gold_counts = Counter(PII_LABEL_RE.findall(gold_text))
+    pred_counts = Counter(PII_LABEL_RE.findall(pred_text))
     total_gold = sum(gold_counts.values())
     total_pred = sum(pred_counts.values())
 
-    # Detection recall: label-agnostic count of redacted items
-    detected_count = min(total_gold, total_pred)
-    detection_recall = detected_count / total_gold
+    if not total_gold:
+        recall = accuracy = hybrid = 1.0
+        detected = num_correct = 0
+    elif not total_pred:
+        recall = accuracy = hybrid = 0.0
+        detected = num_correct = 0
+    else:
+        detected = min(total_gold, total_pred)
+        num_correct = sum((gold_counts & pred_counts).values())
+        recall = detected / total_gold
+        accuracy = num_correct / detected
+        hybrid = DETECTION_WEIGHT * recall + CLASSIFICATION_WEIGHT * accuracy
+
+    return PIIScoreBreakdown(
+        gold_counts=gold_counts,
+        pred_counts=pred_counts,
+        detected=detected,
+        num_correct=num_correct,
+        detection_recall=recall,
+        classification_acc=accuracy,
+        hybrid_score=hybrid,
+    )
 
-    # Classification accuracy: exact label matches among detected items
-    num_correct = sum((gold_counts & pred_counts).values())
-    classification_acc = num_correct / detected_count if detected_count > 0 else 0.0
 
-    DETECTION_WEIGHT = 0.75
-    CLASSIFICATION_WEIGHT = 0.25
-    hybrid_score = (
-        DETECTION_WEIGHT * detection_recall + CLASSIFICATION_WEIGHT * classification_acc
-    )
+def hybrid_pii_score(gold_text: str, pred_text: str) -> tuple[float, float, float, int]:
+    """Compute hybrid PII detection + classification score.
 
-    return detection_recall, classification_acc, hybrid_score, num_correct
+    Score = 0.75 * detection_recall + 0.25 * classification_accuracy
+    (see score_pii for the definitions).
+
+    Returns (detection_recall, classification_accuracy, hybrid_score,
+             num_correct_labels).
+    """
+    b = score_pii(gold_text, pred_text)
+    return b.detection_recall, b.classification_acc, b.hybrid_score, b.num_correct
 
 
-def _build_feedback(
-    gold_text: str,
-    pred_text: str,
-    detection_recall: float,
-    classification_acc: float,
-    hybrid_score: float,
-    num_correct: int,
-) -> str:
+def _build_feedback(gold_text: str, pred_text: str, b: PIIScoreBreakdown) -> str:
     """Build severity-weighted feedback for GEPA reflection.
 
     Distinguishes CRITICAL errors (missed PII — under-redaction) from
     minor errors (wrong label on a detected item).  Over-redaction is
     noted but explicitly marked as acceptable.
     """
-    if hybrid_score == 1.0 and gold_text.strip() == pred_text.strip():
+    if b.hybrid_score == 1.0 and gold_text.strip() == pred_text.strip():
         return "Correct. All PII entities detected with correct labels."
 
-    gold_labels = extract_pii_labels(gold_text)
-    pred_labels = extract_pii_labels(pred_text)
-    gold_counts = Counter(gold_labels)
-    pred_counts = Counter(pred_labels)
-
-    total_gold = sum(gold_counts.values())
-    total_pred = sum(pred_counts.values())
-    detected = min(total_gold, total_pred)
+    total_gold, total_pred, detected = b.total_gold, b.total_pred, b.detected
 
     parts = [
-        f"Hybrid score={hybrid_score:.2f} "
-        f"(detection_recall={detection_recall:.2f}, "
-        f"classification_acc={classification_acc:.2f})."
+        f"Hybrid score={b.hybrid_score:.2f} "
+        f"(detection_recall={b.detection_recall:.2f}, "
+        f"classification_acc={b.classification_acc:.2f})."
     ]
 
     # CRITICAL: missed PII (under-detection)
@@ -180,19 +299,18 @@ def _build_feedback(
         )
 
     # Minor: wrong labels on detected items
-    if detected > 0 and num_correct < detected:
-        mislabeled_gold = gold_counts - (gold_counts & pred_counts)
-        mislabeled_pred = pred_counts - (gold_counts & pred_counts)
+    if detected > 0 and b.num_correct < detected:
+        matched = b.gold_counts & b.pred_counts
         gold_items = [
             f"{label} (x{c})" if c > 1 else label
-            for label, c in mislabeled_gold.items()
+            for label, c in (b.gold_counts - matched).items()
         ]
         pred_items = [
             f"{label} (x{c})" if c > 1 else label
-            for label, c in mislabeled_pred.items()
+            for label, c in (b.pred_counts - matched).items()
         ]
         parts.append(
-            f"Minor: {num_correct}/{detected} detected item(s) have correct labels. "
+            f"Minor: {b.num_correct}/{detected} detected item(s) have correct labels. "
             f"Missing labels: {', '.join(gold_items)}. "
             f"Unexpected labels: {', '.join(pred_items)}."
         )
@@ -202,7 +320,7 @@ def _build_feedback(
         extra_count = total_pred - total_gold
         parts.append(f"Note: Over-redacted by {extra_count} item(s) (acceptable).")
 
-    if hybrid_score == 1.0 and gold_text.strip() != pred_text.strip():
+    if b.hybrid_score == 1.0 and gold_text.strip() != pred_text.strip():
         parts.append("All PII labels match, but surrounding text differs.")
 
     text_f1 = f1_score(pred_text.strip(), gold_text.strip())
@@ -213,13 +331,37 @@ def _build_feedback(
     return " ".join(parts)
 
 
+class MetricResult(dspy.Prediction):
+    """pii_metric result: score up front, feedback text built on first access."""
+
+    def __init__(self, gold_text: str, pred_text: str, breakdown: PIIScoreBreakdown):
+        super().__init__(score=breakdown.hybrid_score)
+        self._texts = (gold_text, pred_text)
+        self._breakdown = breakdown
+
+    @property
+    def breakdown(self) -> PIIScoreBreakdown:
+        return self._breakdown
+
+    @property
+    def feedback(self) -> str:
+        if "feedback" not in self._store:
+            self._store["feedback"] = _build_feedback(*self._texts, self._breakdown)
+        return self._store["feedback"]
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "feedback":
+            return self.feedback
+        return super().__getitem__(key)
+
+
 def pii_metric(
     gold: dspy.Example,
     pred: dspy.Prediction,
     trace: Any | None = None,
     pred_name: str | None = None,
     pred_trace: Any | None = None,
-) -> dspy.Prediction:
+) -> MetricResult:
     """Hybrid PII metric: detection recall + classification accuracy.
 
     Score = 0.75 * detection_recall + 0.25 * classification_accuracy.
@@ -227,24 +369,17 @@ def pii_metric(
     over-redaction.  Feedback categorises errors by severity (CRITICAL
     for missed PII, minor for wrong labels) to guide GEPA reflection.
 
-    Returns dspy.Prediction(score=float, feedback=str).
+    Feedback is only built when GEPA asks for it (trace or pred_name given)
+    or when .feedback is read; plain scoring (evaluate) never pays for it.
+
+    Returns a dspy.Prediction with score, feedback and the label breakdown.
     """
     gold_text = gold.redacted_text.strip()
     pred_text = pred.redacted_text.strip()
-
-    detection_recall, classification_acc, hybrid_score, num_correct = hybrid_pii_score(
-        gold_text, pred_text
-    )
-    feedback = _build_feedback(
-        gold_text,
-        pred_text,
-        detection_recall,
-        classification_acc,
-        hybrid_score,
-        num_correct,
-    )
-
-    return dspy.Prediction(score=hybrid_score, feedback=feedback)
+    result = MetricResult(gold_text, pred_text, score_pii(gold_text, pred_text))
+    if trace is not None or pred_name is not None:
+        _ = result.feedback  # materialise for GEPA reflection
+    return result
 
 
 def _sum_lm_cost(lm: dspy.LM) -> float:
@@ -252,7 +387,61 @@ def _sum_lm_cost(lm: dspy.LM) -> float:
     return sum(entry.get("cost", 0) or 0 for entry in lm.history)
 
 
-def optimize(api_key: str, model: str, reflection_model: str | None = None) -> None:
+def _strategy_program_hashes(strategy: str) -> set[str]:
+    """Hashes of the programs a session can run for strategy right now.
+
+    That is the saved program (or the unoptimized one if none is saved),
+    both with the full and the entities-only signature.
+    """
+    hashes = set()
+    for entities_only in (False, True):
+        kwargs = {"strategy": strategy, "entities_only": entities_only}
+        program = load_optimized_model(**kwargs) or PIIRedactor(**kwargs)
+        hashes.add(program_hash(program))
+    return hashes
+
+
+def _purge_redaction_cache(strategy: str, previous: set[str]) -> None:
+    """Drop cached redactions produced by strategy's previous program.
+
+    previous holds _strategy_program_hashes(strategy) from before the new
+    program was saved.  Other strategies are saved separately, so hashes of
+    their current programs are kept.  Cache keys already include the
+    program hash, so stale entries can never be served; this just reclaims
+    their disk space.
+    """
+    from cache import CACHE_PATH, RedactionCache
+
+    if not os.path.exists(CACHE_PATH):
+        return
+    stale = previous - _strategy_program_hashes(strategy)
+    for other in STRATEGIES:
+        if other != strategy:
+            stale -= _strategy_program_hashes(other)
+    purged = RedactionCache(CACHE_PATH).purge_programs(stale)
+    logger.info(
+        "Purged %d cached redactions from the previous %s program", purged, strategy
+    )
+
+
+def optimized_model_path(strategy: str = "cot") -> str:
+    """Where the optimized program of a module strategy is saved.
+
+    Each strategy has its own predictors, so its state is kept apart;
+    "cot" keeps OPTIMIZED_MODEL_PATH.
+    """
+    if strategy == "cot":
+        return OPTIMIZED_MODEL_PATH
+    path = Path(OPTIMIZED_MODEL_PATH)
+    return str(path.with_name(f"{path.stem}_{strategy}{path.suffix}"))
+
+
+def optimize(
+    api_key: str,
+    model: str,
+    reflection_model: str | None = None,
+    strategy: str = "cot",
+) -> None:
     """Run GEPA optimization pipeline.
 
     1. Downloads/loads dataset
@@ -261,41 +450,50 @@ def optimize(api_key: str, model: str, reflection_model: str | None = None) -> N
     4. Runs GEPA compilation
     5. Saves optimized program to disk
     6. Logs cost breakdown
+
+    strategy selects the PIIRedactor module (see redactor.STRATEGIES); the
+    result is saved to optimized_model_path(strategy).
     """
-    lm = dspy.LM(model, api_key=api_key)
+    lm = ScheduledLM(model, api_key=api_key)
     dspy.configure(lm=lm)
 
     reflection_model = reflection_model or model
     reflection_lm = (
-        dspy.LM(reflection_model, api_key=api_key) if reflection_model != model else lm
+        ScheduledLM(reflection_model, api_key=api_key)
+        if reflection_model != model
+        else lm
     )
 
     dataset = download_dataset()
     trainset, valset = prepare_examples(dataset)
 
-    student = PIIRedactor()
+    student = PIIRedactor(strategy=strategy)
 
-    logger.info("Starting GEPA optimization (auto=light)...")
+    logger.info("Starting GEPA optimization (auto=light, strategy=%s)...", strategy)
     logger.info("Student model: %s", model)
     logger.info("Reflection model: %s", reflection_model)
     optimizer = dspy.GEPA(
         metric=pii_metric,
         auto="medium",
         reflection_lm=reflection_lm,
-        num_threads=20,
+        # the scheduler paces the calls; threads only bound its ceiling
+        num_threads=lm.scheduler.max_concurrency,
         track_stats=True,
         add_format_failure_as_feedback=True,
     )
+    # GEPA revisits every example many times; build the small windows once
     optimized = optimizer.compile(
         student,
-        trainset=trainset,
-        valset=valset,
+        trainset=list(trainset),
+        valset=list(valset),
     )
 
-    save_dir = Path(OPTIMIZED_MODEL_PATH).parent
-    save_dir.mkdir(parents=True, exist_ok=True)
-    optimized.save(OPTIMIZED_MODEL_PATH, save_program=False)
-    logger.info("Optimized model saved to %s", OPTIMIZED_MODEL_PATH)
+    save_path = optimized_model_path(strategy)
+    previous = _strategy_program_hashes(strategy)
+    Path(save_path).parent.mkdir(parents=True, exist_ok=True)
+    optimized.save(save_path, save_program=False)
+    logger.info("Optimized model saved to %s", save_path)
+    _purge_redaction_cache(strategy, previous)
 
     student_cost = _sum_lm_cost(lm)
     reflection_cost = _sum_lm_cost(reflection_lm) if reflection_lm is not lm else 0.0
@@ -306,17 +504,35 @@ def optimize(api_key: str, model: str, reflection_model: str | None = None) -> N
         reflection_cost,
         total_cost,
     )
+    logger.info("LM scheduler: %s", lm.scheduler.stats())
 
 
-def load_optimized_model() -> PIIRedactor | None:
+def load_optimized_model(**redactor_kwargs: Any) -> PIIRedactor | None:
     """Load optimized model from disk if it exists.
 
+    redactor_kwargs are passed to PIIRedactor (e.g. entities_only=True).  The
+    strategy kwarg picks which saved program to load.  Programs are always
+    optimized with the full signature, and dspy loads saved field
+    descriptions by position, so a predictor whose signature differs in
+    entities-only mode keeps its own instructions and field descriptions
+    (the optimized ones ask for a redacted_text it does not have) and only
+    takes the demos.
     Returns None if no optimized model found.
     """
-    if not os.path.exists(OPTIMIZED_MODEL_PATH):
+    strategy = redactor_kwargs.get("strategy", "cot")
+    path = optimized_model_path(strategy)
+    if not os.path.exists(path):
         return None
 
-    logger.debug("Loading optimized model from %s", OPTIMIZED_MODEL_PATH)
-    redactor = PIIRedactor()
-    redactor.load(OPTIMIZED_MODEL_PATH)
+    logger.debug("Loading optimized model from %s", path)
+    redactor = PIIRedactor(**redactor_kwargs)
+    signatures = {name: p.signature for name, p in redactor.named_predictors()}
+    redactor.load(path)
+    if redactor.entities_only:
+        saved = dict(PIIRedactor(strategy=strategy).named_predictors())
+        for name, predictor in redactor.named_predictors():
+            own = signatures[name]
+            if name in saved and list(own.fields) != list(saved[name].signature.fields):
+                logger.debug("Keeping the entities-only signature of %s", name)
+                predictor.signature = own
     return redactor
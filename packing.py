@@ -0,0 +1,262 @@
+import contextvars
+import logging
+import re
+import threading
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import dspy
+from pydantic import BaseModel
+
+from chunking import estimate_tokens
+from redactor import IdentifyPII, PIIEntity, PIIEntitySpan, PIIRedactor
+
+logger = logging.getLogger(__name__)
+
+DOC_MARKER = "[[DOC {}]]"
+_MARKER_RE = re.compile(r"\[\[DOC \d+\]\]")
+_stats_lock = threading.Lock()
+
+PACK_INSTRUCTIONS = (
+    "The input holds several independent documents, each introduced by a "
+    "[[DOC n]] marker line. Redact every document on its own, exactly as you "
+    "would a single text, and return one result per document in the same "
+    "order, with doc set to its n.\n\n"
+)
+
+
+class DocumentRedaction(BaseModel):
+    doc: int
+    entities: list[PIIEntity]
+    redacted_text: str
+
+
+class IdentifyPIIPacked(dspy.Signature):
+    documents: str = dspy.InputField(
+        desc="Documents that may contain PII, each introduced by a [[DOC n]] line"
+    )
+    results: list[DocumentRedaction] = dspy.OutputField(
+        desc="One entry per document, in order: its doc number, the PII entities "
+        "found in it and its text with each PII value replaced by [LABEL]"
+    )
+
+
+IdentifyPIIPacked = IdentifyPIIPacked.with_instructions(
+    PACK_INSTRUCTIONS + IdentifyPII.instructions
+)
+
+
+class DocumentEntities(BaseModel):
+    doc: int
+    entities: list[PIIEntitySpan]
+
+
+class IdentifyPIIEntitiesPacked(dspy.Signature):
+    documents: str = dspy.InputField(
+        desc="Documents that may contain PII, each introduced by a [[DOC n]] line"
+    )
+    results: list[DocumentEntities] = dspy.OutputField(
+        desc="One entry per document, in order: its doc number and the PII "
+        "entities found in it, copied verbatim from the document, with the "
+        "character offset in the document where each occurrence starts"
+    )
+
+
+class PackError(ValueError):
+    """A packed response does not line up with the documents sent."""
+
+
+def pack_texts(
+    texts: list[str], max_tokens: int = 800, max_docs: int = 16
+) -> list[list[int]]:
+    """Greedily group consecutive text indices into packs within max_tokens.
+
+    A text over the budget, or one that contains a [[DOC n]] marker itself,
+    gets a pack of its own (and is then redacted by a plain single call).
+    """
+    packs: list[list[int]] = []
+    current: list[int] = []
+    used = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text) + 4
+        alone = tokens > max_tokens or _MARKER_RE.search(text)
+        if current and (
+            alone or used + tokens > max_tokens or len(current) >= max_docs
+        ):
+            packs.append(current)
+            current, used = [], 0
+        if alone:
+            packs.append([i])
+            continue
+        current.append(i)
+        used += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+def format_pack(texts: list[str]) -> str:
+    return "\n\n".join(f"{DOC_MARKER.format(i)}\n{t}" for i, t in enumerate(texts, 1))
+
+
+def split_pack(pred: dspy.Prediction, count: int) -> list[dspy.Prediction]:
+    """Per-document predictions from a packed response, or PackError."""
+    results = list(pred.results or [])
+    if sorted(r.doc for r in results) != list(range(1, count + 1)):
+        raise PackError(f"expected docs 1..{count}, got {[r.doc for r in results]}")
+    return [
+        dspy.Prediction(
+            entities=r.entities, redacted_text=getattr(r, "redacted_text", None)
+        )
+        for r in sorted(results, key=lambda r: r.doc)
+    ]
+
+
+def _postprocessor(
+    program: dspy.Module,
+) -> Callable[[str, dspy.Prediction], dspy.Prediction]:
+    """What program does to a model prediction, as a function of (text, pred).
+
+    A packed call replaces the program's own model call, so its
+    post-processing has to run on each split prediction instead: for
+    PIIRedactor, rebuilding redacted_text from entities in entities-only
+    mode; for ValidatedRedactor, the local check and repair.  Wrappers that
+    change how the model is called (rule prefilter, cache, chunking,
+    cascade, ...) cannot apply per document and raise ValueError.
+    """
+    from validation import ValidatedRedactor
+
+    if isinstance(program, ValidatedRedactor):
+        inner = _postprocessor(program.program)
+        return lambda text, pred: program._check(text, inner(text, pred))
+    if isinstance(program, PIIRedactor):
+        if program.strategy == "two_step" and not program.entities_only:
+            raise ValueError("the two_step strategy cannot be packed")
+        return program._finish
+    if isinstance(program, dspy.Module) and "program" in vars(program):
+        raise ValueError(
+            f"{type(program).__name__} cannot run on packed predictions; "
+            "pack a PIIRedactor, optionally inside a ValidatedRedactor"
+        )
+    return lambda text, pred: pred
+
+
+class PackedRedactor(dspy.Module):
+    """Redact several short texts per LLM call.
+
+    redact_batch() packs texts into prompts of at most max_tokens with the
+    IdentifyPIIPacked signature, so the fixed instruction overhead is paid
+    once per pack, then splits the response back per document.  A pack whose
+    call fails for any reason (unparseable response, wrong result count,
+    transport error) falls back to single calls through the wrapped program.
+    Called on one text it behaves exactly like the wrapped program.
+
+    The packed signature carries the wrapped program's own instructions
+    (e.g. GEPA-optimized ones), after the packing preamble.  An entities-only
+    PIIRedactor gets a packed signature that asks for entities only, and
+    each split prediction goes through the program's post-processing (see
+    _postprocessor), so packed and single results match in kind.
+    """
+
+    def __init__(
+        self,
+        program: dspy.Module,
+        max_tokens: int = 800,
+        max_docs: int = 16,
+        num_threads: int = 8,
+    ) -> None:
+        super().__init__()
+        self.program = program
+        self._finish = _postprocessor(program)
+        signature = (
+            IdentifyPIIEntitiesPacked
+            if isinstance(program, PIIRedactor) and program.entities_only
+            else IdentifyPIIPacked
+        )
+        self.packed = dspy.ChainOfThought(
+            signature.with_instructions(
+                PACK_INSTRUCTIONS + _program_instructions(program)
+            )
+        )
+        self.max_tokens = max_tokens
+        self.max_docs = max_docs
+        self.num_threads = num_threads
+        self.packs = 0
+        self.fallbacks = 0
+
+    def forward(self, text: str) -> dspy.Prediction:
+        return self.program(text=text)
+
+    def _single(self, text: str) -> dspy.Prediction | Exception:
+        try:
+            return self.program(text=text)
+        except Exception as e:
+            logger.warning("Single call failed: %s", e)
+            return e
+
+    def _run_pack(self, texts: list[str]) -> list[dspy.Prediction | Exception]:
+        """Predictions for one pack; an item that fails holds its exception."""
+        if len(texts) == 1:
+            return [self._single(texts[0])]
+        try:
+            preds = split_pack(self.packed(documents=format_pack(texts)), len(texts))
+            preds = [self._finish(t, p) for t, p in zip(texts, preds, strict=True)]
+            with _stats_lock:
+                self.packs += 1
+            return preds
+        except Exception as e:
+            with _stats_lock:
+                self.fallbacks += 1
+            logger.warning(
+                "Packed call for %d texts failed (%s); falling back to single calls",
+                len(texts),
+                e,
+            )
+            return [self._single(t) for t in texts]
+
+    def redact_as_completed(
+        self, texts: list[str]
+    ) -> Iterator[tuple[int, dspy.Prediction | Exception]]:
+        """Yield (index, prediction) as each pack finishes; an item whose call
+        failed yields its exception.  Closing the iterator early cancels the
+        packs not yet started."""
+        packs = pack_texts(texts, self.max_tokens, self.max_docs)
+        logger.debug("Packed %d texts into %d calls", len(texts), len(packs))
+        pool = ThreadPoolExecutor(max_workers=self.num_threads)
+        try:
+            futures = {
+                pool.submit(
+                    contextvars.copy_context().run,
+                    self._run_pack,
+                    [texts[i] for i in pack],
+                ): pack
+                for pack in packs
+            }
+            for future in as_completed(futures):
+                yield from zip(futures[future], future.result(), strict=True)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def redact_batch(
+        self, texts: list[str], return_exceptions: bool = False
+    ) -> list[dspy.Prediction | Exception]:
+        """Predictions for texts, in input order.
+
+        A text whose call failed raises its error once every pack is done,
+        or, with return_exceptions=True, is returned as the exception.
+        """
+        results: list[dspy.Prediction | Exception | None] = [None] * len(texts)
+        for i, pred in self.redact_as_completed(texts):
+            results[i] = pred
+        if not return_exceptions:
+            for pred in results:
+                if isinstance(pred, Exception):
+                    raise pred
+        return results
+
+
+def _program_instructions(program: dspy.Module) -> str:
+    """Instructions of the program's first predictor, else IdentifyPII's."""
+    for _, predictor in program.named_predictors():
+        return predictor.signature.instructions
+    return IdentifyPII.instructions
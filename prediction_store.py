@@ -0,0 +1,88 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+STORE_PATH = "./cache/predictions.sqlite"
+# Row ids per IN (...) query; stays under SQLite's bound-parameter limit.
+_QUERY_CHUNK = 500
+
+
+class PredictionStore:
+    """Evaluation predictions keyed by (program hash, model, dataset row id).
+
+    evaluate() looks predictions up here before calling the LM, so changing
+    only the model or the program re-runs only the affected combinations,
+    and rescore() can apply an updated metric to stored predictions without
+    any LM calls.  Scores are deliberately not stored: they are always
+    recomputed with the current pii_metric.
+    """
+
+    def __init__(self, path: str = STORE_PATH) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "program TEXT, model TEXT, row_id INTEGER, prediction TEXT, "
+            "cost REAL, latency REAL, output_tokens INTEGER, created REAL, "
+            "PRIMARY KEY (program, model, row_id))"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def get_many(
+        self, program: str, model: str, row_ids: Iterable[int]
+    ) -> dict[int, dict[str, Any]]:
+        """Stored predictions for the given rows, as {row_id: prediction}.
+
+        Rows are looked up in chunks of _QUERY_CHUNK ids so the primary key
+        is used instead of scanning every prediction for (program, model).
+        """
+        ids = list(dict.fromkeys(row_ids))
+        found: dict[int, dict[str, Any]] = {}
+        with self._lock:
+            for start in range(0, len(ids), _QUERY_CHUNK):
+                chunk = ids[start : start + _QUERY_CHUNK]
+                marks = ", ".join("?" * len(chunk))
+                rows = self._db.execute(
+                    "SELECT row_id, prediction FROM predictions "
+                    f"WHERE program = ? AND model = ? AND row_id IN ({marks})",
+                    (program, model, *chunk),
+                ).fetchall()
+                found.update((row_id, json.loads(p)) for row_id, p in rows)
+        return found
+
+    def put(
+        self,
+        program: str,
+        model: str,
+        row_id: int,
+        prediction: dict[str, Any],
+        cost: float | None = None,
+        latency: float | None = None,
+        output_tokens: int | None = None,
+    ) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    program,
+                    model,
+                    row_id,
+                    json.dumps(prediction),
+                    cost,
+                    latency,
+                    output_tokens,
+                    time.time(),
+                ),
+            )
+            self._db.commit()
+
+    def close(self) -> None:
+        self._db.close()
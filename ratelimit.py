@@ -0,0 +1,329 @@
+import asyncio
+import functools
+import logging
+import math
+import os
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+import dspy
+from dspy.utils.exceptions import LMRateLimitError, is_retryable_lm_error
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Multiplicative decreases are spaced out so one burst of 429s from calls
+# that were already in flight halves the limit once, not once per call.
+DECREASE_INTERVAL = 1.0
+
+
+class TokenBucket:
+    """Refills at per_minute units per minute, holding at most one minute's worth.
+
+    Not thread-safe; LMScheduler serialises access.  take() may drive the
+    level negative (debt), which later waits pay back.
+    """
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.level = per_minute
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (capped at a full bucket)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+
+@dataclass(frozen=True)
+class SchedulerStats:
+    in_flight: int
+    queue_depth: int
+    limit: float
+    throttle_events: int
+    retries: int
+    completed: int
+
+
+def is_rate_limit(exc: BaseException) -> bool:
+    """Whether exc (or its cause) is a provider 429."""
+    while exc is not None:
+        if isinstance(exc, LMRateLimitError):
+            return True
+        if 429 in (getattr(exc, "status", None), getattr(exc, "status_code", None)):
+            return True
+        exc = exc.__cause__
+    return False
+
+
+class LMScheduler:
+    """Admission control for LM calls: rate limits plus adaptive concurrency.
+
+    Each call waits until fewer than limit calls are in flight and the
+    requests/min and tokens/min buckets (rpm, tpm; None = unlimited) can pay
+    for it.  limit follows AIMD: every success adds 1/limit (about +1 per
+    round of calls) up to max_concurrency, while a 429, or a success slower
+    than latency_target seconds, cuts it (by half for a 429, by 10% for
+    latency) down to min_concurrency.  A 429 also pauses new admissions for
+    its retry_after (or an exponential backoff) and the call is retried, as
+    are other transient errors, up to max_retries times.
+
+    One scheduler is shared by every LM of a model in the process (see
+    scheduler_for), so redact, evaluate and optimize traffic are paced
+    together.
+    """
+
+    def __init__(
+        self,
+        rpm: float | None = None,
+        tpm: float | None = None,
+        max_concurrency: int = 32,
+        initial_concurrency: int = 8,
+        min_concurrency: int = 1,
+        latency_target: float | None = None,
+        max_retries: int = 6,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.requests = TokenBucket(rpm, clock) if rpm else None
+        self.tokens = TokenBucket(tpm, clock) if tpm else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(min(initial_concurrency, max_concurrency))
+        self.latency_target = latency_target
+        self.max_retries = max_retries
+        self._clock = clock
+        self._sleep = sleep
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._paused_until = 0.0
+        self._last_decrease = -math.inf
+        self.throttle_events = 0
+        self.retries = 0
+        self.completed = 0
+
+    @classmethod
+    def from_env(cls) -> "LMScheduler":
+        """Limits from LM_RPM, LM_TPM, LM_MAX_CONCURRENCY, LM_LATENCY_TARGET."""
+
+        def number(name: str) -> float | None:
+            value = os.environ.get(name)
+            return float(value) if value else None
+
+        return cls(
+            rpm=number("LM_RPM"),
+            tpm=number("LM_TPM"),
+            max_concurrency=int(os.environ.get("LM_MAX_CONCURRENCY", "32")),
+            latency_target=number("LM_LATENCY_TARGET"),
+        )
+
+    def __deepcopy__(self, memo: dict) -> "LMScheduler":
+        # Shared by design: copies of an LM or program keep pacing together.
+        return self
+
+    def stats(self) -> SchedulerStats:
+        with self._cond:
+            return SchedulerStats(
+                in_flight=self._in_flight,
+                queue_depth=self._waiting,
+                limit=round(self.limit, 2),
+                throttle_events=self.throttle_events,
+                retries=self.retries,
+                completed=self.completed,
+            )
+
+    def _delay(self, tokens: float) -> float:
+        """Seconds to wait before admitting a call (0: admit now); lock held."""
+        if self._in_flight >= int(self.limit):
+            return math.inf
+        delay = self._paused_until - self._clock()
+        if self.requests is not None:
+            delay = max(delay, self.requests.wait_time(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.wait_time(tokens))
+        return max(0.0, delay)
+
+    def _admit(self, tokens: float) -> None:
+        self._in_flight += 1
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+    def _acquire(self, tokens: float) -> None:
+        with self._cond:
+            self._waiting += 1
+            try:
+                while (delay := self._delay(tokens)) > 0:
+                    self._cond.wait(None if delay == math.inf else delay)
+            finally:
+                self._waiting -= 1
+            self._admit(tokens)
+
+    async def _aacquire(self, tokens: float) -> None:
+        # The event loop must not block on the condition, so poll instead.
+        with self._cond:
+            self._waiting += 1
+        try:
+            while True:
+                with self._cond:
+                    delay = self._delay(tokens)
+                    if delay == 0:
+                        self._admit(tokens)
+                        return
+                await asyncio.sleep(min(delay, 0.05))
+        finally:
+            with self._cond:
+                self._waiting -= 1
+
+    def charge(self, tokens: float) -> None:
+        """Add tokens used beyond the estimate paid at admission."""
+        if self.tokens is not None and tokens > 0:
+            with self._cond:
+                self.tokens.take(tokens)
+
+    def _decrease(self, factor: float) -> None:
+        now = self._clock()
+        if now - self._last_decrease >= DECREASE_INTERVAL:
+            self.limit = max(self.min_concurrency, self.limit * factor)
+            self._last_decrease = now
+
+    def _release(self, latency: float | None, error: BaseException | None) -> float:
+        """Update the limit for a finished call; returns the retry delay."""
+        with self._cond:
+            self._in_flight -= 1
+            delay = 0.0
+            if error is None:
+                self.completed += 1
+                if self.latency_target and latency > self.latency_target:
+                    self._decrease(0.9)
+                else:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            elif is_rate_limit(error):
+                self.throttle_events += 1
+                self._decrease(0.5)
+                delay = getattr(error, "retry_after", None) or 2 ** min(
+                    self.throttle_events, 5
+                )
+                self._paused_until = max(self._paused_until, self._clock() + delay)
+                logger.warning(
+                    "Rate limited; concurrency limit now %.1f, pausing %.1fs",
+                    self.limit,
+                    delay,
+                )
+            self._cond.notify_all()
+            return delay
+
+    def _should_retry(self, error: BaseException, attempt: int) -> bool:
+        if attempt >= self.max_retries or not (
+            is_rate_limit(error) or is_retryable_lm_error(error)
+        ):
+            return False
+        with self._cond:
+            self.retries += 1
+        return True
+
+    def run(self, fn: Callable[[], T], tokens: float = 0) -> T:
+        """Call fn once admitted, retrying rate-limited and transient failures."""
+        for attempt in range(self.max_retries + 1):
+            self._acquire(tokens)
+            start = self._clock()
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._release(None, e)
+                if not self._should_retry(e, attempt):
+                    raise
+                # a 429 pauses admission for everyone; others back off alone
+                if not delay:
+                    self._sleep(min(2**attempt, 30))
+                continue
+            self._release(self._clock() - start, None)
+            return result
+        raise AssertionError("unreachable")
+
+    async def arun(self, fn: Callable[[], Awaitable[T]], tokens: float = 0) -> T:
+        """Async run(): waits with asyncio.sleep instead of blocking the loop."""
+        for attempt in range(self.max_retries + 1):
+            await self._aacquire(tokens)
+            start = self._clock()
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._release(None, e)
+                if not self._should_retry(e, attempt):
+                    raise
+                if not delay:
+                    await asyncio.sleep(min(2**attempt, 30))
+                continue
+            self._release(self._clock() - start, None)
+            return result
+        raise AssertionError("unreachable")
+
+
+_schedulers: dict[str, LMScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def scheduler_for(model: str) -> LMScheduler:
+    """The process-wide scheduler for model, built from the environment."""
+    with _schedulers_lock:
+        if model not in _schedulers:
+            _schedulers[model] = LMScheduler.from_env()
+        return _schedulers[model]
+
+
+def _estimate_tokens(value: Any) -> int:
+    """Rough token count (~4 characters per token) of prompts or outputs."""
+    if isinstance(value, str):
+        return len(value) // 4
+    if isinstance(value, dict):
+        return sum(_estimate_tokens(v) for v in value.values())
+    if isinstance(value, list | tuple):
+        return sum(_estimate_tokens(v) for v in value)
+    return 0
+
+
+class ScheduledLM(dspy.LM):
+    """dspy.LM whose calls are admitted, paced and retried by an LMScheduler.
+
+    Retries belong to the scheduler (so a 429 also slows every other call
+    sharing it), so num_retries defaults to 0.  The prompt's estimated
+    tokens are paid at admission and the output's after the call.
+    """
+
+    def __init__(
+        self, model: str, scheduler: LMScheduler | None = None, **kwargs: Any
+    ) -> None:
+        kwargs.setdefault("num_retries", 0)
+        super().__init__(model, **kwargs)
+        self.scheduler = scheduler or scheduler_for(model)
+
+    def __call__(self, prompt=None, *, messages=None, **kwargs):
+        call = functools.partial(super().__call__, prompt, messages=messages, **kwargs)
+        outputs = self.scheduler.run(call, _estimate_tokens([prompt, messages]))
+        self.scheduler.charge(_estimate_tokens(outputs))
+        return outputs
+
+    async def acall(self, prompt=None, *, messages=None, **kwargs):
+        call = functools.partial(super().acall, prompt, messages=messages, **kwargs)
+        outputs = await self.scheduler.arun(call, _estimate_tokens([prompt, messages]))
+        self.scheduler.charge(_estimate_tokens(outputs))
+        return outputs
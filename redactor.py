@@ -1,3 +1,9 @@
+import hashlib
+import json
+import re
+from collections.abc import Iterable
+from typing import Any
+
 import dspy
 from pydantic import BaseModel
 
@@ -7,6 +13,10 @@ class PIIEntity(BaseModel):
     label: str
 
 
+class PIIEntitySpan(PIIEntity):
+    start: int | None = None
+
+
 class IdentifyPII(dspy.Signature):
     """Identify all PII entities in the text and produce a redacted version.
 
@@ -29,13 +39,247 @@ class IdentifyPII(dspy.Signature):
     )
 
 
+class IdentifyPIIEntities(dspy.Signature):
+    """Identify all PII entities in the text.
+
+    Use these labels (from ai4privacy/pii-masking-300k):
+    Names: GIVENNAME1, GIVENNAME2, LASTNAME1, LASTNAME2, LASTNAME3, TITLE
+    Contact: TEL, EMAIL, USERNAME
+    IDs: SOCIALNUMBER, IDCARD, DRIVERLICENSE, PASSPORT
+    Location: STREET, BUILDING, CITY, STATE, POSTCODE, COUNTRY, SECADDRESS, GEOCOORD
+    Personal: SEX, BOD, PASS
+    Digital: IP
+    Time: DATE, TIME
+    """
+
+    text: str = dspy.InputField(desc="Text that may contain PII")
+    entities: list[PIIEntitySpan] = dspy.OutputField(
+        desc="All PII entities found with their labels, copied verbatim from the "
+        "text, with the character offset where each occurrence starts"
+    )
+
+
+class RedactPIIEntities(dspy.Signature):
+    """Produce a redacted version of the text, given the PII entities found in it.
+
+    Replace each listed entity value with its [LABEL] placeholder, and any
+    other PII you find with the matching label from the same set.
+    """
+
+    text: str = dspy.InputField(desc="Text that may contain PII")
+    entities: list[PIIEntitySpan] = dspy.InputField(
+        desc="PII entities already found in the text"
+    )
+    redacted_text: str = dspy.OutputField(
+        desc="Text with each PII value replaced by [LABEL]",
+    )
+
+
+# Module strategies for PIIRedactor: reason-then-answer, answer directly, or
+# find entities first and redact the text in a second call.
+STRATEGIES = ("cot", "predict", "two_step")
+
+
+def as_entity_span(entity: PIIEntity | dict[str, Any]) -> PIIEntitySpan:
+    """Normalise a model entity or demo dict to a PIIEntitySpan."""
+    if isinstance(entity, dict):
+        return PIIEntitySpan.model_validate(entity)
+    return PIIEntitySpan(
+        value=entity.value, label=entity.label, start=getattr(entity, "start", None)
+    )
+
+
+def prediction_dict(pred: dspy.Prediction) -> dict[str, Any]:
+    """JSON-ready {"entities", "redacted_text"} for a redaction prediction."""
+    entities = [
+        e.model_dump() if hasattr(e, "model_dump") else dict(e)
+        for e in pred.entities or []
+    ]
+    return {"entities": entities, "redacted_text": pred.redacted_text}
+
+
+def _value_pattern(value: str) -> re.Pattern:
+    """Match value verbatim, without cutting into neighbouring words."""
+    prefix = r"(?<!\w)" if re.match(r"\w", value) else ""
+    suffix = r"(?!\w)" if re.search(r"\w$", value) else ""
+    return re.compile(prefix + re.escape(value) + suffix)
+
+
+_PLACEHOLDER_RE = re.compile(r"\[([A-Z]+\d*)\]")
+
+
+def align_placeholders(text: str, redacted: str) -> list[tuple[int, int, str]] | None:
+    """Spans of text that redacted's [LABEL] placeholders stand for.
+
+    Returns (start, end, label) per placeholder, in order, if redacted is
+    text (both stripped) with some non-empty spans replaced; else None.
+    Each literal segment is found left to right with str.find, the
+    leftmost choice that can still complete, so this is linear in the text.
+    """
+    offset = len(text) - len(text.lstrip())
+    body = text.strip()
+    parts = _PLACEHOLDER_RE.split(redacted.strip())
+    literals, labels = parts[::2], parts[1::2]
+    if not labels:
+        return [] if body == literals[0] else None
+    head, tail = literals[0], literals[-1]
+    if not body.startswith(head) or not body.endswith(tail):
+        return None
+    limit = len(body) - len(tail)
+    pos = len(head)
+    spans = []
+    for label, literal in zip(labels[:-1], literals[1:-1], strict=True):
+        found = body.find(literal, pos + 1, limit)
+        if found == -1:
+            return None
+        spans.append((pos + offset, found + offset, label))
+        pos = found + len(literal)
+    if limit <= pos:
+        return None
+    spans.append((pos + offset, limit + offset, labels[-1]))
+    return spans
+
+
+def apply_entities(text: str, entities: Iterable[PIIEntity | dict[str, Any]]) -> str:
+    """Rebuild a redacted string by replacing entity spans with [LABEL].
+
+    Offsets that point at the entity value are used first; every other
+    occurrence of each value is then found by search (longest values first,
+    so "John Smith" wins over "John"), so no listed value survives even when
+    the model's offsets are missing or wrong.
+    """
+    spans: list[tuple[int, int, str]] = []
+
+    def claim(start: int, end: int, label: str) -> None:
+        if not any(s < end and start < e for s, e, _ in spans):
+            spans.append((start, end, label))
+
+    items = [as_entity_span(e) for e in entities if e]
+    items = [e for e in items if e.value.strip()]
+    for e in items:
+        if e.start is not None and text[e.start : e.start + len(e.value)] == e.value:
+            claim(e.start, e.start + len(e.value), e.label)
+    for e in sorted(items, key=lambda e: len(e.value), reverse=True):
+        for m in _value_pattern(e.value).finditer(text):
+            claim(m.start(), m.end(), e.label)
+
+    parts: list[str] = []
+    pos = 0
+    for start, end, label in sorted(spans):
+        parts.append(text[pos:start])
+        parts.append(f"[{label}]")
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def program_hash(program: dspy.Module) -> str:
+    """Stable hash of a program's learnable state (instructions and demos).
+
+    Only predictor states are hashed, in order, so wrapping a program (rule
+    prefilter, chunking, caching) does not change its hash.
+    """
+    states = [p.dump_state() for _, p in program.named_predictors()]
+    blob = json.dumps(states, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
 class PIIRedactor(dspy.Module):
-    def __init__(self) -> None:
+    """PII redactor with the curated few-shot demos.
+
+    strategy picks the module (see STRATEGIES): "cot" (the default) is
+    ChainOfThought, which writes a reasoning field before answering;
+    "predict" answers directly, saving those output tokens; "two_step" asks
+    for the entity list first (IdentifyPIIEntities) and then for the
+    redacted text given those entities (RedactPIIEntities).
+
+    With entities_only=True the model is asked for the entity list only
+    (IdentifyPIIEntities) and redacted_text is rebuilt locally with
+    apply_entities(), which roughly halves output tokens on long texts
+    (for "two_step" this drops the second call).
+
+    With demo_k set, each call sends only the demo_k most similar demos (plus
+    label-coverage fillers) chosen by demos.DemoSelector.  The pool is the
+    predictor's own demos when a loaded program has them, else EXAMPLES.
+    """
+
+    def __init__(
+        self,
+        entities_only: bool = False,
+        demo_k: int | None = None,
+        strategy: str = "cot",
+    ) -> None:
         super().__init__()
         from examples import EXAMPLES
 
-        self.cot = dspy.ChainOfThought(IdentifyPII)
-        self.cot.demos = EXAMPLES
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of {STRATEGIES}, got {strategy!r}")
+        self.entities_only = entities_only
+        self.demo_k = demo_k
+        self.strategy = strategy
+        entities_first = entities_only or strategy == "two_step"
+        signature = IdentifyPIIEntities if entities_first else IdentifyPII
+        if strategy == "cot":
+            self.cot = dspy.ChainOfThought(signature)
+            self.cot.demos = EXAMPLES
+        else:
+            self.identify = dspy.Predict(signature)
+            if strategy == "two_step" and not entities_only:
+                self.rewrite = dspy.Predict(RedactPIIEntities)
+        self._examples = EXAMPLES
+        self._selector = None
+        self._selector_pool = None
+
+    @property
+    def _first(self) -> dspy.Module:
+        """The module that sees the text first (and the demos)."""
+        return self.cot if self.strategy == "cot" else self.identify
+
+    @property
+    def demo_selector(self):
+        """DemoSelector over the current demo pool, rebuilt if the pool changes."""
+        from demos import DemoSelector, as_demo_list
+
+        # What the predictor sends without selection: its own demos (none
+        # for a base program; cot.demos sits on the wrapper and is not sent).
+        sent = self.cot.predict.demos if self.strategy == "cot" else self.identify.demos
+        pool = sent or (self.cot.demos if self.strategy == "cot" else self._examples)
+        if self._selector is None or self._selector_pool is not pool:
+            self._selector = DemoSelector(
+                as_demo_list(pool), k=self.demo_k, baseline=as_demo_list(sent)
+            )
+            self._selector_pool = pool
+        return self._selector
+
+    def _inputs(self, text: str) -> dict[str, Any]:
+        if self.demo_k is None:
+            return {"text": text}
+        return {"text": text, "demos": self.demo_selector.select(text)}
+
+    def _finish(self, text: str, pred: dspy.Prediction) -> dspy.Prediction:
+        if not self.entities_only:
+            return pred
+        entities = pred.entities or []
+        return dspy.Prediction(
+            entities=entities, redacted_text=apply_entities(text, entities)
+        )
 
     def forward(self, text: str) -> dspy.Prediction:
-        return self.cot(text=text)
+        pred = self._first(**self._inputs(text))
+        if self.strategy == "two_step" and not self.entities_only:
+            entities = pred.entities or []
+            rewritten = self.rewrite(text=text, entities=entities)
+            return dspy.Prediction(
+                entities=entities, redacted_text=rewritten.redacted_text
+            )
+        return self._finish(text, pred)
+
+    async def aforward(self, text: str) -> dspy.Prediction:
+        pred = await self._first.acall(**self._inputs(text))
+        if self.strategy == "two_step" and not self.entities_only:
+            entities = pred.entities or []
+            rewritten = await self.rewrite.acall(text=text, entities=entities)
+            return dspy.Prediction(
+                entities=entities, redacted_text=rewritten.redacted_text
+            )
+        return self._finish(text, pred)
@@ -0,0 +1,328 @@
+import ipaddress
+import logging
+import re
+import threading
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+import dspy
+
+from redactor import PIIEntity
+
+logger = logging.getLogger(__name__)
+
+_MONTHS = (
+    r"(?:Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?"
+    r"|Aug(?:ust)?|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)"
+)
+
+
+def luhn_valid(number: str) -> bool:
+    """Luhn checksum over the digits of number (separators ignored)."""
+    digits = [int(c) for c in number if c.isdigit()]
+    if len(digits) < 2:
+        return False
+    total = 0
+    for i, d in enumerate(reversed(digits)):
+        if i % 2 == 1:
+            d *= 2
+            if d > 9:
+                d -= 9
+        total += d
+    return total % 10 == 0
+
+
+def _valid_ip(value: str) -> bool:
+    try:
+        ipaddress.ip_address(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _valid_ssn(value: str) -> bool:
+    """US SSN: area not 000/666/9xx, group not 00, serial not 0000."""
+    area, group, serial = value.split("-")
+    return (
+        area not in ("000", "666")
+        and area[0] != "9"
+        and group != "00"
+        and serial != "0000"
+    )
+
+
+def _valid_geocoord(value: str) -> bool:
+    lat, lon = (float(part) for part in re.findall(r"-?\d+\.\d+", value))
+    return abs(lat) <= 90 and abs(lon) <= 180
+
+
+def _valid_date(value: str) -> bool:
+    """Day 1-31 and month 1-12, in whichever order the format puts them."""
+    parts = re.findall(r"\d+", value)
+    nums = [int(n) for n in parts]
+    if any(c.isalpha() for c in value):
+        # "23rd June 1958" / "June 23, 1958": only the day is numeric
+        return 1 <= nums[0] <= 31
+    if len(parts[0]) == 4:  # ISO yyyy-mm-dd
+        return 1 <= nums[1] <= 12 and 1 <= nums[2] <= 31
+    a, b = nums[0], nums[1]
+    return 1 <= a <= 31 and 1 <= b <= 31 and min(a, b) <= 12
+
+
+# National numbers must look like a phone number: North American 3-3-4
+# ("(555) 123-4567") or a trunk 0 followed by separated groups ("020 7946 0958").
+_NATIONAL_TEL_RE = re.compile(
+    r"\(?\d{3}\)?[ -]?\d{3}[ -]\d{4}|\(?0\d{1,4}\)?(?:[ -]?\d{2,4}){1,4}"
+)
+
+
+def _valid_tel(value: str) -> bool:
+    """International (+/00) numbers of 8-15 digits, or 10-15 digit national
+    numbers in a phone-like layout (see _NATIONAL_TEL_RE); bare digit runs
+    ("Order 12345678") and other groupings ("room 101 202 303 404") are left
+    to the model.
+    """
+    digits = sum(c.isdigit() for c in value)
+    if value.startswith(("+", "00")):
+        return 8 <= digits <= 15
+    return (
+        10 <= digits <= 15
+        and any(c in " ()-" for c in value)
+        and _NATIONAL_TEL_RE.fullmatch(value) is not None
+    )
+
+
+@dataclass(frozen=True)
+class Rule:
+    label: str
+    pattern: re.Pattern
+    validate: Callable[[str], bool] | None = None
+
+
+# Ordered by priority: when two rules match overlapping spans the earlier
+# rule wins (e.g. an IPv6 address is never split into TIME matches).
+RULES: list[Rule] = [
+    Rule("EMAIL", re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)*\.[A-Za-z]{2,}\b")),
+    Rule(
+        "IP",
+        re.compile(
+            r"(?<![\w.:])(?:\d{1,3}(?:\.\d{1,3}){3}|[0-9a-fA-F]{0,4}(?::[0-9a-fA-F]{0,4}){2,7})(?![\w.:])"
+        ),
+        _valid_ip,
+    ),
+    Rule(
+        "GEOCOORD",
+        # Bracketed pairs, or bare pairs with >= 4 decimals ("3.50, 1.25" is
+        # a price list, not a location)
+        re.compile(
+            r"\[-?\d{1,2}\.\d+,\s*-?\d{1,3}\.\d+\]"
+            r"|(?<![\w.])-?\d{1,2}\.\d{4,},\s*-?\d{1,3}\.\d{4,}(?!\w|\.\d)"
+        ),
+        _valid_geocoord,
+    ),
+    Rule(
+        "SOCIALNUMBER", re.compile(r"(?<![\w-])\d{3}-\d{2}-\d{4}(?![\w-])"), _valid_ssn
+    ),
+    # Canadian SIN (3-3-3 digits) carries a Luhn check digit
+    Rule(
+        "SOCIALNUMBER",
+        re.compile(r"(?<![\w-])\d{3}[ -]\d{3}[ -]\d{3}(?![\w-])"),
+        luhn_valid,
+    ),
+    # Dotted dates need a 4-digit year so versions ("1.2.10") do not match
+    Rule(
+        "DATE",
+        re.compile(
+            r"(?<![\w.])(?:\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{2,4}"
+            r"|\d{1,2}\.\d{1,2}\.\d{4}"
+            rf"|\d{{1,2}}(?:st|nd|rd|th)?\s+{_MONTHS}\s+\d{{4}}"
+            rf"|{_MONTHS}\s+\d{{1,2}}(?:st|nd|rd|th)?,?\s+\d{{4}})(?!\w|\.\d)"
+        ),
+        _valid_date,
+    ),
+    Rule(
+        "TIME",
+        re.compile(
+            r"(?<![\w:])(?:[01]?\d|2[0-3]):[0-5]\d(?::[0-5]\d)?(?:\s?[AaPp]\.?[Mm]\.?)?(?![\w:])"
+            r"|\b(?:1[0-2]|0?[1-9])\s?[AaPp]\.?[Mm]\b\.?"
+        ),
+    ),
+    Rule(
+        "POSTCODE",
+        re.compile(
+            r"\b(?:[A-Z]{1,2}\d[A-Z\d]?\s?\d[A-Z]{2}"  # UK
+            r"|\d{5}-\d{4})\b"  # US ZIP+4
+        ),
+    ),
+    Rule(
+        "TEL",
+        re.compile(r"(?<![\w+.])(?:\+|00)?\(?\d[\d ()-]{6,}\d(?!\w|\.\d)"),
+        _valid_tel,
+    ),
+]
+
+# Cheap keyword cues per label.  _residual_is_clean uses those of labels the
+# rules cannot see; demos.cue_labels adds a demo covering any cued label the
+# top-k demos missed.
+LABEL_CUES: dict[str, tuple[str, ...]] = {
+    "USERNAME": ("username", "user name", "handle", "login"),
+    "PASS": ("password", "passcode", "pwd"),
+    "PASSPORT": ("passport",),
+    "DRIVERLICENSE": ("driver", "licence", "license"),
+    "IDCARD": ("id card", "identity card", "card"),
+    "SOCIALNUMBER": ("social security", "ssn", "social number", "national insurance"),
+    "STREET": ("street", "road", "avenue", "lane", "address"),
+    "BUILDING": ("building", "apt", "flat", "house number"),
+    "SECADDRESS": ("suite", "apartment", "unit", "floor"),
+    "CITY": ("city",),
+    "STATE": ("state", "county", "province"),
+    "COUNTRY": ("country",),
+    "POSTCODE": ("postcode", "zip", "postal"),
+    "GEOCOORD": ("coordinates", "latitude", "longitude", "geo"),
+    "SEX": ("gender", "sex"),
+    "BOD": ("birth", "dob", "born"),
+    "TITLE": ("mr", "mrs", "ms", "dr", "prof", "title"),
+    "IP": ("ip", "server", "host"),
+    "TEL": ("phone", "tel", "mobile", "call"),
+    "EMAIL": ("email", "e-mail", "mail"),
+    "DATE": ("date", "deadline", "dated"),
+    "TIME": ("time", "am", "pm", "o'clock"),
+}
+
+_stats_lock = threading.Lock()
+_PLACEHOLDER_RE = re.compile(r"\[[A-Z]+\d*\]")
+_PRONOUN_I_RE = re.compile(r"I(?:'(?:m|d|ll|ve))?")
+_RULE_LABELS = frozenset(rule.label for rule in RULES)
+
+
+@dataclass
+class RuleResult:
+    """Rule-engine output for one text."""
+
+    redacted_text: str
+    entities: list[PIIEntity] = field(default_factory=list)
+    # True when nothing in the residual text looks like it could still be PII,
+    # so the LLM call can be skipped.
+    complete: bool = False
+
+
+def _residual_is_clean(text: str) -> bool:
+    """Heuristic: no digits, '@', capitalised words or PII keyword cues.
+
+    Names, cities, usernames and IDs all carry one of these signals; text
+    without any of them (e.g. "thanks, see you tomorrow") is safe to return
+    without asking the model.  Sentence-initial words count too, since a
+    sentence can start with a name ("John called."), and so do keyword cues
+    for labels the rules cannot see ("my password is hunter two").
+    """
+    residual = _PLACEHOLDER_RE.sub(" ", text)
+    if any(c.isdigit() for c in residual) or "@" in residual:
+        return False
+    words = re.findall(r"[^\W\d_][\w'.-]*", residual)
+    if any(w[0].isupper() and not _PRONOUN_I_RE.fullmatch(w) for w in words):
+        return False
+    lowered = residual.lower()
+    tokens = set(re.findall(r"[a-z0-9'-]+", lowered))
+    return not any(
+        (cue in tokens) if " " not in cue else (cue in lowered)
+        for label, cues in LABEL_CUES.items()
+        if label not in _RULE_LABELS
+        for cue in cues
+    )
+
+
+class RuleEngine:
+    """Compiled-regex detector for pattern-shaped PII labels."""
+
+    def __init__(self, rules: list[Rule] | None = None) -> None:
+        self.rules = RULES if rules is None else rules
+
+    def find(self, text: str) -> list[tuple[int, int, str]]:
+        """Return non-overlapping (start, end, label) spans, sorted by start."""
+        spans: list[tuple[int, int, str]] = []
+        for rule in self.rules:
+            for m in rule.pattern.finditer(text):
+                start, end = m.span()
+                if rule.validate is not None and not rule.validate(m.group()):
+                    continue
+                if any(s < end and start < e for s, e, _ in spans):
+                    continue
+                spans.append((start, end, rule.label))
+        return sorted(spans)
+
+    def apply(self, text: str) -> RuleResult:
+        """Replace every rule match with its [LABEL] placeholder."""
+        spans = self.find(text)
+        parts: list[str] = []
+        entities: list[PIIEntity] = []
+        pos = 0
+        for start, end, label in spans:
+            parts.append(text[pos:start])
+            parts.append(f"[{label}]")
+            entities.append(PIIEntity(value=text[start:end], label=label))
+            pos = end
+        parts.append(text[pos:])
+        redacted = "".join(parts)
+        return RuleResult(
+            redacted_text=redacted,
+            entities=entities,
+            complete=_residual_is_clean(redacted),
+        )
+
+
+class RulePrefilter(dspy.Module):
+    """Run the rule engine in front of a redaction program.
+
+    Pattern-shaped PII is replaced locally before the text reaches the LLM;
+    when the rule engine judges the remainder clean, the LLM call is skipped.
+    Rule entities are merged ahead of the model's entities in the result.
+    """
+
+    def __init__(self, program: dspy.Module, engine: RuleEngine | None = None) -> None:
+        super().__init__()
+        self.program = program
+        self.engine = engine or RuleEngine()
+        self.calls = 0
+        self.calls_avoided = 0
+
+    def _count(self, avoided: bool) -> None:
+        with _stats_lock:
+            self.calls += 1
+            if avoided:
+                self.calls_avoided += 1
+        if avoided:
+            logger.debug(
+                "Rule fast path skipped LLM call (%d/%d avoided)",
+                self.calls_avoided,
+                self.calls,
+            )
+
+    def forward(self, text: str) -> dspy.Prediction:
+        rules = self.engine.apply(text)
+        self._count(rules.complete)
+        if rules.complete:
+            return dspy.Prediction(
+                entities=rules.entities, redacted_text=rules.redacted_text
+            )
+        pred = self.program(text=rules.redacted_text)
+        return dspy.Prediction(
+            entities=rules.entities + list(pred.entities or []),
+            redacted_text=pred.redacted_text,
+        )
+
+    async def aforward(self, text: str) -> dspy.Prediction:
+        rules = self.engine.apply(text)
+        self._count(rules.complete)
+        if rules.complete:
+            return dspy.Prediction(
+                entities=rules.entities, redacted_text=rules.redacted_text
+            )
+        pred = await self.program.acall(text=rules.redacted_text)
+        return dspy.Prediction(
+            entities=rules.entities + list(pred.entities or []),
+            redacted_text=pred.redacted_text,
+        )
+
+    @property
+    def avoided_rate(self) -> float:
+        return self.calls_avoided / self.calls if self.calls else 0.0
@@ -0,0 +1,196 @@
+import re
+from collections.abc import Sequence
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Any
+
+import numpy as np
+
+from optimizer import CLASSIFICATION_WEIGHT, DETECTION_WEIGHT, PII_LABEL_RE
+
+_SEP = "\x00"
+# A [LABEL] placeholder or a text separator (matched as ""), so one findall
+# over the joined texts yields every label plus the example boundaries.
+_LABEL_OR_SEP_RE = re.compile(PII_LABEL_RE.pattern + "|" + _SEP)
+
+
+def _extract(texts: Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Every [LABEL] in texts and the index of the text it came from.
+
+    Uses a single regex pass over the joined texts, with no per-text loop.
+    """
+    joined = _SEP.join(texts)
+    if joined.count(_SEP) != len(texts) - 1:
+        joined = _SEP.join(t.replace(_SEP, " ") for t in texts)
+    found = np.array(_LABEL_OR_SEP_RE.findall(joined), dtype=str)
+    is_sep = found == ""
+    return found[~is_sep], np.cumsum(is_sep)[~is_sep]
+
+
+@dataclass
+class BatchScores:
+    """Hybrid PII scores for a whole set of gold/predicted redactions.
+
+    gold and pred are label x example count matrices over labels.  The
+    per-example arrays match pii_metric / score_pii exactly.
+    """
+
+    labels: list[str]
+    gold: np.ndarray
+    pred: np.ndarray
+    detection_recall: np.ndarray
+    classification_acc: np.ndarray
+    hybrid: np.ndarray
+
+    @property
+    def score(self) -> float:
+        """Mean hybrid score (0-1), as dspy.Evaluate would average pii_metric."""
+        return float(self.hybrid.mean()) if self.hybrid.size else 0.0
+
+    def label_table(self) -> list[dict[str, Any]]:
+        """Per-label gold/predicted/correct counts with recall and precision.
+
+        correct counts, per example, min(gold, predicted) occurrences of the
+        label, so recall is the share of gold items that got this exact label.
+        """
+        gold_n = self.gold.sum(axis=1)
+        pred_n = self.pred.sum(axis=1)
+        correct_n = np.minimum(self.gold, self.pred).sum(axis=1)
+        return [
+            {
+                "label": label,
+                "gold": int(g),
+                "pred": int(p),
+                "correct": int(c),
+                "recall": c / g if g else None,
+                "precision": c / p if p else None,
+            }
+            for label, g, p, c in zip(self.labels, gold_n, pred_n, correct_n)
+        ]
+
+    def confusion(self) -> np.ndarray:
+        """labels x (labels + MISSED) matrix of where gold items ended up.
+
+        The diagonal holds exact label matches.  Redacted text carries no
+        positions, so within one example unmatched gold labels are spread
+        over its unmatched predicted labels in proportion to their counts;
+        gold items beyond the example's predicted count go to MISSED.
+        """
+        matched = np.minimum(self.gold, self.pred)
+        extra_gold = self.gold - matched
+        extra_pred = self.pred - matched
+        gold_tot = extra_gold.sum(axis=0)
+        pred_tot = extra_pred.sum(axis=0)
+        share = extra_pred / np.maximum(np.maximum(gold_tot, pred_tot), 1)
+        table = extra_gold @ share.T
+        table[np.diag_indices_from(table)] += matched.sum(axis=1)
+        relabeled = np.minimum(gold_tot, pred_tot) / np.maximum(gold_tot, 1)
+        missed = (extra_gold * (1 - relabeled)).sum(axis=1)
+        return np.column_stack([table, missed])
+
+    def format_label_table(self) -> str:
+        confusion = self.confusion()
+        lines = [
+            f"{'label':<14}{'gold':>8}{'pred':>8}{'recall':>8}{'prec':>8}  "
+            "top confusions"
+        ]
+        columns = [*self.labels, "MISSED"]
+        for i, row in enumerate(self.label_table()):
+            off = [
+                (confusion[i, j], columns[j])
+                for j in np.argsort(-confusion[i])[:3]
+                if j != i and confusion[i, j] >= 0.5
+            ]
+            lines.append(
+                f"{row['label']:<14}{row['gold']:>8}{row['pred']:>8}"
+                f"{_pct(row['recall']):>8}{_pct(row['precision']):>8}  "
+                + ", ".join(f"{name} {n:.0f}" for n, name in off)
+            )
+        return "\n".join(lines)
+
+
+@dataclass(frozen=True)
+class ScoreInterval:
+    """Mean score and its confidence interval, all on the 0-100 scale."""
+
+    n: int
+    mean: float
+    low: float
+    high: float
+
+    @property
+    def width(self) -> float:
+        return self.high - self.low
+
+    def __str__(self) -> str:
+        return f"{self.mean:.2f} [{self.low:.2f}, {self.high:.2f}] (n={self.n})"
+
+
+def score_interval(scores: Sequence[float], confidence: float = 0.95) -> ScoreInterval:
+    """Normal-approximation confidence interval of the mean of 0-1 scores.
+
+    Uses the sample standard deviation; fewer than two scores give an
+    infinitely wide interval.
+    """
+    values = np.asarray(scores, dtype=float)
+    n = len(values)
+    mean = 100 * float(values.mean()) if n else 0.0
+    if n < 2:
+        return ScoreInterval(n, mean, -np.inf, np.inf)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    half = 100 * z * float(values.std(ddof=1)) / np.sqrt(n)
+    return ScoreInterval(n, mean, mean - half, mean + half)
+
+
+def _pct(value: float | None) -> str:
+    return "-" if value is None else f"{100 * value:.1f}"
+
+
+def score_batch(gold_texts: Sequence[str], pred_texts: Sequence[str]) -> BatchScores:
+    """Vectorized hybrid PII scoring of many gold/predicted redacted texts.
+
+    Labels are extracted with one regex pass per side and counted into
+    label x example matrices with NumPy; recall, accuracy and the hybrid
+    score are then computed for all examples at once (see score_pii for
+    the definitions).
+    """
+    if len(gold_texts) != len(pred_texts):
+        raise ValueError(
+            f"{len(gold_texts)} gold texts but {len(pred_texts)} predictions"
+        )
+    n = len(gold_texts)
+    gold_labels, gold_example = _extract(gold_texts) if n else ([], [])
+    pred_labels, pred_example = _extract(pred_texts) if n else ([], [])
+    labels, ids = np.unique(
+        np.concatenate([gold_labels, pred_labels]).astype(str), return_inverse=True
+    )
+    size = len(labels) * n
+
+    def counts(label_ids: np.ndarray, example: np.ndarray) -> np.ndarray:
+        flat = np.bincount(label_ids * n + example, minlength=size)
+        return flat.reshape(len(labels), n)
+
+    gold = counts(ids[: len(gold_labels)], np.asarray(gold_example, dtype=int))
+    pred = counts(ids[len(gold_labels) :], np.asarray(pred_example, dtype=int))
+
+    total_gold = gold.sum(axis=0)
+    total_pred = pred.sum(axis=0)
+    detected = np.minimum(total_gold, total_pred)
+    correct = np.minimum(gold, pred).sum(axis=0)
+    no_gold = total_gold == 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        recall = np.where(no_gold, 1.0, detected / total_gold)
+        accuracy = np.where(
+            no_gold, 1.0, np.where(detected > 0, correct / detected, 0.0)
+        )
+    hybrid = np.where(
+        no_gold, 1.0, DETECTION_WEIGHT * recall + CLASSIFICATION_WEIGHT * accuracy
+    )
+    return BatchScores(
+        labels=labels.tolist(),
+        gold=gold,
+        pred=pred,
+        detection_recall=recall,
+        classification_acc=accuracy,
+        hybrid=hybrid,
+    )
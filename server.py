@@ -0,0 +1,238 @@
+import json
+import logging
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any
+
+from redactor import prediction_dict
+
+if TYPE_CHECKING:
+    from session import Redactor
+
+logger = logging.getLogger(__name__)
+
+WARMUP_TEXT = "Call John Smith at 555-123-4567"
+
+
+class Overloaded(Exception):
+    """The request queue is full; the client should retry later."""
+
+
+class NotReady(Exception):
+    """The service is still warming up or is shutting down."""
+
+
+class RedactionService:
+    """Worker pool with a bounded queue in front of a Redactor session.
+
+    At most workers texts are redacted at once and at most queue_size more
+    wait for a worker; anything beyond that is rejected immediately with
+    Overloaded instead of queueing up latency.  The session is built and one
+    warm-up redaction is run in start(), and ready only turns true after
+    that succeeds.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], "Redactor"],
+        workers: int = 8,
+        queue_size: int = 32,
+        warmup: bool = True,
+    ) -> None:
+        self.session_factory = session_factory
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.warmup = warmup
+        self.session: Redactor | None = None
+        self.warmup_error: Exception | None = None
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._ready = threading.Event()
+        self._draining = False
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set() and not self._draining
+
+    def start(self) -> None:
+        """Build the session and warm up the model and LM client."""
+        try:
+            session = self.session_factory()
+            if self.warmup:
+                session.predict(WARMUP_TEXT)
+        except Exception as e:
+            self.warmup_error = e
+            logger.exception("Warm-up failed; server will report not ready")
+            return
+        self.session = session
+        self._ready.set()
+        logger.info("Redaction service ready (model=%s)", session.model)
+
+    def submit(self, texts: list[str]) -> list[Future]:
+        """Queue texts for redaction, all or nothing.
+
+        Raises NotReady before warm-up completes or while draining, and
+        Overloaded when the queue cannot take every text right now.
+        """
+        if not self.ready:
+            raise NotReady()
+        if len(texts) > self.capacity:
+            raise ValueError(f"batch of {len(texts)} exceeds capacity {self.capacity}")
+        acquired = 0
+        while acquired < len(texts) and self._slots.acquire(blocking=False):
+            acquired += 1
+        if acquired < len(texts):
+            for _ in range(acquired):
+                self._slots.release()
+            raise Overloaded()
+        return [self._pool.submit(self._run, text) for text in texts]
+
+    def _run(self, text: str) -> Any:
+        try:
+            return self.session.predict(text)
+        finally:
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        """Stop admitting requests and wait for queued ones to finish."""
+        self._draining = True
+        self._pool.shutdown(wait=True)
+
+
+def _result(future: Future, deadline: float) -> dict[str, Any]:
+    try:
+        timeout = max(0.0, deadline - time.monotonic())
+        return prediction_dict(future.result(timeout=timeout))
+    except FutureTimeout:
+        return {"error": "timed out"}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service: RedactionService
+    request_timeout: float
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("%s %s", self.address_string(), format % args)
+
+    def _send(
+        self, status: HTTPStatus, body: dict[str, Any], headers: dict | None = None
+    ) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        if self.path == "/healthz":
+            self._send(HTTPStatus.OK, {"status": "ok"})
+        elif self.path == "/readyz":
+            if self.service.ready:
+                self._send(HTTPStatus.OK, {"status": "ready"})
+            else:
+                error = self.service.warmup_error
+                body = {"status": "not ready"}
+                if error is not None:
+                    body["error"] = str(error)
+                self._send(HTTPStatus.SERVICE_UNAVAILABLE, body)
+        else:
+            self._send(HTTPStatus.NOT_FOUND, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        if self.path not in ("/redact", "/redact/batch"):
+            self._send(HTTPStatus.NOT_FOUND, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path == "/redact":
+                texts = [body["text"]]
+            else:
+                texts = body["texts"]
+            if not isinstance(texts, list) or not all(
+                isinstance(t, str) for t in texts
+            ):
+                raise TypeError("texts must be a list of strings")
+        except (ValueError, KeyError, TypeError) as e:
+            self._send(HTTPStatus.BAD_REQUEST, {"error": f"bad request: {e}"})
+            return
+
+        try:
+            futures = self.service.submit(texts)
+        except NotReady:
+            self._send(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                {"error": "not ready"},
+                {"Retry-After": "5"},
+            )
+            return
+        except Overloaded:
+            self._send(
+                HTTPStatus.TOO_MANY_REQUESTS,
+                {"error": "queue full"},
+                {"Retry-After": "1"},
+            )
+            return
+        except ValueError as e:
+            self._send(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": str(e)})
+            return
+
+        deadline = time.monotonic() + self.request_timeout
+        results = [_result(f, deadline) for f in futures]
+        if self.path == "/redact":
+            status = (
+                HTTPStatus.OK if "error" not in results[0] else HTTPStatus.BAD_GATEWAY
+            )
+            self._send(status, results[0])
+        else:
+            self._send(HTTPStatus.OK, {"results": results})
+
+
+def make_server(
+    service: RedactionService,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    request_timeout: float = 120.0,
+) -> ThreadingHTTPServer:
+    """HTTP server exposing service: POST /redact, POST /redact/batch,
+    GET /healthz (liveness) and GET /readyz (readiness)."""
+    handler = type(
+        "RedactionHandler",
+        (_Handler,),
+        {"service": service, "request_timeout": request_timeout},
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    workers: int = 8,
+    queue_size: int = 32,
+) -> None:
+    """Run the redaction server with the default session until interrupted."""
+    from session import get_default_redactor
+
+    service = RedactionService(get_default_redactor, workers, queue_size)
+    server = make_server(service, host, port)
+    threading.Thread(target=service.start, daemon=True).start()
+    logger.info("Serving on http://%s:%d (warming up)", host, server.server_port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
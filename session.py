@@ -0,0 +1,310 @@
+import json
+import logging
+import os
+import threading
+from collections.abc import Iterable
+from typing import TYPE_CHECKING, Any
+
+import dspy
+from dotenv import load_dotenv
+
+from ratelimit import ScheduledLM
+from redactor import PIIRedactor
+
+if TYPE_CHECKING:
+    from batch import BatchResult
+    from cache import RedactionCache
+    from hedging import Hedger
+    from known_entities import EntityScope
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gemini/gemini-2.0-flash"
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").lower() in ("1", "true", "yes")
+
+
+class Redactor:
+    """Long-lived redaction session.
+
+    Owns one LM client and one loaded program (the optimized model if one
+    exists on disk, otherwise the base PIIRedactor) so repeated calls skip
+    environment loading, LM construction and model deserialisation.
+
+    With fast_path=True the program is wrapped in rules.RulePrefilter, so
+    pattern-shaped PII is redacted locally and some LLM calls are skipped.
+
+    With entities_only=True the model only returns the entity list and the
+    redacted text is rebuilt locally (see PIIRedactor).  strategy picks the
+    PIIRedactor module (ChainOfThought, Predict or two-step) and the
+    optimized program saved for it.
+
+    With demo_k set, each call sends only the demo_k most relevant few-shot
+    demos (see demos.DemoSelector).
+
+    With max_chunk_tokens set, texts over that budget are split into
+    overlapping chunks redacted in parallel (see chunking.ChunkedRedactor).
+
+    With a cache, repeated inputs are answered from cache.RedactionCache,
+    keyed by text, model, program hash and the options above that change
+    the output.
+
+    With a hedger, a model call slower than its recent latency percentile is
+    duplicated and the first answer wins (see hedging.HedgedRedactor);
+    hedge rate and latency stats are in self.hedger.stats().
+
+    With repair=True each prediction is checked against the input and fixed
+    locally by span replacement where entities and redacted_text disagree
+    (see validation.ValidatedRedactor).
+
+    With cascade_model set, each text is first redacted by that cheaper model
+    and re-run on model only when local validation fails (see
+    cascade.CascadeRedactor).
+
+    The LM is bound per call with dspy.context() rather than the global
+    dspy.configure(), so a session can be shared between threads and several
+    sessions with different models can coexist in one process.  Each call
+    runs on its own copy of self.lm, whose history gives that call's cost;
+    self.cost is the running total.  Calls go through the model's shared
+    ratelimit.LMScheduler (self.lm.scheduler).
+    """
+
+    def __init__(
+        self,
+        model: str = DEFAULT_MODEL,
+        api_key: str | None = None,
+        program: dspy.Module | None = None,
+        fast_path: bool = False,
+        entities_only: bool = False,
+        demo_k: int | None = None,
+        max_chunk_tokens: int | None = None,
+        cache: "RedactionCache | None" = None,
+        hedger: "Hedger | None" = None,
+        cascade_model: str | None = None,
+        repair: bool = False,
+        strategy: str = "cot",
+    ) -> None:
+        self.model = model
+        self.lm = ScheduledLM(model, api_key=api_key)
+        self._cost = 0.0
+        self._cost_lock = threading.Lock()
+        if program is None:
+            from optimizer import load_optimized_model
+
+            redactor_kwargs = {
+                "entities_only": entities_only,
+                "demo_k": demo_k,
+                "strategy": strategy,
+            }
+            program = load_optimized_model(**redactor_kwargs)
+            if program is None:
+                program = PIIRedactor(**redactor_kwargs)
+        if repair:
+            from validation import ValidatedRedactor
+
+            program = ValidatedRedactor(program)
+        if cascade_model:
+            from cascade import CascadeRedactor
+
+            program = CascadeRedactor(
+                program, ScheduledLM(cascade_model, api_key=api_key)
+            )
+        self.hedger = hedger
+        if hedger is not None:
+            from hedging import HedgedRedactor
+
+            program = HedgedRedactor(program, hedger)
+        if max_chunk_tokens:
+            from chunking import ChunkedRedactor
+
+            program = ChunkedRedactor(program, max_tokens=max_chunk_tokens)
+        if fast_path:
+            from rules import RulePrefilter
+
+            program = RulePrefilter(program)
+        if cache is not None:
+            from cache import CachedRedactor
+
+            config = json.dumps(
+                {
+                    "fast_path": fast_path,
+                    "entities_only": entities_only,
+                    "demo_k": demo_k,
+                    "max_chunk_tokens": max_chunk_tokens,
+                    "cascade_model": cascade_model,
+                    "repair": repair,
+                    "strategy": strategy,
+                },
+                sort_keys=True,
+            )
+            program = CachedRedactor(program, model=model, cache=cache, config=config)
+        self.program = program
+        logger.debug("Redactor session ready (model=%s)", model)
+
+    @classmethod
+    def from_env(cls) -> "Redactor":
+        """Build a session from the environment (.env is loaded first)."""
+        load_dotenv()
+        cache = None
+        if _env_flag("REDACT_CACHE"):
+            from cache import RedactionCache
+
+            cache = RedactionCache()
+        hedger = None
+        if os.getenv("REDACT_HEDGE_PERCENTILE"):
+            from hedging import Hedger
+
+            hedger = Hedger(
+                percentile=float(os.environ["REDACT_HEDGE_PERCENTILE"]),
+                max_rate=float(os.getenv("REDACT_HEDGE_MAX_RATE", "0.05")),
+            )
+        return cls(
+            model=os.getenv("DSPY_MODEL", DEFAULT_MODEL),
+            api_key=os.getenv("GOOGLE_API_KEY"),
+            fast_path=_env_flag("REDACT_FAST_PATH"),
+            entities_only=_env_flag("REDACT_ENTITIES_ONLY"),
+            demo_k=int(os.getenv("REDACT_DEMO_K", "0")) or None,
+            max_chunk_tokens=int(os.getenv("REDACT_CHUNK_TOKENS", "0")) or None,
+            cache=cache,
+            hedger=hedger,
+            cascade_model=os.getenv("REDACT_CASCADE_MODEL") or None,
+            repair=_env_flag("REDACT_REPAIR"),
+            strategy=os.getenv("REDACT_STRATEGY", "cot"),
+        )
+
+    def _program_for(self, scope: "EntityScope | None") -> dspy.Module:
+        if scope is None:
+            return self.program
+        from known_entities import KnownEntityRedactor
+
+        return KnownEntityRedactor(self.program, scope)
+
+    def _charge(self, cost: float) -> float:
+        with self._cost_lock:
+            self._cost += cost
+        return cost
+
+    def _charge_lm(self, call_lm: dspy.LM) -> float:
+        return self._charge(sum(e.get("cost", 0) or 0 for e in call_lm.history))
+
+    def predict(self, text: str, scope: "EntityScope | None" = None) -> dspy.Prediction:
+        """Run the program on text and return the full prediction.
+
+        With a scope, values already confirmed in it are pre-redacted and the
+        entities found in text are added to it (see known_entities).
+        """
+        return self.predict_with_cost(text, scope=scope)[0]
+
+    def predict_with_cost(
+        self, text: str, scope: "EntityScope | None" = None
+    ) -> tuple[dspy.Prediction, float]:
+        """predict(), plus the LM cost of this call (also added to self.cost)."""
+        call_lm = self.lm.copy()
+        try:
+            with dspy.context(lm=call_lm):
+                pred = self._program_for(scope)(text=text)
+        finally:
+            cost = self._charge_lm(call_lm)
+        return pred, cost
+
+    def redact(self, text: str, scope: "EntityScope | None" = None) -> str:
+        """Return text with PII replaced by [LABEL] placeholders."""
+        return self.predict(text, scope=scope).redacted_text
+
+    async def apredict(
+        self, text: str, scope: "EntityScope | None" = None
+    ) -> dspy.Prediction:
+        """Async predict(); the LM call runs on the event loop, not a thread."""
+        call_lm = self.lm.copy()
+        try:
+            with dspy.context(lm=call_lm):
+                return await self._program_for(scope).acall(text=text)
+        finally:
+            self._charge_lm(call_lm)
+
+    async def aredact(self, text: str, scope: "EntityScope | None" = None) -> str:
+        """Async redact()."""
+        return (await self.apredict(text, scope=scope)).redacted_text
+
+    def predict_packed(
+        self, texts: Iterable[str], max_tokens: int = 800
+    ) -> list[dspy.Prediction]:
+        """Predict many short texts, several per LLM call (see packing.py).
+
+        Packing replaces the program's model call, so a session with a fast
+        path, cache, chunking, hedging or cascade raises ValueError rather
+        than silently skipping them; repair runs on each packed prediction.
+        """
+        from packing import PackedRedactor
+
+        packer = PackedRedactor(self.program, max_tokens=max_tokens)
+        call_lm = self.lm.copy()
+        try:
+            with dspy.context(lm=call_lm):
+                return packer.redact_batch(list(texts))
+        finally:
+            self._charge_lm(call_lm)
+
+    def redact_many(
+        self,
+        texts: Iterable[str],
+        scope: "EntityScope | None" = None,
+        **kwargs: Any,
+    ) -> "BatchResult":
+        """Redact many texts concurrently; see batch.redact_many for options."""
+        from batch import redact_many
+
+        program = self._program_for(scope)
+        result = redact_many(
+            texts, lambda text: program(text=text), lm=self.lm, **kwargs
+        )
+        self._charge(result.cost)
+        return result
+
+    async def aredact_many(
+        self,
+        texts: Iterable[str],
+        scope: "EntityScope | None" = None,
+        **kwargs: Any,
+    ) -> "BatchResult":
+        """Async redact_many(); see batch.aredact_many for options."""
+        from batch import aredact_many
+
+        program = self._program_for(scope)
+        result = await aredact_many(
+            texts, lambda text: program.acall(text=text), lm=self.lm, **kwargs
+        )
+        self._charge(result.cost)
+        return result
+
+    @property
+    def cost(self) -> float:
+        """Total LM cost of this session's calls so far.
+
+        A running total of each call's cost, so unlike a sum over
+        self.lm.history it is not limited by dspy's max_history_size.
+        """
+        return self._cost
+
+
+_default_lock = threading.Lock()
+_default_session: Redactor | None = None
+
+
+def get_default_redactor() -> Redactor:
+    """Return the process-wide session, creating it from the environment once."""
+    global _default_session
+    if _default_session is None:
+        with _default_lock:
+            if _default_session is None:
+                _default_session = Redactor.from_env()
+    return _default_session
+
+
+def reset_default_redactor() -> None:
+    """Drop the cached default session (e.g. after re-optimizing the model)."""
+    global _default_session
+    with _default_lock:
+        _default_session = None
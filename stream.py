@@ -0,0 +1,200 @@
+import json
+import logging
+import time
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any
+
+import dspy
+
+from redactor import prediction_dict
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Record:
+    """One input line: its 0-based line number, caller id and text.
+
+    error is set for a line that could not be parsed into a text; such a
+    record is reported as failed without calling the model.
+    """
+
+    index: int
+    id: Any
+    text: str
+    error: Exception | None = None
+
+
+@dataclass
+class StreamResult:
+    record: Record
+    prediction: dspy.Prediction | None = None
+    error: Exception | None = None
+
+    def to_json(self) -> str:
+        if self.error is not None:
+            return json.dumps({"id": self.record.id, "error": str(self.error)})
+        return json.dumps({"id": self.record.id, **prediction_dict(self.prediction)})
+
+
+def read_records(lines: Iterable[str], text_field: str = "text") -> Iterator[Record]:
+    """Parse newline-delimited text or JSONL into Records, skipping blank lines.
+
+    A line holding a JSON object contributes obj[text_field] and its "id"
+    (default: the line number); any other line is taken as plain text.  An
+    object without text_field yields a Record carrying a ValueError, so one
+    bad line fails on its own instead of aborting the stream.
+    """
+    for index, line in enumerate(lines):
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        if line.lstrip().startswith("{"):
+            try:
+                obj = json.loads(line)
+            except json.JSONDecodeError:
+                obj = None
+            if isinstance(obj, dict):
+                record_id = obj.get("id", index)
+                if text_field not in obj:
+                    error = ValueError(f"line {index + 1}: no {text_field!r} field")
+                    yield Record(index=index, id=record_id, text="", error=error)
+                    continue
+                yield Record(index=index, id=record_id, text=obj[text_field])
+                continue
+        yield Record(index=index, id=index, text=line)
+
+
+class Checkpoint:
+    """Append-only journal of input line numbers whose output has been written.
+
+    A line number is recorded only after its result is flushed to the output,
+    so a killed job resumed from the same checkpoint never loses a record (at
+    worst the last one is written twice).  Failed records are not recorded
+    and are retried on resume.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self.done: set[int] = set()
+        if self.path.exists():
+            self.done = {
+                int(line) for line in self.path.read_text().split() if line.isdigit()
+            }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("a")
+
+    def mark(self, index: int) -> None:
+        self.done.add(index)
+        self._file.write(f"{index}\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def stream_redact(
+    records: Iterable[Record],
+    predict: Callable[[str], dspy.Prediction],
+    window: int = 16,
+    ordered: bool = False,
+) -> Iterator[StreamResult]:
+    """Redact records through a sliding window, yielding results as they finish.
+
+    At most window records are in flight (or, with ordered=True, in flight
+    plus finished-but-waiting-for-an-earlier-record), so memory stays flat on
+    inputs of any size.  Unordered results are yielded in completion order;
+    ordered results in input order.  Records that carry a parse error are
+    yielded as failed results without calling predict.
+    """
+    records = iter(records)
+    pending: dict[Future, tuple[int, Record]] = {}
+    finished: dict[int, StreamResult] = {}
+    submitted = 0
+    next_out = 0
+    exhausted = False
+
+    with ThreadPoolExecutor(max_workers=window) as pool:
+        while True:
+            while not exhausted and len(pending) + len(finished) < window:
+                record = next(records, None)
+                if record is None:
+                    exhausted = True
+                    break
+                if record.error is not None:
+                    future: Future = Future()
+                    future.set_exception(record.error)
+                else:
+                    future = pool.submit(predict, record.text)
+                pending[future] = (submitted, record)
+                submitted += 1
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                seq, record = pending.pop(future)
+                error = future.exception()
+                result = StreamResult(
+                    record=record,
+                    prediction=future.result() if error is None else None,
+                    error=error,
+                )
+                if ordered:
+                    finished[seq] = result
+                else:
+                    yield result
+            while next_out in finished:
+                yield finished.pop(next_out)
+                next_out += 1
+
+
+def run_stream(
+    lines: Iterable[str],
+    out: IO[str],
+    predict: Callable[[str], dspy.Prediction],
+    window: int = 16,
+    ordered: bool = False,
+    checkpoint: str | None = None,
+    text_field: str = "text",
+) -> tuple[int, int]:
+    """Stream lines through predict and write one JSON result per line to out.
+
+    With a checkpoint path, records already journaled there are skipped, so
+    rerunning the same command (appending to the same output) resumes a
+    killed job.  Returns (written, failed) counts.
+    """
+    journal = Checkpoint(checkpoint) if checkpoint else None
+    records = read_records(lines, text_field)
+    if journal is not None and journal.done:
+        logger.info("Resuming: skipping %d checkpointed records", len(journal.done))
+        records = (r for r in records if r.index not in journal.done)
+
+    written = failed = 0
+    start = time.perf_counter()
+    try:
+        for result in stream_redact(records, predict, window, ordered):
+            out.write(result.to_json() + "\n")
+            out.flush()
+            if result.error is not None:
+                failed += 1
+                logger.warning("Record %s failed: %s", result.record.id, result.error)
+                continue
+            written += 1
+            if journal is not None:
+                journal.mark(result.record.index)
+    finally:
+        if journal is not None:
+            journal.close()
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        "Streamed %d records (%d failed) in %.2fs — %.1f records/s",
+        written + failed,
+        failed,
+        elapsed,
+        (written + failed) / elapsed if elapsed > 0 else 0.0,
+    )
+    return written, failed
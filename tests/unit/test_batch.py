@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+import dspy
+from dspy.clients.base_lm import record_history
+
+from batch import aredact_many, redact_many
+
+
+def _echo(text):
+    return dspy.Prediction(entities=[], redacted_text=text.upper())
+
+
+class TestRedactMany:
+    def test_preserves_input_order(self):
+        texts = [f"text {i}" for i in range(20)]
+        result = redact_many(texts, _echo, num_threads=4)
+        assert [item.redacted_text for item in result.items] == [
+            t.upper() for t in texts
+        ]
+
+    def test_dedupes_identical_inputs(self):
+        predict = MagicMock(side_effect=_echo)
+        result = redact_many(["a", "b", "a", "a"], predict, num_threads=2)
+        assert predict.call_count == 2
+        assert result.unique == 2
+        assert len(result.items) == 4
+        assert result.items[2].prediction is result.items[0].prediction
+
+    def test_collects_per_item_errors(self):
+        def flaky(text):
+            if text == "bad":
+                raise RuntimeError("boom")
+            return _echo(text)
+
+        result = redact_many(["ok", "bad", "fine"], flaky, num_threads=2)
+        assert [item.ok for item in result.items] == [True, False, True]
+        assert str(result.errors[0].error) == "boom"
+        assert result.items[2].redacted_text == "FINE"
+
+    def test_respects_max_in_flight(self):
+        lock = threading.Lock()
+        active = 0
+        peak = 0
+
+        def slow(text):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.01)
+            with lock:
+                active -= 1
+            return _echo(text)
+
+        redact_many([str(i) for i in range(30)], slow, num_threads=8, max_in_flight=3)
+        assert peak <= 3
+
+    def test_reports_cost_and_throughput(self):
+        lm = dspy.LM("openai/m")
+        lm.history = [{"cost": 5.0}]  # earlier or concurrent calls are not counted
+
+        def predict(text):
+            dspy.settings.lm.history.append({"cost": 0.5})
+            return _echo(text)
+
+        result = redact_many(["a", "b", "a"], predict, lm=lm, num_threads=2)
+        assert [item.cost for item in result.items] == [0.5, 0.5, 0.0]
+        assert result.cost == 1.0
+        assert result.throughput > 0
+
+    def test_cost_is_not_capped_by_history_size(self):
+        lm = dspy.LM("openai/m")
+
+        def predict(text):
+            record_history(dspy.settings.lm, {"cost": 0.25})
+            return _echo(text)
+
+        with dspy.context(max_history_size=2):
+            result = redact_many([str(i) for i in range(10)], predict, lm=lm)
+        assert result.cost == 2.5
+
+
+class TestARedactMany:
+    def test_preserves_order_and_dedupes(self):
+        calls = []
+
+        async def apredict(text):
+            calls.append(text)
+            await asyncio.sleep(0)
+            return _echo(text)
+
+        result = asyncio.run(aredact_many(["b", "a", "b"], apredict))
+        assert [item.redacted_text for item in result.items] == ["B", "A", "B"]
+        assert sorted(calls) == ["a", "b"]
+
+    def test_semaphore_limits_concurrency(self):
+        active = 0
+        peak = 0
+
+        async def apredict(text):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.001)
+            active -= 1
+            return _echo(text)
+
+        asyncio.run(aredact_many([str(i) for i in range(50)], apredict, concurrency=5))
+        assert peak == 5
+
+    def test_reports_cost_per_item(self):
+        async def apredict(text):
+            dspy.settings.lm.history.append({"cost": 0.5})
+            return _echo(text)
+
+        lm = dspy.LM("openai/m")
+        result = asyncio.run(aredact_many(["a", "b"], apredict, lm=lm))
+        assert result.cost == 1.0
+
+    def test_collects_per_item_errors(self):
+        async def apredict(text):
+            if text == "bad":
+                raise ValueError("nope")
+            return _echo(text)
+
+        result = asyncio.run(aredact_many(["bad", "ok"], apredict))
+        assert isinstance(result.items[0].error, ValueError)
+        assert result.items[1].redacted_text == "OK"
@@ -0,0 +1,54 @@
+import dspy
+from dspy.utils.dummies import DummyLM
+
+from benchmark import VariantResult, pick_variant, run_variant
+
+
+class _Echo(dspy.Module):
+    def __init__(self, fail_on=()):
+        super().__init__()
+        self.fail_on = set(fail_on)
+
+    def forward(self, text):
+        if text in self.fail_on:
+            raise RuntimeError("unparseable")
+        return dspy.Prediction(entities=[], redacted_text=text)
+
+
+def _examples():
+    # the program echoes its input, so "[TEL]" is right and "555" wrong
+    return [
+        dspy.Example(text=t, redacted_text="[TEL]").with_inputs("text")
+        for t in ("[TEL]", "[TEL]", "555", "[TEL]")
+    ]
+
+
+def _result(strategy, score, p90, tokens=100):
+    return VariantResult(strategy, score, 10, 0, tokens, 0.0, p90 / 2, p90, p90)
+
+
+class TestRunVariant:
+    def test_scores_and_latency(self):
+        result = run_variant(_Echo(), "predict", _examples(), DummyLM([]))
+        assert result.strategy == "predict"
+        assert result.score == 75.0
+        assert result.failed == 0
+        assert 0 <= result.p50 <= result.p90 <= result.p99
+
+    def test_failures_score_zero(self):
+        examples = _examples()
+        result = run_variant(_Echo(fail_on={"[TEL]"}), "cot", examples, DummyLM([]))
+        assert result.failed == 3
+        assert result.score == 0.0
+
+
+class TestPickVariant:
+    def test_fastest_passing_variant(self):
+        results = [
+            _result("cot", 80.0, 4.0),
+            _result("predict", 78.0, 2.0),
+            _result("two_step", 70.0, 1.0),
+        ]
+        assert pick_variant(results, 75.0).strategy == "predict"
+        assert pick_variant(results, 79.0).strategy == "cot"
+        assert pick_variant(results, 90.0) is None
@@ -0,0 +1,132 @@
+import asyncio
+import copy
+import sqlite3
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import dspy
+
+from cache import CachedRedactor, RedactionCache, cache_key
+from redactor import PIIEntity, PIIRedactor, program_hash
+
+
+def _program(redacted="Call [GIVENNAME1]"):
+    program = PIIRedactor()
+    program.forward = MagicMock(
+        return_value=dspy.Prediction(
+            entities=[PIIEntity(value="John", label="GIVENNAME1")],
+            redacted_text=redacted,
+        )
+    )
+    return program
+
+
+class TestCacheKey:
+    def test_depends_on_all_parts(self):
+        base = cache_key("text", "model", "prog")
+        assert base == cache_key("text", "model", "prog")
+        assert base != cache_key("text2", "model", "prog")
+        assert base != cache_key("text", "model2", "prog")
+        assert base != cache_key("text", "model", "prog2")
+        assert base != cache_key("text", "model", "prog", '{"repair": true}')
+
+
+class TestRedactionCache:
+    def test_memory_lru_evicts_oldest(self):
+        cache = RedactionCache(path=None, max_entries=2)
+        cache.put("a", {"v": 1})
+        cache.put("b", {"v": 2})
+        cache.get("a")
+        cache.put("c", {"v": 3})
+        assert cache.get("b") is None
+        assert cache.get("a") == {"v": 1}
+
+    def test_disk_tier_survives_new_instance(self, tmp_path):
+        path = str(tmp_path / "c.sqlite")
+        RedactionCache(path=path).put("k", {"v": 1}, program="p")
+        cache = RedactionCache(path=path)
+        assert cache.get("k") == {"v": 1}
+        assert cache.stats == {"hits": 1, "disk_hits": 1, "misses": 0}
+
+    def test_disk_hit_does_not_lock_other_writers(self, tmp_path):
+        path = str(tmp_path / "c.sqlite")
+        RedactionCache(path=path).put("k", {"v": 1})
+        reader = RedactionCache(path=path)
+        assert reader.get("k") == {"v": 1}
+        assert not reader._db.in_transaction
+        other = sqlite3.connect(path, timeout=0.1)
+        other.execute("DELETE FROM redactions")
+        other.commit()
+
+    def test_ttl_expires_entries(self, tmp_path):
+        cache = RedactionCache(path=str(tmp_path / "c.sqlite"), ttl=10)
+        with patch("cache.time.time", return_value=1000.0):
+            cache.put("k", {"v": 1})
+        with patch("cache.time.time", return_value=1011.0):
+            assert cache.get("k") is None
+
+    def test_disk_trimmed_to_max_entries(self, tmp_path):
+        cache = RedactionCache(
+            path=str(tmp_path / "c.sqlite"), max_entries=1, max_disk_entries=10
+        )
+        for i in range(200):
+            cache.put(str(i), {"v": i})
+        count = cache._db.execute("SELECT COUNT(*) FROM redactions").fetchone()[0]
+        assert count <= 110
+
+    def test_purge_programs(self, tmp_path):
+        cache = RedactionCache(path=str(tmp_path / "c.sqlite"))
+        cache.put("old", {"v": 1}, program="p1")
+        cache.put("new", {"v": 2}, program="p2")
+        cache.put("other", {"v": 3}, program="p3")
+        assert cache.purge_programs(["p1", "p4"]) == 1
+        assert cache.get("old") is None
+        assert cache.get("new") == {"v": 2}
+        assert cache.get("other") == {"v": 3}
+
+    def test_deepcopy_shares_cache(self):
+        cache = RedactionCache(path=None)
+        assert copy.deepcopy(cache) is cache
+
+
+class TestCachedRedactor:
+    def test_second_call_is_served_from_cache(self):
+        program = _program()
+        cached = CachedRedactor(program, "m", RedactionCache(path=None))
+        first = cached(text="Call John")
+        second = cached(text="Call John")
+        assert program.forward.call_count == 1
+        assert second.redacted_text == first.redacted_text
+        assert second.entities == [{"value": "John", "label": "GIVENNAME1"}]
+        assert cached.cache.stats["hits"] == 1
+
+    def test_new_program_state_misses(self):
+        cache = RedactionCache(path=None)
+        CachedRedactor(_program(), "m", cache)(text="Call John")
+        program = _program()
+        program.cot.predict.signature = program.cot.predict.signature.with_instructions(
+            "new instructions"
+        )
+        CachedRedactor(program, "m", cache)(text="Call John")
+        assert program.forward.call_count == 1
+
+    def test_wrapper_config_misses(self):
+        cache = RedactionCache(path=None)
+        CachedRedactor(_program(), "m", cache, config="plain")(text="Call John")
+        program = _program()
+        CachedRedactor(program, "m", cache, config="repair")(text="Call John")
+        assert program.forward.call_count == 1
+
+    def test_key_uses_program_hash(self):
+        program = _program()
+        cached = CachedRedactor(program, "m", RedactionCache(path=None))
+        assert cached.program_digest == program_hash(program)
+
+    def test_async_path(self):
+        program = _program()
+        program.aforward = AsyncMock(
+            return_value=dspy.Prediction(entities=[], redacted_text="x")
+        )
+        cached = CachedRedactor(program, "m", RedactionCache(path=None))
+        asyncio.run(cached.acall(text="t"))
+        asyncio.run(cached.acall(text="t"))
+        assert program.aforward.await_count == 1
@@ -0,0 +1,113 @@
+import asyncio
+
+import dspy
+import pytest
+
+from cascade import CascadeRedactor
+
+CHEAP = "openai/cheap"
+
+_JOHN = [{"value": "John", "label": "GIVENNAME1"}]
+
+
+def _good(text):
+    return dspy.Prediction(
+        entities=_JOHN, redacted_text=text.replace("John", "[GIVENNAME1]")
+    )
+
+
+class _ByModel(dspy.Module):
+    """Leaks the name on the cheap model for texts in leaky, else redacts it."""
+
+    def __init__(self, leaky=(), fail=False):
+        super().__init__()
+        self.leaky = set(leaky)
+        self.fail = fail
+        self.models = []
+
+    def _predict(self, text):
+        model = dspy.settings.lm.model
+        self.models.append(model)
+        if model == CHEAP:
+            dspy.settings.lm.history.append({"cost": 0.001})
+            if self.fail:
+                raise ValueError("unparseable")
+            if text in self.leaky:
+                return dspy.Prediction(entities=_JOHN, redacted_text=text)
+        return _good(text)
+
+    def forward(self, text):
+        return self._predict(text)
+
+    async def aforward(self, text):
+        return self._predict(text)
+
+
+def _cascade(program):
+    return CascadeRedactor(program, dspy.LM(CHEAP))
+
+
+class TestCascadeRedactor:
+    def test_valid_output_is_not_escalated(self):
+        program = _ByModel()
+        cascade = _cascade(program)
+        with dspy.context(lm=dspy.LM("openai/strong")):
+            assert cascade(text="Call John now") == _good("Call John now")
+        assert program.models == [CHEAP]
+        assert cascade.escalation_rate == 0.0
+
+    def test_invalid_output_is_escalated(self):
+        program = _ByModel(leaky={"Bye John"})
+        cascade = _cascade(program)
+        with dspy.context(lm=dspy.LM("openai/strong")):
+            preds = [cascade(text=t) for t in ("Hi John", "Bye John")]
+        assert preds == [_good("Hi John"), _good("Bye John")]
+        assert program.models == [CHEAP, CHEAP, "openai/strong"]
+        assert (cascade.calls, cascade.escalations) == (2, 1)
+        assert cascade.issues["leaked_value"] == 1
+
+    def test_cheap_failure_is_escalated(self):
+        program = _ByModel(fail=True)
+        cascade = _cascade(program)
+        with dspy.context(lm=dspy.LM("openai/strong")):
+            assert cascade(text="Call John now") == _good("Call John now")
+        assert cascade.issues["error"] == 1
+
+    def test_cheap_cost_lands_in_calling_lm(self):
+        strong = dspy.LM("openai/strong")
+        with dspy.context(lm=strong):
+            _cascade(_ByModel())(text="Call John now")
+        assert strong.history == [{"cost": 0.001}]
+
+    def test_cheap_cost_is_counted(self):
+        cascade = _cascade(_ByModel())
+        with dspy.context(lm=dspy.LM("openai/strong")):
+            for _ in range(3):
+                cascade(text="Call John now")
+        assert cascade.cheap_cost == pytest.approx(0.003)
+
+    def test_calling_lm_history_stays_bounded(self):
+        strong = dspy.LM("openai/strong")
+        cascade = _cascade(_ByModel())
+        with dspy.context(lm=strong, max_history_size=2):
+            for _ in range(5):
+                cascade(text="Call John now")
+        assert len(strong.history) == 2
+        assert cascade.cheap_cost == pytest.approx(0.005)
+
+    def test_disable_history_is_respected(self):
+        strong = dspy.LM("openai/strong")
+        with dspy.context(lm=strong, disable_history=True):
+            _cascade(_ByModel())(text="Call John now")
+        assert strong.history == []
+
+    def test_async_escalation(self):
+        program = _ByModel(leaky={"Hi John"})
+        cascade = _cascade(program)
+
+        async def main():
+            with dspy.context(lm=dspy.LM("openai/strong")):
+                return await cascade.acall(text="Hi John")
+
+        assert asyncio.run(main()) == _good("Hi John")
+        assert cascade.escalations == 1
@@ -0,0 +1,138 @@
+import asyncio
+import threading
+from unittest.mock import AsyncMock, MagicMock
+
+import dspy
+
+from chunking import Chunk, ChunkedRedactor, merge_chunk_entities, split_into_chunks
+
+
+def _sentences(n):
+    return " ".join(f"Sentence number {i} is here." for i in range(n))
+
+
+class TestSplitIntoChunks:
+    def test_short_text_is_one_chunk(self):
+        chunks = split_into_chunks("Hello there.", max_tokens=100)
+        assert chunks == [Chunk(0, 12, "Hello there.")]
+
+    def test_chunks_respect_budget(self):
+        text = _sentences(100)
+        for chunk in split_into_chunks(text, max_tokens=50, overlap_tokens=10):
+            assert len(chunk.text) // 4 <= 50
+
+    def test_chunks_cover_text_with_overlap(self):
+        text = _sentences(100)
+        chunks = split_into_chunks(text, max_tokens=50, overlap_tokens=10)
+        assert chunks[0].start == 0
+        assert chunks[-1].end == len(text)
+        for prev, nxt in zip(chunks, chunks[1:]):
+            assert nxt.start < prev.end  # overlap
+            assert nxt.start > prev.start  # progress
+
+    def test_splits_on_sentence_boundaries(self):
+        text = _sentences(40)
+        for chunk in split_into_chunks(text, max_tokens=30, overlap_tokens=0):
+            assert chunk.text.rstrip().endswith(".")
+
+    def test_hard_splits_oversized_unit(self):
+        text = "word " * 400
+        chunks = split_into_chunks(text, max_tokens=50, overlap_tokens=0)
+        assert len(chunks) > 1
+        assert "".join(c.text for c in chunks) == text
+
+
+class TestMergeChunkEntities:
+    def test_shifts_offsets_and_dedupes_overlap(self):
+        chunks = [Chunk(0, 20, "x" * 20), Chunk(10, 30, "x" * 20)]
+        preds = [
+            dspy.Prediction(
+                entities=[{"value": "Ann", "label": "GIVENNAME1", "start": 12}]
+            ),
+            dspy.Prediction(
+                entities=[{"value": "Ann", "label": "GIVENNAME1", "start": 2}]
+            ),
+        ]
+        merged = merge_chunk_entities(chunks, preds)
+        assert [(e.value, e.start) for e in merged] == [("Ann", 12)]
+
+    def test_recovers_unlisted_placeholder_spans(self):
+        chunks = [Chunk(0, 14, "Hi Ann, call 5"), Chunk(8, 22, "call 555 now.")]
+        preds = [
+            dspy.Prediction(entities=[], redacted_text="Hi [GIVENNAME1], call 5"),
+            dspy.Prediction(entities=[], redacted_text="call [TEL] now."),
+        ]
+        merged = merge_chunk_entities(chunks, preds)
+        assert [(e.value, e.label, e.start) for e in merged] == [
+            ("Ann", "GIVENNAME1", 3),
+            ("555", "TEL", 13),
+        ]
+
+
+class TestChunkedRedactor:
+    def test_short_text_passes_through(self):
+        program = MagicMock(return_value="pred")
+        assert ChunkedRedactor(program, max_tokens=100)(text="Hi Ann.") == "pred"
+
+    def test_stitches_entities_from_all_chunks(self):
+        def fake(text):
+            entities = [
+                {"value": name, "label": "GIVENNAME1"}
+                for name in ("Ann", "Bob")
+                if name in text
+            ]
+            return dspy.Prediction(entities=entities, redacted_text="ignored")
+
+        text = "Ann wrote this. " + _sentences(60) + " Bob replied."
+        redactor = ChunkedRedactor(MagicMock(side_effect=fake), max_tokens=40)
+        pred = redactor(text=text)
+        assert "Ann" not in pred.redacted_text
+        assert "Bob" not in pred.redacted_text
+        assert pred.redacted_text.startswith("[GIVENNAME1] wrote this.")
+
+    def test_keeps_placeholders_missing_from_entities(self):
+        def fake(text):
+            # Bob is placeholdered but never listed as an entity
+            entities = (
+                [{"value": "Ann", "label": "GIVENNAME1"}] if "Ann" in text else []
+            )
+            redacted = text.replace("Ann", "[GIVENNAME1]").replace(
+                "Bob", "[GIVENNAME2]"
+            )
+            return dspy.Prediction(entities=entities, redacted_text=redacted)
+
+        text = "Ann wrote this. " + _sentences(60) + " Bob replied."
+        redactor = ChunkedRedactor(MagicMock(side_effect=fake), max_tokens=40)
+        pred = redactor(text=text)
+        assert "Ann" not in pred.redacted_text
+        assert "Bob" not in pred.redacted_text
+        assert pred.redacted_text.endswith("[GIVENNAME2] replied.")
+
+    def test_chunks_run_in_parallel(self):
+        text = _sentences(18)
+        n_chunks = len(split_into_chunks(text, 60, 0))
+        barrier = threading.Barrier(n_chunks, timeout=5)
+
+        def fake(text):
+            barrier.wait()  # only passes if all chunks are in flight at once
+            return dspy.Prediction(entities=[], redacted_text=text)
+
+        redactor = ChunkedRedactor(
+            MagicMock(side_effect=fake),
+            max_tokens=60,
+            overlap_tokens=0,
+            num_threads=n_chunks,
+        )
+        assert redactor(text=text).redacted_text == text
+
+    def test_async_path(self):
+        program = MagicMock()
+        program.acall = AsyncMock(
+            return_value=dspy.Prediction(
+                entities=[{"value": "Ann", "label": "GIVENNAME1"}]
+            )
+        )
+        redactor = ChunkedRedactor(program, max_tokens=40)
+        pred = asyncio.run(redactor.acall(text="Ann said hi. " + _sentences(40)))
+        assert program.acall.await_count > 1
+        assert "Ann" not in pred.redacted_text
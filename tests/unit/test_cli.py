@@ -2,16 +2,24 @@ import subprocess
 import sys
 from unittest.mock import MagicMock, patch
 
+import pytest
 
 from main import redact
+from session import reset_default_redactor
 
 
 class TestRedactLogging:
     """Test that redact() emits the expected log messages."""
 
+    @pytest.fixture(autouse=True)
+    def _fresh_session(self):
+        reset_default_redactor()
+        yield
+        reset_default_redactor()
+
     @patch("optimizer.load_optimized_model", return_value=None)
-    @patch("main.PIIRedactor")
-    @patch("main.dspy")
+    @patch("session.PIIRedactor")
+    @patch("session.dspy")
     def test_logs_model_at_info(self, mock_dspy, mock_redactor_cls, _mock_load, caplog):
         mock_result = MagicMock()
         mock_result.redacted_text = "redacted"
@@ -24,8 +32,8 @@ class TestRedactLogging:
         assert any("Using model:" in r.message for r in caplog.records)
 
     @patch("optimizer.load_optimized_model", return_value=None)
-    @patch("main.PIIRedactor")
-    @patch("main.dspy")
+    @patch("session.PIIRedactor")
+    @patch("session.dspy")
     def test_logs_input_at_debug(
         self, mock_dspy, mock_redactor_cls, _mock_load, caplog
     ):
@@ -40,8 +48,8 @@ class TestRedactLogging:
         assert any("secret text" in r.message for r in caplog.records)
 
     @patch("optimizer.load_optimized_model", return_value=None)
-    @patch("main.PIIRedactor")
-    @patch("main.dspy")
+    @patch("session.PIIRedactor")
+    @patch("session.dspy")
     def test_logs_entities_at_info(
         self, mock_dspy, mock_redactor_cls, _mock_load, caplog
     ):
@@ -56,8 +64,8 @@ class TestRedactLogging:
         assert any("Entities found:" in r.message for r in caplog.records)
 
     @patch("optimizer.load_optimized_model", return_value=None)
-    @patch("main.PIIRedactor")
-    @patch("main.dspy")
+    @patch("session.PIIRedactor")
+    @patch("session.dspy")
     def test_logs_redacted_text_at_debug(
         self, mock_dspy, mock_redactor_cls, _mock_load, caplog
     ):
@@ -72,8 +80,8 @@ class TestRedactLogging:
         assert any("[GIVENNAME1]" in r.message for r in caplog.records)
 
     @patch("optimizer.load_optimized_model", return_value=None)
-    @patch("main.PIIRedactor")
-    @patch("main.dspy")
+    @patch("session.PIIRedactor")
+    @patch("session.dspy")
     def test_no_debug_logs_at_info_level(
         self, mock_dspy, mock_redactor_cls, _mock_load, caplog
     ):
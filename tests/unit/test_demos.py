@@ -0,0 +1,116 @@
+import copy
+
+import dspy
+from dspy.utils.dummies import DummyLM
+
+from demos import DemoSelector, as_demo_list, cue_labels
+from examples import EXAMPLES
+from redactor import PIIRedactor
+
+
+def _demo(text, *labels):
+    return dspy.Example(
+        text=text,
+        entities=[{"value": "x", "label": label} for label in labels],
+        redacted_text=text,
+    ).with_inputs("text")
+
+
+class TestCueLabels:
+    def test_rule_hits_and_keywords(self):
+        labels = cue_labels("Mail me at a@b.com about your passport renewal")
+        assert {"EMAIL", "PASSPORT"} <= labels
+
+    def test_idcard_cue_matches(self):
+        assert "IDCARD" in cue_labels("Card: X1234567 on file")
+
+    def test_keywords_match_whole_words(self):
+        assert "IP" not in cue_labels("The shipping is free")
+
+
+class TestDemoSelector:
+    def test_picks_most_similar_demo(self):
+        demos = [
+            _demo("Your flight to Paris departs tomorrow", "CITY"),
+            _demo("Reset the password for username jdoe42", "USERNAME"),
+            _demo("Meeting notes from the quarterly review", "DATE"),
+        ]
+        selector = DemoSelector(demos, k=1, max_fillers=0)
+        assert selector.select("Please reset password for username alice7") == [
+            demos[1]
+        ]
+
+    def test_adds_filler_for_uncovered_label(self):
+        demos = [
+            _demo("Reset the password for username jdoe42", "USERNAME"),
+            _demo("Reset the password for username bob", "USERNAME"),
+            _demo("Passport number on file", "PASSPORT"),
+        ]
+        selector = DemoSelector(demos, k=1, max_fillers=1)
+        chosen = selector.select("Reset the password for username carol, passport too")
+        assert demos[2] in chosen
+        assert len(chosen) == 2
+
+    def test_tracks_tokens_saved(self):
+        selector = DemoSelector(as_demo_list(EXAMPLES), k=3)
+        selector.select("Email john.doe@gmail.com for the invoice")
+        assert selector.calls == 1
+        assert 0 < selector.tokens_saved < selector.total_demo_tokens
+        assert selector.tokens_saved_per_call == selector.tokens_saved
+
+    def test_savings_measured_against_baseline(self):
+        pool = as_demo_list(EXAMPLES)
+        selector = DemoSelector(pool, k=3, baseline=[])
+        selector.select("Email john.doe@gmail.com for the invoice")
+        assert selector.baseline_tokens == 0
+        assert selector.tokens_sent > 0
+        assert selector.tokens_saved == -selector.tokens_sent
+
+    def test_deepcopy_shares_index(self):
+        selector = DemoSelector(as_demo_list(EXAMPLES))
+        assert copy.deepcopy(selector) is selector
+
+    def test_normalises_loaded_dict_demos(self):
+        demos = as_demo_list([{"text": "hi", "entities": [], "redacted_text": "hi"}])
+        assert isinstance(demos[0], dspy.Example)
+
+
+class TestPIIRedactorDemoSelection:
+    def _lm(self):
+        return DummyLM(
+            [{"reasoning": "r", "entities": "[]", "redacted_text": "Hello"}] * 2
+        )
+
+    def test_sends_only_selected_demos(self):
+        lm = self._lm()
+        redactor = PIIRedactor(demo_k=2)
+        with dspy.context(lm=lm):
+            redactor(text="Email john.doe@gmail.com")
+        demo_turns = len(lm.history[-1]["messages"]) - 2
+        assert 2 * 2 <= demo_turns <= 2 * (2 + redactor.demo_selector.max_fillers)
+
+    def test_without_demo_k_passes_text_only(self):
+        redactor = PIIRedactor()
+        assert redactor._inputs("hi") == {"text": "hi"}
+
+    def test_base_program_reports_added_tokens(self):
+        # The base program sends no demos, so selection adds prompt tokens.
+        redactor = PIIRedactor(demo_k=2)
+        redactor.demo_selector.select("Email john.doe@gmail.com")
+        assert redactor.demo_selector.baseline_tokens == 0
+        assert redactor.demo_selector.tokens_saved < 0
+
+    def test_loaded_program_saves_against_its_demos(self):
+        redactor = PIIRedactor(demo_k=1)
+        redactor.cot.predict.demos = as_demo_list(EXAMPLES)
+        selector = redactor.demo_selector
+        selector.select("Email john.doe@gmail.com")
+        assert selector.baseline_tokens == selector.total_demo_tokens
+        assert selector.tokens_saved > 0
+
+    def test_rebuilds_selector_when_pool_changes(self):
+        redactor = PIIRedactor(demo_k=1)
+        first = redactor.demo_selector
+        redactor.cot.predict.demos = [_demo("Passport on file", "PASSPORT")]
+        assert redactor.demo_selector is not first
+        assert len(redactor.demo_selector.demos) == 1
@@ -0,0 +1,50 @@
+import dspy
+
+from eval_journal import EvalJournal, selection_key
+from example_store import ExampleSequence
+
+
+def _examples(*texts):
+    return [dspy.Example(text=t, redacted_text=t).with_inputs("text") for t in texts]
+
+
+class TestSelectionKey:
+    def test_depends_on_examples_and_settings(self):
+        base = selection_key(_examples("a", "b"), model="m")
+        assert base == selection_key(_examples("a", "b"), model="m")
+        assert base != selection_key(_examples("b", "a"), model="m")
+        assert base != selection_key(_examples("a", "b"), model="other")
+
+
+class _UnreadableRows(list):
+    _fingerprint = "fp"
+
+    def __getitem__(self, i):
+        raise AssertionError("rows must not be read")
+
+
+class TestSelectionKeyByRowIds:
+    def test_keys_dataset_selection_without_reading_rows(self):
+        rows = _UnreadableRows([{}] * 3)
+        base = selection_key(ExampleSequence(rows, [5, 6, 7]), model="m")
+        assert base == selection_key(ExampleSequence(rows, [5, 6, 7]), model="m")
+        assert base != selection_key(ExampleSequence(rows, [5, 6, 8]), model="m")
+        other = _UnreadableRows([{}] * 3)
+        other._fingerprint = "changed"
+        assert base != selection_key(ExampleSequence(other, [5, 6, 7]), model="m")
+
+
+class TestEvalJournal:
+    def test_reloads_recorded_rows(self, tmp_path):
+        journal = EvalJournal(tmp_path / "run.jsonl")
+        journal.record(3, score=0.5, prediction={"redacted_text": "x"})
+        journal.close()
+        reopened = EvalJournal(tmp_path / "run.jsonl")
+        assert 3 in reopened
+        assert reopened.rows[3]["score"] == 0.5
+
+    def test_ignores_torn_last_line(self, tmp_path):
+        path = tmp_path / "run.jsonl"
+        path.write_text('{"index": 0, "score": 1.0}\n{"index": 1, "sc')
+        journal = EvalJournal(path)
+        assert list(journal.rows) == [0]
@@ -1,7 +1,13 @@
-from unittest.mock import MagicMock
+import itertools
+from unittest.mock import MagicMock, patch
 
+import dspy
+import pytest
+from datasets import Dataset
+from dspy.utils.dummies import DummyLM
 
-from evaluator import prepare_eval_examples
+from evaluator import _program_key, evaluate, prepare_eval_examples, rescore
+from optimizer import label_mask
 
 
 class TestPrepareEvalExamples:
@@ -115,3 +121,223 @@ class TestPrepareEvalExamplesRandomize:
         prepare_eval_examples(ds, eval_size=50, randomize=True)
         indices = ds.select.call_args[0][0]
         assert len(indices) == 20
+
+
+class TestPrepareEvalExamplesStratify:
+    def test_covers_every_label_in_a_small_sample(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("OPTIMIZE_TRAIN_SIZE", "10")
+        monkeypatch.setenv("OPTIMIZE_VAL_SIZE", "0")
+        monkeypatch.setenv("EVALUATE_SEED", "1")
+        targets = ["[PASSPORT]" if i % 50 == 0 else "[TEL]" for i in range(500)]
+        ds = Dataset.from_dict(
+            {
+                "source_text": [f"text {i}" for i in range(500)],
+                "target_text": targets,
+                "label_mask": [label_mask(t) for t in targets],
+            }
+        )
+        examples = prepare_eval_examples(
+            ds,
+            eval_size=6,
+            stratify=True,
+            min_per_label=3,
+            label_index_path=str(tmp_path / "index.npz"),
+        )
+        assert len(examples) == 6
+        passports = [ex for ex in examples if ex.redacted_text == "[PASSPORT]"]
+        assert len(passports) == 3
+        assert min(ex.row_id for ex in examples) >= 10
+
+
+class _FlakyProgram(dspy.Module):
+    def __init__(self, fail_on=()):
+        super().__init__()
+        self.fail_on = set(fail_on)
+        self.seen = []
+
+    def forward(self, text):
+        self.seen.append(text)
+        if text in self.fail_on:
+            raise RuntimeError("rate limited")
+        return dspy.Prediction(entities=[], redacted_text=text)
+
+
+def _eval_examples():
+    return [
+        dspy.Example(text=t, redacted_text=t, row_id=row_id).with_inputs("text")
+        for row_id, t in enumerate(("a", "b", "c"), start=100)
+    ]
+
+
+def _patched(program, examples=None):
+    examples = _eval_examples() if examples is None else examples
+    return (
+        patch("evaluator.download_dataset"),
+        patch("evaluator.prepare_eval_examples", return_value=examples),
+        patch("evaluator.load_optimized_model", return_value=program),
+        patch("evaluator.ScheduledLM", return_value=DummyLM([])),
+    )
+
+
+def _evaluate(tmp_path, program, model="m", journal="journal", examples=None, **kwargs):
+    a, b, c, d = _patched(program, examples)
+    with a, b, c, d:
+        return evaluate(
+            "key",
+            model,
+            journal_dir=str(tmp_path / journal),
+            store_path=str(tmp_path / "predictions.sqlite"),
+            **kwargs,
+        )
+
+
+class TestEvaluateJournal:
+    def test_resume_skips_scored_examples(self, tmp_path):
+        first = _FlakyProgram(fail_on={"b"})
+        assert _evaluate(tmp_path, first) == pytest.approx(66.67)
+
+        second = _FlakyProgram()
+        assert _evaluate(tmp_path, second) == 100.0
+        assert second.seen == ["b"]
+
+    def test_fresh_discards_journal(self, tmp_path):
+        _evaluate(tmp_path, _FlakyProgram())
+        again = _FlakyProgram()
+        _evaluate(tmp_path, again, fresh=True)
+        assert sorted(again.seen) == ["a", "b", "c"]
+
+
+class TestSequentialEvaluate:
+    def _examples(self, n):
+        # the program echoes its input, so every third example scores 0
+        return [
+            dspy.Example(
+                text=f"[TEL] {i}" if i % 3 else f"{i}",
+                redacted_text=f"[TEL] {i}",
+                row_id=i,
+            ).with_inputs("text")
+            for i in range(n)
+        ]
+
+    def test_stops_once_interval_is_narrow(self, tmp_path):
+        program = _FlakyProgram()
+        score = _evaluate(
+            tmp_path,
+            program,
+            examples=self._examples(3000),
+            ci_width=10.0,
+            wave_size=100,
+        )
+        # width ~ 2 * 1.96 * 47 / sqrt(n) <= 10 needs n ~ 340
+        assert len(program.seen) == 400
+        assert score == pytest.approx(66.67, abs=0.5)
+
+    def test_time_budget_stops_after_first_wave(self, tmp_path):
+        program = _FlakyProgram()
+        # each perf_counter() call advances the clock by a second; the first
+        # wave alone takes two calls per example
+        with patch("evaluator.time.perf_counter", side_effect=itertools.count()):
+            _evaluate(
+                tmp_path,
+                program,
+                examples=self._examples(300),
+                max_seconds=50,
+                wave_size=50,
+            )
+        assert len(program.seen) == 50
+
+    def test_runs_everything_when_interval_stays_wide(self, tmp_path):
+        program = _FlakyProgram()
+        _evaluate(tmp_path, program, examples=self._examples(60), ci_width=0.1)
+        assert len(program.seen) == 60
+
+
+class TestPredictionStoreReuse:
+    def test_new_selection_reuses_stored_predictions(self, tmp_path):
+        _evaluate(tmp_path, _FlakyProgram())
+        again = _FlakyProgram()
+        assert _evaluate(tmp_path, again, journal="other") == 100.0
+        assert again.seen == []
+
+    def test_other_model_is_not_reused(self, tmp_path):
+        _evaluate(tmp_path, _FlakyProgram())
+        again = _FlakyProgram()
+        _evaluate(tmp_path, again, model="other-model", journal="j2")
+        assert sorted(again.seen) == ["a", "b", "c"]
+
+    def test_cascade_is_keyed_separately(self, tmp_path):
+        _evaluate(tmp_path, _FlakyProgram())
+        again = _FlakyProgram()
+        score = _evaluate(tmp_path, again, journal="j2", cascade_model="cheap")
+        assert score == 100.0
+        # echoed texts validate, so the cheap model answers every example
+        assert sorted(again.seen) == ["a", "b", "c"]
+
+    def test_reuse_builds_only_stored_examples(self, tmp_path):
+        from evaluator import _reuse_stored
+        from example_store import ExampleSequence
+        from prediction_store import PredictionStore
+
+        read = []
+
+        class Rows(list):
+            def __getitem__(self, i):
+                read.append(i)
+                return super().__getitem__(i)
+
+        rows = Rows({"source_text": t, "target_text": t} for t in "abc")
+        eval_set = ExampleSequence(rows, [100, 101, 102])
+        store = PredictionStore(str(tmp_path / "p.sqlite"))
+        store.put("prog", "m", 101, {"entities": [], "redacted_text": "b"})
+        recorded = []
+        missing = _reuse_stored(
+            store,
+            "prog",
+            "m",
+            eval_set,
+            [0, 1, 2],
+            lambda i, *a, **k: recorded.append(i),
+        )
+        store.close()
+        assert missing == [0, 2]
+        assert recorded == [1]
+        assert read == [1]
+
+    def test_get_many_looks_up_only_requested_rows(self, tmp_path):
+        from prediction_store import _QUERY_CHUNK, PredictionStore
+
+        store = PredictionStore(str(tmp_path / "p.sqlite"))
+        for row_id in range(_QUERY_CHUNK * 2 + 5):
+            store.put("prog", "m", row_id, {"redacted_text": str(row_id)})
+        store.put("prog", "other", 3, {"redacted_text": "other"})
+        wanted = [3, _QUERY_CHUNK + 1, _QUERY_CHUNK * 2 + 4, 10**6]
+        found = store.get_many("prog", "m", wanted)
+        store.close()
+        assert sorted(found) == wanted[:3]
+        assert found[3] == {"redacted_text": "3"}
+
+    def test_output_options_change_program_key(self):
+        program = _FlakyProgram()
+        keys = {
+            _program_key(program, None),
+            _program_key(program, 800),
+            _program_key(program, None, repair=True),
+            _program_key(program, None, cascade_model="cheap"),
+        }
+        assert len(keys) == 4
+
+    def test_rescore_uses_current_metric_without_lm(self, tmp_path):
+        _evaluate(tmp_path, _FlakyProgram())
+        a, b, c, lm = _patched(_FlakyProgram())
+        with (
+            a,
+            b,
+            c,
+            lm as mock_lm,
+            patch("evaluator.score_batch") as mock_score,
+        ):
+            mock_score.return_value.score = 0.5
+            score = rescore("m", store_path=str(tmp_path / "predictions.sqlite"))
+        assert score == 50.0
+        mock_score.assert_called_once_with(["a", "b", "c"], ["a", "b", "c"])
+        mock_lm.assert_not_called()
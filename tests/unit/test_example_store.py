@@ -0,0 +1,53 @@
+import random
+
+from datasets import Dataset
+
+from example_store import ExampleSequence
+
+
+def _dataset(n):
+    return Dataset.from_dict(
+        {
+            "source_text": [f"text {i}" for i in range(n)],
+            "target_text": [f"redacted {i}" for i in range(n)],
+            "id": [f"id{i}" for i in range(n)],
+            "privacy_mask": [[{"label": "X"}] for _ in range(n)],
+        }
+    )
+
+
+class TestExampleSequence:
+    def test_builds_examples_on_access(self):
+        ds = _dataset(10)
+        seq = ExampleSequence(ds.select(range(3, 8)), range(3, 8))
+        assert len(seq) == 5
+        ex = seq[1]
+        assert ex.text == "text 4"
+        assert ex.redacted_text == "redacted 4"
+        assert ex.row_id == 4
+        assert ex.id == "id4"
+        assert list(ex.inputs().keys()) == ["text"]
+
+    def test_prunes_unused_columns(self):
+        seq = ExampleSequence(_dataset(3), range(3))
+        assert "privacy_mask" not in seq[0]
+        assert seq._rows.column_names == ["source_text", "target_text", "id"]
+
+    def test_slices_are_lazy_views(self):
+        seq = ExampleSequence(_dataset(10), range(10))
+        tail = seq[6:]
+        assert isinstance(tail, ExampleSequence)
+        assert [ex.row_id for ex in tail] == [6, 7, 8, 9]
+        assert [ex.row_id for ex in seq[::3][1:]] == [3, 6, 9]
+        assert seq[-1].row_id == 9
+
+    def test_random_access_and_sampling(self):
+        seq = ExampleSequence(_dataset(20), range(20))
+        picked = random.Random(0).sample(seq, 5)
+        assert all(ex.text == f"text {ex.row_id}" for ex in picked)
+
+    def test_accepts_row_dicts(self):
+        rows = [{"source_text": "a", "target_text": "b"}]
+        (ex,) = list(ExampleSequence(rows, [42]))
+        assert (ex.text, ex.redacted_text, ex.row_id) == ("a", "b", 42)
+        assert "id" not in ex
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+
+import dspy
+
+from hedging import HedgedRedactor, Hedger
+
+
+class _SlowFirstCall(dspy.Module):
+    """Answers in 10ms, except the first call for a text in slow_texts (0.5s)."""
+
+    def __init__(self, slow_texts=()):
+        super().__init__()
+        self.slow_texts = set(slow_texts)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _delay(self, text):
+        with self._lock:
+            first = text not in self.calls
+            self.calls.append(text)
+        return 0.5 if first and text in self.slow_texts else 0.01
+
+    def forward(self, text):
+        time.sleep(self._delay(text))
+        return dspy.Prediction(entities=[], redacted_text=f"done:{text}")
+
+    async def aforward(self, text):
+        await asyncio.sleep(self._delay(text))
+        return dspy.Prediction(entities=[], redacted_text=f"done:{text}")
+
+
+def _warm_hedger(max_rate=1.0):
+    hedger = Hedger(percentile=90, max_rate=max_rate, min_samples=5)
+    for _ in range(10):
+        hedger._observe(0.01)
+    return hedger
+
+
+class TestHedger:
+    def test_no_delay_without_history(self):
+        assert Hedger(min_samples=3).delay() is None
+
+    def test_delay_is_latency_percentile(self):
+        hedger = Hedger(percentile=50, min_samples=1)
+        for latency in (1.0, 2.0, 3.0):
+            hedger._observe(latency)
+        assert hedger.delay() == 2.0
+
+
+class TestHedgedRedactor:
+    def test_hedge_beats_slow_call(self):
+        program = _SlowFirstCall(slow_texts={"x"})
+        hedged = HedgedRedactor(program, _warm_hedger())
+        start = time.perf_counter()
+        assert hedged(text="x").redacted_text == "done:x"
+        assert time.perf_counter() - start < 0.3
+        assert program.calls == ["x", "x"]
+        stats = hedged.hedger.stats()
+        assert (stats.hedges, stats.hedge_wins) == (1, 1)
+        time.sleep(0.6)  # the original call finishes in the background
+        assert hedged.hedger.stats().saved_seconds > 0.3
+
+    def test_fast_calls_are_not_hedged(self):
+        program = _SlowFirstCall()
+        hedged = HedgedRedactor(program, _warm_hedger())
+        for text in "abc":
+            hedged(text=text)
+        assert hedged.hedger.stats().hedges == 0
+        assert program.calls == ["a", "b", "c"]
+
+    def test_hedge_rate_is_capped(self):
+        program = _SlowFirstCall(slow_texts={"x", "y"})
+        hedged = HedgedRedactor(program, _warm_hedger(max_rate=0.5))
+        hedged(text="x")  # 1 request: 1 hedge would be 100% > 50%
+        hedged(text="y")  # 2 requests: 1 hedge allowed
+        stats = hedged.hedger.stats()
+        assert (stats.requests, stats.hedges) == (2, 1)
+        assert stats.hedge_rate == 0.5
+
+    def test_async_hedge(self):
+        program = _SlowFirstCall(slow_texts={"x"})
+        hedged = HedgedRedactor(program, _warm_hedger())
+
+        async def main():
+            start = time.perf_counter()
+            pred = await hedged.acall(text="x")
+            return pred, time.perf_counter() - start
+
+        pred, elapsed = asyncio.run(main())
+        assert pred.redacted_text == "done:x"
+        assert elapsed < 0.3
+        assert hedged.hedger.stats().hedge_wins == 1
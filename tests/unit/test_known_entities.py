@@ -0,0 +1,132 @@
+import asyncio
+import copy
+import time
+from unittest.mock import MagicMock, patch
+
+import dspy
+import pytest
+
+from known_entities import (
+    EntityMatcher,
+    EntityScope,
+    EntityStore,
+    KnownEntityRedactor,
+    ScopeExpiredError,
+)
+
+
+class TestEntityMatcher:
+    def test_finds_all_values_in_one_pass(self):
+        matcher = EntityMatcher({"Balloi": "GIVENNAME1", "bballoi@yahoo.com": "EMAIL"})
+        text = "Balloi wrote from bballoi@yahoo.com"
+        assert matcher.find(text) == [(0, 6, "GIVENNAME1"), (18, 35, "EMAIL")]
+
+    def test_prefers_longest_match(self):
+        matcher = EntityMatcher({"Balloi": "GIVENNAME1", "Balloi Eckrich": "LASTNAME1"})
+        assert matcher.find("Hi Balloi Eckrich") == [(3, 17, "LASTNAME1")]
+
+    def test_overlapping_suffixes(self):
+        matcher = EntityMatcher({"he": "A", "she": "B", "hers": "C"})
+        assert [label for *_, label in matcher.find("ushers she he")] == ["B", "A"]
+
+    def test_respects_word_boundaries(self):
+        matcher = EntityMatcher({"Ann": "GIVENNAME1"})
+        assert matcher.find("Anna met Ann.") == [(9, 12, "GIVENNAME1")]
+
+
+class TestEntityScope:
+    def test_redacts_learned_values(self):
+        scope = EntityScope("doc")
+        scope.add([{"value": "Balloi Eckrich", "label": "GIVENNAME1"}])
+        text, found = scope.redact("Ask Balloi Eckrich.")
+        assert text == "Ask [GIVENNAME1]."
+        assert found[0].value == "Balloi Eckrich"
+
+    def test_skips_short_values(self):
+        scope = EntityScope("doc")
+        scope.add([{"value": "F", "label": "SEX"}])
+        assert len(scope) == 0
+
+    def test_size_limit_drops_oldest(self):
+        scope = EntityScope("doc", max_entries=2)
+        scope.add([{"value": v, "label": "USERNAME"} for v in ("aaa", "bbb", "ccc")])
+        assert scope.redact("aaa bbb ccc")[0] == "aaa [USERNAME] [USERNAME]"
+
+    def test_ttl_expiry(self):
+        with patch("known_entities.time.monotonic", return_value=100.0):
+            scope = EntityScope("tenant", ttl=10)
+        with patch("known_entities.time.monotonic", return_value=111.0):
+            assert scope.expired
+
+    def test_deepcopy_shares_scope(self):
+        scope = EntityScope("doc")
+        assert copy.deepcopy(scope) is scope
+
+
+class TestEntityStore:
+    def test_open_returns_same_scope(self):
+        store = EntityStore()
+        assert store.open("t1") is store.open("t1")
+
+    def test_expired_scope_is_replaced(self):
+        store = EntityStore()
+        scope = store.open("t1", ttl=0)
+        time.sleep(0.001)
+        assert store.open("t1") is not scope
+
+    def test_open_drops_expired_scopes(self):
+        store = EntityStore()
+        store.open("old", ttl=0)
+        time.sleep(0.001)
+        store.open("other")
+        assert "old" not in store._scopes
+
+    def test_scoped_closes_on_exit(self):
+        store = EntityStore()
+        with store.scoped("batch") as scope:
+            scope.add([{"value": "Jane", "label": "GIVENNAME1"}])
+        assert len(store.open("batch")) == 0
+
+
+class TestKnownEntityRedactor:
+    def test_pre_redacts_and_learns(self):
+        scope = EntityScope("thread")
+        program = MagicMock(
+            return_value=dspy.Prediction(
+                entities=[{"value": "Balloi", "label": "GIVENNAME1"}],
+                redacted_text="Hi [GIVENNAME1]",
+            )
+        )
+        redactor = KnownEntityRedactor(program, scope)
+        redactor(text="Hi Balloi")
+        program.reset_mock()
+        program.return_value = dspy.Prediction(
+            entities=[], redacted_text="Bye [GIVENNAME1]"
+        )
+        pred = redactor(text="Bye Balloi")
+        program.assert_called_once_with(text="Bye [GIVENNAME1]")
+        assert pred.entities[0].value == "Balloi"
+
+    def test_expired_scope_raises(self):
+        scope = EntityScope("tenant", ttl=0)
+        scope.add([{"value": "Balloi", "label": "GIVENNAME1"}])
+        time.sleep(0.001)
+        program = MagicMock()
+        redactor = KnownEntityRedactor(program, scope)
+        with pytest.raises(ScopeExpiredError, match="tenant"):
+            redactor(text="Hi Balloi")
+        with pytest.raises(ScopeExpiredError):
+            asyncio.run(redactor.acall(text="Hi Balloi"))
+        program.assert_not_called()
+
+    def test_known_values_never_leak(self):
+        scope = EntityScope("thread")
+        scope.add([{"value": "bballoi@yahoo.com", "label": "EMAIL"}])
+        # Model echoes a known value back in its output
+        program = MagicMock(
+            return_value=dspy.Prediction(
+                entities=[], redacted_text="reply to bballoi@yahoo.com"
+            )
+        )
+        pred = KnownEntityRedactor(program, scope)(text="reply to me")
+        assert pred.redacted_text == "reply to [EMAIL]"
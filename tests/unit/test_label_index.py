@@ -0,0 +1,75 @@
+import numpy as np
+from datasets import Dataset
+
+from label_index import LabelIndex, load_label_index
+from optimizer import PII_LABELS, label_mask
+
+
+def _bit(label):
+    return 1 << PII_LABELS.index(label)
+
+
+def _masks(n=1000):
+    """Every row has TEL; every 100th also PASSPORT; rows 0-9 also EMAIL."""
+    masks = np.full(n, _bit("TEL"), dtype=np.uint32)
+    masks[::100] |= _bit("PASSPORT")
+    masks[:10] |= _bit("EMAIL")
+    return masks
+
+
+class TestLabelIndex:
+    def test_rows_per_label(self):
+        index = LabelIndex.build(_masks())
+        assert index.rows("PASSPORT").tolist() == list(range(0, 1000, 100))
+        assert len(index.rows("TEL")) == 1000
+        assert len(index.rows("GEOCOORD")) == 0
+
+    def test_stratified_sample_covers_rare_labels(self):
+        index = LabelIndex.build(_masks())
+        rows = index.stratified_sample(
+            range(100, 1000), 20, 5, np.random.default_rng(0)
+        )
+        counts = index.label_counts(rows)
+        assert len(rows) == 20
+        assert counts["PASSPORT"] >= 5
+        assert counts["TEL"] == 20
+        assert rows.min() >= 100
+        assert list(rows) == sorted(rows)
+
+    def test_minimums_win_over_size(self):
+        index = LabelIndex.build(_masks())
+        rows = index.stratified_sample(range(0, 1000), 5, 8, np.random.default_rng(0))
+        counts = index.label_counts(rows)
+        assert counts["EMAIL"] == 8
+        assert counts["PASSPORT"] == 8
+        assert len(rows) >= 8
+
+    def test_seeded_sample_is_reproducible(self):
+        index = LabelIndex.build(_masks())
+        a = index.stratified_sample(range(1000), 50, 3, np.random.default_rng(7))
+        b = index.stratified_sample(range(1000), 50, 3, np.random.default_rng(7))
+        assert a.tolist() == b.tolist()
+
+
+class TestLoadLabelIndex:
+    def _dataset(self, targets):
+        return Dataset.from_dict(
+            {"target_text": targets, "label_mask": [label_mask(t) for t in targets]}
+        )
+
+    def test_caches_by_fingerprint(self, tmp_path, monkeypatch):
+        path = str(tmp_path / "index.npz")
+        ds = self._dataset(["[TEL]", "[EMAIL]", "x"])
+        assert load_label_index(ds, path).rows("EMAIL").tolist() == [1]
+
+        def fail(masks):
+            raise AssertionError("rebuilt")
+
+        monkeypatch.setattr(LabelIndex, "build", fail)
+        assert load_label_index(ds, path).rows("TEL").tolist() == [0]
+
+    def test_rebuilds_for_another_dataset(self, tmp_path):
+        path = str(tmp_path / "index.npz")
+        load_label_index(self._dataset(["[TEL]"]), path)
+        index = load_label_index(self._dataset(["x", "[TEL]"]), path)
+        assert index.rows("TEL").tolist() == [1]
@@ -1,14 +1,22 @@
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import dspy
+from datasets import Dataset
 
 from optimizer import (
+    PII_LABELS,
+    download_dataset,
     extract_pii_labels,
     hybrid_pii_score,
+    label_mask,
     load_optimized_model,
+    mask_labels,
+    optimized_model_path,
     pii_metric,
     prepare_examples,
+    score_pii,
 )
+from redactor import PIIRedactor
 
 
 class TestExtractPiiLabels:
@@ -184,6 +192,92 @@ class TestPiiMetric:
         assert result.score == 1.0
 
 
+class TestLazyFeedback:
+    gold = dspy.Example(redacted_text="Call [GIVENNAME1] at [TEL]")
+    pred = dspy.Prediction(redacted_text="Call [LASTNAME1] at 555-1234")
+
+    @patch("optimizer._build_feedback", return_value="fb")
+    def test_score_only_skips_feedback(self, mock_build):
+        assert pii_metric(self.gold, self.pred).score == 0.75 * 0.5
+        mock_build.assert_not_called()
+
+    @patch("optimizer._build_feedback", return_value="fb")
+    def test_gepa_call_builds_feedback_once(self, mock_build):
+        result = pii_metric(self.gold, self.pred, trace=None, pred_name="cot.predict")
+        mock_build.assert_called_once()
+        assert result["feedback"] == result.feedback == "fb"
+        mock_build.assert_called_once()
+
+    def test_breakdown_counts(self):
+        b = pii_metric(self.gold, self.pred).breakdown
+        assert (b.total_gold, b.total_pred, b.detected, b.num_correct) == (2, 1, 1, 0)
+
+
+class TestScorePii:
+    def test_matches_hybrid_pii_score(self):
+        b = score_pii("[TEL] [EMAIL] [TEL]", "[TEL] [CITY]")
+        assert hybrid_pii_score("[TEL] [EMAIL] [TEL]", "[TEL] [CITY]") == (
+            b.detection_recall,
+            b.classification_acc,
+            b.hybrid_score,
+            b.num_correct,
+        )
+
+
+class TestLabelMask:
+    def test_sets_one_bit_per_label(self):
+        mask = label_mask("[TEL] and [EMAIL], again [TEL]")
+        assert mask == (1 << PII_LABELS.index("TEL")) | (1 << PII_LABELS.index("EMAIL"))
+        assert mask_labels(mask) == ["TEL", "EMAIL"]
+
+    def test_ignores_unknown_labels(self):
+        assert label_mask("no pii [NOTALABEL]") == 0
+
+
+def _raw_dataset():
+    return Dataset.from_dict(
+        {
+            "id": ["1A", "40767A", "2A", "3A"],
+            "language": ["English", "English", "French", "English"],
+            "source_text": ["Hi John", "demo", "Salut", "Call 555"],
+            "target_text": ["Hi [GIVENNAME1]", "demo", "Salut", "Call [TEL]"],
+            "privacy_mask": [[], [], [], []],
+        }
+    )
+
+
+class TestDownloadDataset:
+    def _download(self, tmp_path):
+        with patch("optimizer.load_dataset", return_value=_raw_dataset()) as load:
+            ds = download_dataset(str(tmp_path / "raw"), str(tmp_path / "proc"), 1)
+        return ds, load
+
+    def test_filters_prunes_and_adds_columns(self, tmp_path):
+        ds, _ = self._download(tmp_path)
+        assert ds["id"] == ["1A", "3A"]
+        assert ds.column_names == [
+            "id",
+            "source_text",
+            "target_text",
+            "length",
+            "label_mask",
+        ]
+        assert ds["length"] == [7, 8]
+        assert [mask_labels(m) for m in ds["label_mask"]] == [["GIVENNAME1"], ["TEL"]]
+
+    def test_second_call_loads_from_disk(self, tmp_path):
+        self._download(tmp_path)
+        ds, load = self._download(tmp_path)
+        load.assert_not_called()
+        assert len(ds) == 2
+
+    def test_rebuilds_legacy_layout(self, tmp_path):
+        _raw_dataset().save_to_disk(str(tmp_path / "proc"))
+        ds, load = self._download(tmp_path)
+        load.assert_called_once()
+        assert "label_mask" in ds.column_names
+
+
 class TestPrepareExamples:
     def _make_dataset(self, n):
         rows = [
@@ -229,3 +323,73 @@ class TestLoadOptimizedModel:
             "optimizer.OPTIMIZED_MODEL_PATH", str(tmp_path / "nope.json")
         )
         assert load_optimized_model() is None
+
+    def test_passes_redactor_kwargs(self, tmp_path, monkeypatch):
+        path = tmp_path / "model.json"
+        PIIRedactor().save(str(path), save_program=False)
+        monkeypatch.setattr("optimizer.OPTIMIZED_MODEL_PATH", str(path))
+        redactor = load_optimized_model(entities_only=True)
+        assert redactor.entities_only
+        assert len(redactor.cot.demos) == len(PIIRedactor().cot.demos)
+
+    def test_entities_only_keeps_its_signature(self, tmp_path, monkeypatch):
+        from redactor import IdentifyPIIEntities
+
+        saved = PIIRedactor()
+        predict = saved.cot.predict
+        predict.signature = predict.signature.with_instructions("Optimized.")
+        predict.demos = [dspy.Example(text="hi", entities=[], redacted_text="hi")]
+        path = tmp_path / "model.json"
+        saved.save(str(path), save_program=False)
+        monkeypatch.setattr("optimizer.OPTIMIZED_MODEL_PATH", str(path))
+
+        redactor = load_optimized_model(entities_only=True)
+        signature = redactor.cot.predict.signature
+        assert signature.instructions == IdentifyPIIEntities.instructions
+        assert (
+            "character offset"
+            in signature.output_fields["entities"].json_schema_extra["desc"]
+        )
+        assert "redacted_text" not in signature.output_fields
+        assert len(redactor.cot.predict.demos) == 1
+
+        full = load_optimized_model()
+        assert full.cot.predict.signature.instructions == "Optimized."
+
+    def test_strategies_load_their_own_file(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("optimizer.OPTIMIZED_MODEL_PATH", str(tmp_path / "m.json"))
+        assert optimized_model_path("cot") == str(tmp_path / "m.json")
+        path = optimized_model_path("predict")
+        assert path == str(tmp_path / "m_predict.json")
+        PIIRedactor(strategy="predict").save(path, save_program=False)
+        assert load_optimized_model() is None
+        assert load_optimized_model(strategy="predict").strategy == "predict"
+
+
+class TestPurgeRedactionCache:
+    def test_purges_only_the_optimized_strategy(self, tmp_path, monkeypatch):
+        from cache import RedactionCache
+        from optimizer import _purge_redaction_cache, _strategy_program_hashes
+        from redactor import program_hash
+
+        cache_path = str(tmp_path / "c.sqlite")
+        monkeypatch.setattr("cache.CACHE_PATH", cache_path)
+        monkeypatch.setattr("optimizer.OPTIMIZED_MODEL_PATH", str(tmp_path / "m.json"))
+        cache = RedactionCache(cache_path)
+        cot = program_hash(PIIRedactor())
+        old = program_hash(PIIRedactor(strategy="predict"))
+        cache.put("cot", {"v": 1}, program=cot)
+        cache.put("old", {"v": 2}, program=old)
+
+        previous = _strategy_program_hashes("predict")
+        optimized = PIIRedactor(strategy="predict")
+        predict = optimized.identify
+        predict.signature = predict.signature.with_instructions("Optimized.")
+        optimized.save(optimized_model_path("predict"), save_program=False)
+        cache.put("new", {"v": 3}, program=program_hash(optimized))
+        _purge_redaction_cache("predict", previous)
+
+        cache = RedactionCache(cache_path)
+        assert cache.get("cot") == {"v": 1}
+        assert cache.get("old") is None
+        assert cache.get("new") == {"v": 3}
@@ -0,0 +1,250 @@
+import json
+import threading
+from unittest.mock import MagicMock
+
+import dspy
+import pytest
+from dspy.utils.dummies import DummyLM
+
+from eval_journal import EvalJournal
+from evaluator import _evaluate_packed, _journal_result
+from optimizer import pii_metric
+from packing import (
+    PACK_INSTRUCTIONS,
+    PackedRedactor,
+    PackError,
+    format_pack,
+    pack_texts,
+    split_pack,
+)
+from redactor import PIIRedactor
+
+
+def _single():
+    program = MagicMock()
+    program.side_effect = lambda text: dspy.Prediction(
+        entities=[], redacted_text=f"single:{text}"
+    )
+    return program
+
+
+def _failing_on(bad):
+    """Single-call program that echoes its text, failing on text == bad."""
+
+    def call(text):
+        if text == bad:
+            raise RuntimeError("rate limited")
+        return dspy.Prediction(entities=[], redacted_text=text)
+
+    return MagicMock(side_effect=call)
+
+
+def _packed_lm(*responses):
+    return DummyLM([{"reasoning": "r", "results": json.dumps(r)} for r in responses])
+
+
+def _doc(n, text):
+    return {"doc": n, "entities": [], "redacted_text": text}
+
+
+class TestPackTexts:
+    def test_respects_token_budget(self):
+        texts = ["x" * 40] * 10  # ~14 tokens each with the marker
+        packs = pack_texts(texts, max_tokens=50)
+        assert [len(p) for p in packs] == [3, 3, 3, 1]
+        assert sum(packs, []) == list(range(10))
+
+    def test_caps_docs_per_pack(self):
+        assert [len(p) for p in pack_texts(["hi"] * 5, max_docs=2)] == [2, 2, 1]
+
+    def test_oversized_and_marker_texts_go_alone(self):
+        texts = ["a", "b", "x" * 1000, "c", "see [[DOC 2]]", "d", "e"]
+        packs = pack_texts(texts, max_tokens=50)
+        assert packs == [[0, 1], [2], [3], [4], [5, 6]]
+
+
+class TestSplitPack:
+    def test_orders_by_doc(self):
+        pred = dspy.Prediction(
+            results=[
+                MagicMock(doc=2, entities=[], redacted_text="b"),
+                MagicMock(doc=1, entities=[], redacted_text="a"),
+            ]
+        )
+        assert [p.redacted_text for p in split_pack(pred, 2)] == ["a", "b"]
+
+    def test_count_mismatch_raises(self):
+        pred = dspy.Prediction(results=[MagicMock(doc=1)])
+        with pytest.raises(PackError):
+            split_pack(pred, 2)
+
+    def test_format_pack_numbers_documents(self):
+        assert format_pack(["a", "b"]) == "[[DOC 1]]\na\n\n[[DOC 2]]\nb"
+
+
+class TestPackedRedactor:
+    def test_one_call_per_pack(self):
+        lm = _packed_lm([_doc(1, "A"), _doc(2, "B"), _doc(3, "C")])
+        packer = PackedRedactor(_single())
+        with dspy.context(lm=lm):
+            preds = packer.redact_batch(["a", "b", "c"])
+        assert [p.redacted_text for p in preds] == ["A", "B", "C"]
+        assert len(lm.history) == 1
+        assert packer.packs == 1
+
+    def test_falls_back_on_count_mismatch(self):
+        lm = _packed_lm([_doc(1, "A")])
+        single = _single()
+        packer = PackedRedactor(single)
+        with dspy.context(lm=lm):
+            preds = packer.redact_batch(["a", "b"])
+        assert [p.redacted_text for p in preds] == ["single:a", "single:b"]
+        assert packer.fallbacks == 1
+
+    def test_falls_back_on_transport_error(self):
+        single = _single()
+        packer = PackedRedactor(single)
+        packer.packed = MagicMock(side_effect=ConnectionError("reset"))
+        preds = packer.redact_batch(["a", "b"])
+        assert [p.redacted_text for p in preds] == ["single:a", "single:b"]
+        assert packer.fallbacks == 1
+
+    def test_failed_item_is_returned_or_raised(self):
+        packer = PackedRedactor(_failing_on("b"))
+        packer.packed = MagicMock(side_effect=ConnectionError("reset"))
+        preds = packer.redact_batch(["a", "b", "c"], return_exceptions=True)
+        assert preds[0].redacted_text == "a"
+        assert isinstance(preds[1], RuntimeError)
+        assert preds[2].redacted_text == "c"
+        with pytest.raises(RuntimeError):
+            packer.redact_batch(["a", "b"])
+
+    def test_uses_program_instructions(self):
+        program = PIIRedactor()
+        program.cot.predict.signature = program.cot.predict.signature.with_instructions(
+            "Optimized instructions."
+        )
+        packer = PackedRedactor(program)
+        instructions = packer.packed.predict.signature.instructions
+        assert instructions.startswith(PACK_INSTRUCTIONS)
+        assert instructions.endswith("Optimized instructions.")
+
+    def test_entities_only_asks_for_entities_and_rebuilds_text(self):
+        lm = _packed_lm(
+            [
+                {"doc": 1, "entities": [{"value": "Ann", "label": "GIVENNAME1"}]},
+                {"doc": 2, "entities": []},
+            ]
+        )
+        packer = PackedRedactor(PIIRedactor(entities_only=True))
+        assert "redacted_text" not in packer.packed.predict.signature.output_fields
+        with dspy.context(lm=lm):
+            preds = packer.redact_batch(["Hi Ann", "hello"])
+        assert [p.redacted_text for p in preds] == ["Hi [GIVENNAME1]", "hello"]
+        assert packer.packs == 1
+
+    def test_repairs_each_packed_prediction(self):
+        from validation import ValidatedRedactor
+
+        leaked = {
+            "doc": 1,
+            "entities": [{"value": "Ann", "label": "GIVENNAME1"}],
+            "redacted_text": "Hi Ann",
+        }
+        lm = _packed_lm([leaked, _doc(2, "hello")])
+        validated = ValidatedRedactor(PIIRedactor())
+        packer = PackedRedactor(validated)
+        with dspy.context(lm=lm):
+            preds = packer.redact_batch(["Hi Ann", "hello"])
+        assert [p.redacted_text for p in preds] == ["Hi [GIVENNAME1]", "hello"]
+        assert (validated.calls, validated.repaired) == (2, 1)
+        assert packer.packs == 1
+
+    def test_rejects_wrappers_it_would_skip(self):
+        from rules import RulePrefilter
+
+        with pytest.raises(ValueError, match="RulePrefilter"):
+            PackedRedactor(RulePrefilter(PIIRedactor()))
+        with pytest.raises(ValueError, match="two_step"):
+            PackedRedactor(PIIRedactor(strategy="two_step"))
+
+    def test_single_text_uses_program(self):
+        packer = PackedRedactor(_single())
+        assert packer(text="x").redacted_text == "single:x"
+
+
+class TestEvaluatePacked:
+    def test_scores_with_pii_metric(self, tmp_path):
+        eval_set = [
+            dspy.Example(text="John", redacted_text="[GIVENNAME1]").with_inputs("text"),
+            dspy.Example(text="hi", redacted_text="hi").with_inputs("text"),
+        ]
+        lm = _packed_lm([_doc(1, "[GIVENNAME1]"), _doc(2, "hi")])
+        journal = EvalJournal(tmp_path / "j.jsonl")
+
+        def record(i, example, pred, **stats):
+            score = pii_metric(example, dspy.Prediction(**pred)).score
+            journal.record(i, prediction=pred, score=score, **stats)
+
+        with dspy.context(lm=lm):
+            _evaluate_packed(_single(), list(enumerate(eval_set)), 800, record)
+        assert _journal_result(eval_set, journal).score == 100.0
+
+    def test_failed_examples_are_not_recorded(self, tmp_path):
+        eval_set = [
+            dspy.Example(text=t, redacted_text=t).with_inputs("text")
+            for t in ("a", "b")
+        ]
+        single = _failing_on("b")
+        recorded = []
+
+        def record(i, example, pred, **stats):
+            recorded.append(i)
+
+        with dspy.context(lm=DummyLM([])):
+            # the packed call cannot parse, so both texts go single
+            _evaluate_packed(single, list(enumerate(eval_set)), 800, record)
+        assert recorded == [0]
+
+    def test_records_each_pack_as_it_completes(self, tmp_path):
+        # "slow" only finishes once "fast" has been recorded
+        fast_recorded = threading.Event()
+        eval_set = [
+            dspy.Example(text=t, redacted_text=t).with_inputs("text")
+            for t in ("slow", "fast")
+        ]
+
+        def call(text):
+            if text == "slow":
+                assert fast_recorded.wait(timeout=5)
+            return dspy.Prediction(entities=[], redacted_text=text)
+
+        recorded = []
+
+        def record(i, example, pred, **stats):
+            recorded.append(example.text)
+            fast_recorded.set()
+
+        # one text per pack
+        _evaluate_packed(
+            MagicMock(side_effect=call), list(enumerate(eval_set)), 1, record
+        )
+        assert recorded == ["fast", "slow"]
+
+    def test_interrupt_keeps_journaled_examples(self, tmp_path):
+        eval_set = [
+            dspy.Example(text=t, redacted_text=t).with_inputs("text")
+            for t in ("a", "b", "c")
+        ]
+        journal = EvalJournal(tmp_path / "j.jsonl")
+
+        def record(i, example, pred, **stats):
+            if len(journal.rows) == 1:
+                raise KeyboardInterrupt
+            journal.record(i, prediction=pred, score=1.0)
+
+        with pytest.raises(KeyboardInterrupt):
+            _evaluate_packed(
+                _failing_on(None), list(enumerate(eval_set)), 1, record, num_threads=1
+            )
+        assert len(EvalJournal(tmp_path / "j.jsonl").rows) == 1
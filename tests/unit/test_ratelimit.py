@@ -0,0 +1,207 @@
+import asyncio
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from dspy.utils.exceptions import LMRateLimitError
+
+from ratelimit import LMScheduler, ScheduledLM, TokenBucket, is_rate_limit
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _rate_limited(retry_after=None):
+    error = LMRateLimitError("quota")
+    error.retry_after = retry_after
+    return error
+
+
+class TestTokenBucket:
+    def test_waits_for_refill(self):
+        clock = _Clock()
+        bucket = TokenBucket(60, clock)  # one per second
+        bucket.take(60)
+        assert bucket.wait_time(2) == pytest.approx(2.0)
+        clock.now = 1.5
+        assert bucket.wait_time(1) == 0
+        assert bucket.wait_time(2) == pytest.approx(0.5)
+
+    def test_never_holds_more_than_a_minute(self):
+        clock = _Clock()
+        bucket = TokenBucket(60, clock)
+        clock.now = 600
+        bucket.take(60)
+        assert bucket.wait_time(1) == pytest.approx(1.0)
+
+
+class TestLMScheduler:
+    def test_success_grows_limit_additively(self):
+        scheduler = LMScheduler(initial_concurrency=4, max_concurrency=5)
+        for _ in range(8):
+            scheduler.run(lambda: "ok")
+        assert scheduler.limit == 5
+        assert scheduler.stats().completed == 8
+
+    def test_rate_limit_halves_limit_once_and_retries(self):
+        scheduler = LMScheduler(initial_concurrency=8)
+        attempts = iter([_rate_limited(0.01), _rate_limited(0.01), "ok"])
+
+        def call():
+            outcome = next(attempts)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        assert scheduler.run(call) == "ok"
+        stats = scheduler.stats()
+        assert stats.throttle_events == 2
+        assert stats.retries == 2
+        # both 429s fall in one DECREASE_INTERVAL: halved once, then +1/4
+        assert stats.limit == pytest.approx(4.25)
+
+    def test_other_errors_are_not_retried(self):
+        scheduler = LMScheduler()
+
+        def call():
+            raise ValueError("bad prompt")
+
+        with pytest.raises(ValueError):
+            scheduler.run(call)
+        assert scheduler.stats().retries == 0
+        assert scheduler.stats().in_flight == 0
+
+    def test_gives_up_after_max_retries(self):
+        scheduler = LMScheduler(max_retries=1)
+
+        def call():
+            raise _rate_limited(0.01)
+
+        with pytest.raises(LMRateLimitError):
+            scheduler.run(call)
+        assert scheduler.stats().throttle_events == 2
+
+    def test_caps_in_flight_at_limit(self):
+        scheduler = LMScheduler(initial_concurrency=2, max_concurrency=2)
+        active = peak = 0
+        lock = threading.Lock()
+
+        def call():
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+
+        threads = [
+            threading.Thread(target=scheduler.run, args=(call,)) for _ in range(6)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert peak == 2
+
+    def test_slow_calls_shrink_limit(self):
+        clock = _Clock()
+        scheduler = LMScheduler(initial_concurrency=10, latency_target=1, clock=clock)
+
+        def slow():
+            clock.now += 5
+            return "ok"
+
+        scheduler.run(slow)
+        assert scheduler.limit == pytest.approx(9.0)
+
+    def test_detects_status_429(self):
+        error = RuntimeError("wrapped")
+        error.__cause__ = type("HTTPError", (Exception,), {"status_code": 429})()
+        assert is_rate_limit(error)
+        assert not is_rate_limit(RuntimeError("other"))
+
+
+class _FakeLMHandler(BaseHTTPRequestHandler):
+    """OpenAI-style chat endpoint that answers every third request with a 429."""
+
+    counter = itertools.count()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        if next(self.counter) % 3 == 0:
+            status, headers = 429, {"Retry-After": "0.05"}
+            body = {"error": {"message": "quota exceeded", "type": "rate_limit"}}
+        else:
+            status, headers = 200, {}
+            body = {
+                "id": "x",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "fake",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "pong"},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 1},
+            }
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def fake_lm():
+    handler = type("Handler", (_FakeLMHandler,), {"counter": itertools.count()})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    scheduler = LMScheduler(initial_concurrency=4, max_concurrency=4)
+    yield ScheduledLM(
+        "openai/fake",
+        scheduler=scheduler,
+        api_base=f"http://127.0.0.1:{server.server_port}/v1",
+        api_key="test",
+        cache=False,
+    )
+    server.shutdown()
+
+
+class TestScheduledLM:
+    def test_retries_injected_429s(self, fake_lm):
+        results = [fake_lm(f"ping {i}") for i in range(4)]
+        assert results == [["pong"]] * 4
+        stats = fake_lm.scheduler.stats()
+        assert stats.throttle_events >= 2
+        assert stats.completed == 4
+        assert stats.in_flight == 0
+
+    def test_async_calls_share_the_scheduler(self, fake_lm):
+        async def main():
+            return await asyncio.gather(*(fake_lm.acall(f"p{i}") for i in range(6)))
+
+        assert asyncio.run(main()) == [["pong"]] * 6
+        stats = fake_lm.scheduler.stats()
+        assert stats.throttle_events >= 2
+        assert stats.queue_depth == 0
+
+    def test_copies_share_the_scheduler(self, fake_lm):
+        assert fake_lm.copy().scheduler is fake_lm.scheduler
@@ -1,7 +1,116 @@
-from redactor import PIIRedactor
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import dspy
+import pytest
+
+from demos import as_demo_list
+from examples import EXAMPLES
+from optimizer import pii_metric
+from redactor import PIIEntitySpan, PIIRedactor, apply_entities
 
 
 class TestPIIRedactor:
     def test_has_cot_predictor(self):
         r = PIIRedactor()
         assert hasattr(r, "cot")
+
+    def test_aforward_awaits_cot(self):
+        r = PIIRedactor()
+        r.cot.acall = AsyncMock(return_value="pred")
+        assert asyncio.run(r.acall(text="John")) == "pred"
+        r.cot.acall.assert_awaited_once_with(text="John")
+
+
+class TestEntitiesOnly:
+    def test_uses_entities_signature(self):
+        r = PIIRedactor(entities_only=True)
+        assert "redacted_text" not in r.cot.predict.signature.output_fields
+        assert len(r.cot.demos) == len(PIIRedactor().cot.demos)
+
+    def test_rebuilds_redacted_text(self):
+        r = PIIRedactor(entities_only=True)
+        r.cot = MagicMock(
+            return_value=dspy.Prediction(
+                reasoning="...",
+                entities=[PIIEntitySpan(value="John", label="GIVENNAME1", start=5)],
+            )
+        )
+        pred = r(text="Call John")
+        assert pred.redacted_text == "Call [GIVENNAME1]"
+
+    def test_metric_works_on_reconstructed_output(self):
+        r = PIIRedactor(entities_only=True)
+        r.cot = MagicMock(
+            return_value=dspy.Prediction(
+                entities=[{"value": "555-1234", "label": "TEL"}]
+            )
+        )
+        gold = dspy.Example(redacted_text="Call [TEL]")
+        assert pii_metric(gold, r(text="Call 555-1234")).score == 1.0
+
+
+class TestStrategies:
+    def test_unknown_strategy_rejected(self):
+        with pytest.raises(ValueError):
+            PIIRedactor(strategy="tree_of_thought")
+
+    def test_predict_has_no_reasoning_field(self):
+        r = PIIRedactor(strategy="predict")
+        assert not hasattr(r, "cot")
+        assert "reasoning" not in r.identify.signature.output_fields
+        assert "redacted_text" in r.identify.signature.output_fields
+
+    def test_two_step_redacts_with_found_entities(self):
+        r = PIIRedactor(strategy="two_step")
+        entities = [PIIEntitySpan(value="John", label="GIVENNAME1", start=5)]
+        r.identify = MagicMock(return_value=dspy.Prediction(entities=entities))
+        r.rewrite = MagicMock(
+            return_value=dspy.Prediction(redacted_text="Call [GIVENNAME1]")
+        )
+        pred = r(text="Call John")
+        r.rewrite.assert_called_once_with(text="Call John", entities=entities)
+        assert pred.entities == entities
+        assert pred.redacted_text == "Call [GIVENNAME1]"
+
+    def test_two_step_entities_only_skips_second_call(self):
+        r = PIIRedactor(strategy="two_step", entities_only=True)
+        assert not hasattr(r, "rewrite")
+        r.identify = AsyncMock(
+            return_value=dspy.Prediction(
+                entities=[{"value": "John", "label": "GIVENNAME1"}]
+            )
+        )
+        r.identify.acall = r.identify
+        pred = asyncio.run(r.acall(text="Call John"))
+        assert pred.redacted_text == "Call [GIVENNAME1]"
+
+    def test_predict_demo_pool_defaults_to_examples(self):
+        r = PIIRedactor(strategy="predict", demo_k=2)
+        assert r.identify.demos == []
+        assert r.demo_selector.demos == as_demo_list(EXAMPLES)
+
+
+class TestApplyEntities:
+    def test_replaces_all_occurrences(self):
+        text = "John met John."
+        entities = [{"value": "John", "label": "GIVENNAME1"}]
+        assert apply_entities(text, entities) == "[GIVENNAME1] met [GIVENNAME1]."
+
+    def test_longest_value_wins(self):
+        entities = [
+            {"value": "John", "label": "GIVENNAME1"},
+            {"value": "John Smith", "label": "LASTNAME1"},
+        ]
+        assert apply_entities("Hi John Smith", entities) == "Hi [LASTNAME1]"
+
+    def test_respects_word_boundaries(self):
+        entities = [{"value": "CO", "label": "STATE"}]
+        assert apply_entities("CO and COLD", entities) == "[STATE] and COLD"
+
+    def test_ignores_wrong_offsets(self):
+        entities = [{"value": "Bob", "label": "GIVENNAME1", "start": 0}]
+        assert apply_entities("Hi Bob", entities) == "Hi [GIVENNAME1]"
+
+    def test_no_entities(self):
+        assert apply_entities("Hello", []) == "Hello"
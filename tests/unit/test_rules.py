@@ -0,0 +1,149 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import dspy
+
+from rules import RuleEngine, RulePrefilter, luhn_valid
+
+
+def _labels(text):
+    return [label for _, _, label in RuleEngine().find(text)]
+
+
+class TestLuhn:
+    def test_valid_number(self):
+        assert luhn_valid("046 454 286")
+
+    def test_invalid_number(self):
+        assert not luhn_valid("046 454 287")
+
+
+class TestRuleEngine:
+    def test_email(self):
+        assert _labels("Email me at alice@example.com") == ["EMAIL"]
+
+    def test_ipv4_range_checked(self):
+        assert _labels("Server at 10.0.0.1") == ["IP"]
+        assert _labels("Version 999.1.1.1") != ["IP"]
+
+    def test_ipv6_not_split_into_times(self):
+        assert _labels("ip cffd:ba6:93e:e61a:76e3:e8c6:f47d:fae5") == ["IP"]
+
+    def test_ssn_and_sin(self):
+        assert _labels("SSN 123-45-6789") == ["SOCIALNUMBER"]
+        assert _labels("SIN 046 454 286") == ["SOCIALNUMBER"]
+
+    def test_invalid_ssn_area_rejected(self):
+        assert "SOCIALNUMBER" not in _labels("SSN 666-45-6789")
+
+    def test_dates_and_times(self):
+        labels = _labels("Meet at 10:20am on 2023-08-15 or 23rd June 1958, 9 PM")
+        assert labels == ["TIME", "DATE", "DATE", "TIME"]
+
+    def test_geocoord(self):
+        assert _labels("at [37.4353, -86.941]") == ["GEOCOORD"]
+
+    def test_postcode_before_tel(self):
+        assert _labels("WA14 5RH and 93023-9549") == ["POSTCODE", "POSTCODE"]
+
+    def test_tel(self):
+        assert _labels("Call +4402033654632 or 555-123-4567") == ["TEL", "TEL"]
+
+    def test_bare_digit_run_is_not_tel(self):
+        assert _labels("Order 12345678 shipped") == []
+        assert _labels("Ref 1234-5678") == []
+
+    def test_ordinary_numbers_are_not_pii(self):
+        for text in (
+            "Price is 3.50, 1.25 each",
+            "ratio 12.34,56.78",
+            "Version 1.2.10",
+            "192.168.1.300",
+            "room 101 202 303 404",
+        ):
+            result = RuleEngine().apply(text)
+            assert result.redacted_text == text, text
+            assert not result.complete, text
+
+    def test_bare_geocoord_needs_four_decimals(self):
+        assert _labels("at 37.43531, -86.94123.") == ["GEOCOORD"]
+
+    def test_date_day_and_month_range_checked(self):
+        assert _labels("on 12.03.2024 or 03/12/24") == ["DATE", "DATE"]
+        assert _labels("codes 45/13/2020 and 2023-13-01") == []
+
+    def test_national_tel_layouts(self):
+        assert _labels("Call (555) 123-4567 or 020 7946 0958.") == ["TEL", "TEL"]
+        assert _labels("Call 555.123.4567") == []
+
+    def test_apply_replaces_with_placeholders(self):
+        result = RuleEngine().apply("Mail bob@x.io at 10:20")
+        assert result.redacted_text == "Mail [EMAIL] at [TIME]"
+        assert [e.value for e in result.entities] == ["bob@x.io", "10:20"]
+
+    def test_complete_when_nothing_left(self):
+        assert RuleEngine().apply("thanks, mail me at bob@x.io.").complete
+
+    def test_not_complete_with_names(self):
+        assert not RuleEngine().apply("Call John Smith at 555-123-4567").complete
+
+    def test_sentence_initial_names_are_not_complete(self):
+        for text in ("John called.", "Maria will call tomorrow.", "ok. Maria left"):
+            assert not RuleEngine().apply(text).complete, text
+
+    def test_keyword_cues_are_not_complete(self):
+        assert not RuleEngine().apply("my password is hunter two").complete
+        assert not RuleEngine().apply("his username is quietfox").complete
+        assert not RuleEngine().apply("please bring your card").complete
+
+    def test_pronoun_i_is_allowed(self):
+        assert RuleEngine().apply("sure, I'll mail you at bob@x.io").complete
+
+
+class TestRulePrefilter:
+    def test_skips_llm_when_complete(self):
+        program = MagicMock()
+        prefilter = RulePrefilter(program)
+        pred = prefilter(text="mail me at bob@x.io")
+        program.assert_not_called()
+        assert pred.redacted_text == "mail me at [EMAIL]"
+        assert prefilter.calls_avoided == 1
+
+    def test_sends_pre_redacted_text_and_merges_entities(self):
+        program = MagicMock(
+            return_value=dspy.Prediction(
+                entities=[{"value": "John", "label": "GIVENNAME1"}],
+                redacted_text="Call [GIVENNAME1] at [TEL]",
+            )
+        )
+        prefilter = RulePrefilter(program)
+        pred = prefilter(text="Call John at 555-123-4567")
+        program.assert_called_once_with(text="Call John at [TEL]")
+        assert [
+            e["label"] if isinstance(e, dict) else e.label for e in pred.entities
+        ] == [
+            "TEL",
+            "GIVENNAME1",
+        ]
+        assert prefilter.calls_avoided == 0
+        assert prefilter.avoided_rate == 0.0
+
+    def test_sentence_initial_name_goes_to_llm(self):
+        program = MagicMock(
+            return_value=dspy.Prediction(
+                entities=[{"value": "John", "label": "GIVENNAME1"}],
+                redacted_text="[GIVENNAME1] called.",
+            )
+        )
+        pred = RulePrefilter(program)(text="John called.")
+        program.assert_called_once_with(text="John called.")
+        assert pred.redacted_text == "[GIVENNAME1] called."
+
+    def test_async_path(self):
+        program = MagicMock()
+        program.acall = AsyncMock(
+            return_value=dspy.Prediction(entities=[], redacted_text="Hi [GIVENNAME1]")
+        )
+        prefilter = RulePrefilter(program)
+        pred = asyncio.run(prefilter.acall(text="Hi John"))
+        assert pred.redacted_text == "Hi [GIVENNAME1]"
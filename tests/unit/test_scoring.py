@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from optimizer import score_pii
+from scoring import score_batch, score_interval
+
+GOLD = [
+    "Call [GIVENNAME1] at [TEL]",
+    "No PII here.",
+    "[EMAIL] and [EMAIL]",
+    "[CITY]",
+    "plain",
+]
+PRED = [
+    "Call [LASTNAME1] at [TEL]",
+    "No PII here.",
+    "[EMAIL] and bob@x.com",
+    "Paris",
+    "[TEL]",
+]
+
+
+class TestScoreBatch:
+    def test_matches_score_pii(self):
+        batch = score_batch(GOLD, PRED)
+        for i, (g, p) in enumerate(zip(GOLD, PRED)):
+            ref = score_pii(g, p)
+            assert batch.detection_recall[i] == ref.detection_recall
+            assert batch.classification_acc[i] == ref.classification_acc
+            assert batch.hybrid[i] == ref.hybrid_score
+        assert batch.score == pytest.approx(
+            np.mean([score_pii(g, p).hybrid_score for g, p in zip(GOLD, PRED)])
+        )
+
+    def test_count_matrix(self):
+        batch = score_batch(GOLD, PRED)
+        email = batch.labels.index("EMAIL")
+        assert batch.gold[email].tolist() == [0, 0, 2, 0, 0]
+        assert batch.pred[email].tolist() == [0, 0, 1, 0, 0]
+
+    def test_label_table(self):
+        rows = {r["label"]: r for r in score_batch(GOLD, PRED).label_table()}
+        assert rows["TEL"]["gold"] == 1 and rows["TEL"]["pred"] == 2
+        assert rows["TEL"]["recall"] == 1.0 and rows["TEL"]["precision"] == 0.5
+        assert rows["LASTNAME1"]["recall"] is None
+
+    def test_confusion_accounts_for_every_gold_item(self):
+        batch = score_batch(GOLD, PRED)
+        confusion = batch.confusion()
+        labels = batch.labels
+        given = labels.index("GIVENNAME1")
+        assert confusion[given, labels.index("LASTNAME1")] == 1
+        assert confusion[labels.index("CITY"), -1] == 1  # MISSED
+        assert confusion.sum() == batch.gold.sum()
+        assert "GIVENNAME1" in batch.format_label_table()
+
+    def test_separator_inside_text(self):
+        batch = score_batch(["a\x00[TEL]", "[TEL]"], ["[TEL]", "b"])
+        assert batch.hybrid.tolist() == [1.0, 0.0]
+
+    def test_empty_and_mismatched(self):
+        assert score_batch([], []).score == 0.0
+        with pytest.raises(ValueError):
+            score_batch(["a"], [])
+
+
+class TestScoreInterval:
+    def test_normal_approximation(self):
+        interval = score_interval([0.0, 1.0] * 50)
+        assert interval.n == 100
+        assert interval.mean == pytest.approx(50.0)
+        # 1.96 * sd(0.5025) / sqrt(100) on the 0-100 scale
+        assert interval.width == pytest.approx(2 * 1.96 * 100 * 0.50252 / 10, 1e-3)
+
+    def test_narrows_with_more_scores(self):
+        small = score_interval([0.2, 0.9, 0.5, 0.7] * 5)
+        large = score_interval([0.2, 0.9, 0.5, 0.7] * 50)
+        assert large.width < small.width
+
+    def test_too_few_scores_is_unbounded(self):
+        assert score_interval([1.0]).width == np.inf
+        assert score_interval([]).n == 0
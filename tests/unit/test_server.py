@@ -0,0 +1,113 @@
+import http.client
+import json
+import threading
+from unittest.mock import MagicMock
+
+import dspy
+import pytest
+
+from server import NotReady, Overloaded, RedactionService, make_server
+
+
+def _session(predict=None):
+    session = MagicMock()
+    session.model = "m"
+    session.predict.side_effect = predict or (
+        lambda text: dspy.Prediction(entities=[], redacted_text=text.upper())
+    )
+    return session
+
+
+def _request(server, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=10)
+    conn.request(method, path, body=json.dumps(body) if body is not None else None)
+    response = conn.getresponse()
+    payload = json.loads(response.read())
+    conn.close()
+    return response.status, payload
+
+
+@pytest.fixture
+def running():
+    servers = []
+
+    def start(service):
+        server = make_server(service, port=0, request_timeout=5)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append((server, service))
+        return server
+
+    yield start
+    for server, service in servers:
+        server.shutdown()
+        server.server_close()
+        service.shutdown()
+
+
+class TestRedactionService:
+    def test_not_ready_before_start(self):
+        service = RedactionService(_session, warmup=False)
+        with pytest.raises(NotReady):
+            service.submit(["hi"])
+
+    def test_warmup_runs_once_before_ready(self):
+        session = _session()
+        service = RedactionService(lambda: session)
+        service.start()
+        assert service.ready
+        session.predict.assert_called_once()
+
+    def test_warmup_failure_keeps_not_ready(self):
+        session = _session(predict=lambda text: (_ for _ in ()).throw(OSError("down")))
+        service = RedactionService(lambda: session)
+        service.start()
+        assert not service.ready
+        assert "down" in str(service.warmup_error)
+
+    def test_rejects_when_queue_full(self):
+        release = threading.Event()
+
+        def predict(text):
+            release.wait(timeout=5)
+            return dspy.Prediction(entities=[], redacted_text=text)
+
+        service = RedactionService(
+            lambda: _session(predict), workers=1, queue_size=1, warmup=False
+        )
+        service.start()
+        futures = service.submit(["a", "b"])
+        with pytest.raises(Overloaded):
+            service.submit(["c"])
+        release.set()
+        assert [f.result().redacted_text for f in futures] == ["a", "b"]
+        assert service.submit(["d"])[0].result().redacted_text == "d"
+        service.shutdown()
+
+
+class TestHTTP:
+    def test_health_and_readiness(self, running):
+        service = RedactionService(_session, warmup=False)
+        server = running(service)
+        assert _request(server, "GET", "/healthz")[0] == 200
+        assert _request(server, "GET", "/readyz")[0] == 503
+        service.start()
+        assert _request(server, "GET", "/readyz")[0] == 200
+
+    def test_redact_and_batch(self, running):
+        service = RedactionService(_session, warmup=False)
+        service.start()
+        server = running(service)
+        status, body = _request(server, "POST", "/redact", {"text": "john"})
+        assert (status, body) == (200, {"entities": [], "redacted_text": "JOHN"})
+        status, body = _request(server, "POST", "/redact/batch", {"texts": ["a", "b"]})
+        assert [r["redacted_text"] for r in body["results"]] == ["A", "B"]
+
+    def test_status_codes(self, running):
+        service = RedactionService(_session, workers=1, queue_size=0, warmup=False)
+        server = running(service)
+        assert _request(server, "POST", "/redact", {"text": "x"})[0] == 503
+        service.start()
+        assert _request(server, "POST", "/redact", {"txt": "x"})[0] == 400
+        assert (
+            _request(server, "POST", "/redact/batch", {"texts": ["a", "b"]})[0] == 413
+        )
@@ -0,0 +1,165 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+import dspy
+import pytest
+from dspy.clients.base_lm import record_history
+
+from cascade import CascadeRedactor
+from hedging import HedgedRedactor
+from known_entities import EntityScope
+from session import Redactor, get_default_redactor, reset_default_redactor
+from validation import ValidatedRedactor
+
+
+def _program(redacted="[GIVENNAME1]"):
+    program = MagicMock()
+    program.return_value = MagicMock(redacted_text=redacted, entities=[])
+    return program
+
+
+class TestRedactor:
+    @patch("session.dspy")
+    def test_uses_given_program(self, mock_dspy):
+        program = _program()
+        session = Redactor(model="m", program=program)
+        assert session.redact("John") == "[GIVENNAME1]"
+        program.assert_called_once_with(text="John")
+
+    @patch("session.dspy")
+    def test_binds_lm_with_context_not_configure(self, mock_dspy):
+        session = Redactor(model="m", program=_program())
+        session.redact("John")
+        call_lm = mock_dspy.context.call_args.kwargs["lm"]
+        assert call_lm is not session.lm  # a per-call copy
+        assert call_lm.model == session.lm.model
+        mock_dspy.configure.assert_not_called()
+
+    @patch("optimizer.load_optimized_model", return_value=None)
+    @patch("session.PIIRedactor")
+    @patch("session.dspy")
+    def test_falls_back_to_base_redactor(self, mock_dspy, mock_cls, _mock_load):
+        session = Redactor(model="m")
+        assert session.program is mock_cls.return_value
+
+    @patch("session.dspy")
+    def test_hedger_wraps_model_program(self, mock_dspy, monkeypatch):
+        monkeypatch.setenv("REDACT_HEDGE_PERCENTILE", "99")
+        with patch("optimizer.load_optimized_model", return_value=_program()):
+            session = Redactor.from_env()
+        assert isinstance(session.program, HedgedRedactor)
+        assert session.program.hedger is session.hedger
+        assert session.hedger.percentile == 99
+        assert session.redact("John") == "[GIVENNAME1]"
+        assert session.hedger.stats().requests == 1
+
+    @patch("session.dspy")
+    def test_cascade_wraps_model_program(self, mock_dspy, monkeypatch):
+        monkeypatch.setenv("REDACT_CASCADE_MODEL", "gemini/cheap")
+        with patch("optimizer.load_optimized_model", return_value=_program()):
+            session = Redactor.from_env()
+        assert isinstance(session.program, CascadeRedactor)
+        assert session.program.cheap_lm.model == "gemini/cheap"
+
+    @patch("session.dspy")
+    def test_repair_wraps_model_program(self, mock_dspy, monkeypatch):
+        monkeypatch.setenv("REDACT_REPAIR", "true")
+        monkeypatch.setenv("REDACT_CASCADE_MODEL", "gemini/cheap")
+        with patch("optimizer.load_optimized_model", return_value=_program()):
+            session = Redactor.from_env()
+        # repair runs inside the cascade, so repaired outputs are not escalated
+        assert isinstance(session.program.program, ValidatedRedactor)
+
+    @patch("session.dspy")
+    def test_strategy_selects_saved_program(self, mock_dspy, monkeypatch):
+        monkeypatch.setenv("REDACT_STRATEGY", "predict")
+        with patch("optimizer.load_optimized_model", return_value=None) as load:
+            session = Redactor.from_env()
+        assert load.call_args.kwargs["strategy"] == "predict"
+        assert session.program.strategy == "predict"
+
+    @patch("session.dspy")
+    def test_cache_key_covers_session_options(self, mock_dspy):
+        from cache import RedactionCache
+
+        cache = RedactionCache(path=None)
+        plain = Redactor(model="m", program=_program(), cache=cache)
+        repaired = Redactor(model="m", program=_program(), cache=cache, repair=True)
+        assert plain.program.config != repaired.program.config
+
+    def test_predict_packed_rejects_fast_path(self):
+        from redactor import PIIRedactor
+
+        session = Redactor(model="m", program=PIIRedactor(), fast_path=True)
+        with pytest.raises(ValueError, match="RulePrefilter"):
+            session.predict_packed(["John"])
+
+    def test_cost_is_per_call_and_running(self):
+        def program(text):
+            dspy.settings.lm.history.extend([{"cost": 0.25}, {"cost": None}])
+            return dspy.Prediction(entities=[], redacted_text=text)
+
+        session = Redactor(model="m", program=program)
+        session.lm.history = [{"cost": 9.0}]  # not this session's calls
+        assert session.predict_with_cost("a")[1] == 0.25
+        session.redact("b")
+        assert session.cost == 0.5
+
+    def test_cost_is_not_capped_by_history_size(self):
+        def program(text):
+            record_history(dspy.settings.lm, {"cost": 0.5})
+            return dspy.Prediction(entities=[], redacted_text=text)
+
+        session = Redactor(model="m", program=program)
+        with dspy.context(max_history_size=1):
+            for text in "abcd":
+                session.redact(text)
+        assert session.cost == 2.0
+
+
+class TestDefaultRedactor:
+    @pytest.fixture(autouse=True)
+    def _fresh_session(self):
+        reset_default_redactor()
+        yield
+        reset_default_redactor()
+
+    @patch("session.Redactor.from_env")
+    def test_builds_session_once(self, mock_from_env):
+        sessions = []
+        threads = [
+            threading.Thread(target=lambda: sessions.append(get_default_redactor()))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        mock_from_env.assert_called_once()
+        assert all(s is sessions[0] for s in sessions)
+
+    @patch("session.Redactor.from_env")
+    def test_reset_rebuilds(self, mock_from_env):
+        mock_from_env.side_effect = [MagicMock(), MagicMock()]
+        first = get_default_redactor()
+        reset_default_redactor()
+        assert get_default_redactor() is not first
+
+
+class TestScopedRedaction:
+    @patch("session.dspy")
+    def test_scope_propagates_across_calls(self, mock_dspy):
+        program = MagicMock(
+            side_effect=[
+                MagicMock(
+                    entities=[{"value": "Balloi", "label": "GIVENNAME1"}],
+                    redacted_text="Hi [GIVENNAME1]",
+                ),
+                MagicMock(entities=[], redacted_text="Bye [GIVENNAME1]"),
+            ]
+        )
+        session = Redactor(model="m", program=program)
+        scope = EntityScope("thread-1")
+        session.redact("Hi Balloi", scope=scope)
+        session.redact("Bye Balloi", scope=scope)
+        assert program.call_args_list[1].kwargs == {"text": "Bye [GIVENNAME1]"}
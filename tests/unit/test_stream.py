@@ -0,0 +1,120 @@
+import io
+import json
+import threading
+
+import dspy
+
+from stream import Checkpoint, read_records, run_stream, stream_redact
+
+
+def _predict(text):
+    if text == "boom":
+        raise RuntimeError("LM error")
+    return dspy.Prediction(entities=[], redacted_text=text.upper())
+
+
+class TestReadRecords:
+    def test_plain_text_and_jsonl(self):
+        lines = ["hello\n", "\n", '{"id": "a", "text": "John"}\n']
+        records = list(read_records(lines))
+        assert [(r.index, r.id, r.text) for r in records] == [
+            (0, 0, "hello"),
+            (2, "a", "John"),
+        ]
+
+    def test_custom_text_field(self):
+        [record] = read_records(['{"body": "hi"}'], text_field="body")
+        assert record.text == "hi"
+
+    def test_missing_text_field_is_a_record_error(self):
+        records = list(read_records(['{"id": "x", "body": "hi"}', "next"]))
+        assert [(r.id, r.text) for r in records] == [("x", ""), (1, "next")]
+        assert "line 1" in str(records[0].error)
+        assert records[1].error is None
+
+    def test_brace_without_json_is_text(self):
+        [record] = read_records(["{not json"])
+        assert record.text == "{not json"
+
+
+class TestStreamRedact:
+    def test_window_bounds_in_flight(self):
+        lock = threading.Lock()
+        in_flight = peak = 0
+
+        def predict(text):
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            try:
+                return _predict(text)
+            finally:
+                with lock:
+                    in_flight -= 1
+
+        records = read_records(f"t{i}" for i in range(50))
+        results = list(stream_redact(records, predict, window=4))
+        assert len(results) == 50
+        assert peak <= 4
+
+    def test_ordered_output(self):
+        release = threading.Event()
+
+        def predict(text):
+            if text == "first":
+                release.wait(timeout=5)
+            else:
+                release.set()
+            return _predict(text)
+
+        records = read_records(["first", "second", "third"])
+        results = stream_redact(records, predict, window=3, ordered=True)
+        assert [r.record.text for r in results] == ["first", "second", "third"]
+
+    def test_errors_are_per_record(self):
+        results = list(stream_redact(read_records(["ok", "boom"]), _predict))
+        errors = [r for r in results if r.error is not None]
+        assert len(results) == 2
+        assert errors[0].record.text == "boom"
+
+
+class TestRunStream:
+    def test_writes_jsonl(self):
+        out = io.StringIO()
+        written, failed = run_stream(["a", "boom"], out, _predict, ordered=True)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert (written, failed) == (1, 1)
+        assert rows[0] == {"id": 0, "redacted_text": "A", "entities": []}
+        assert rows[1] == {"id": 1, "error": "LM error"}
+
+    def test_missing_text_field_does_not_abort(self):
+        out = io.StringIO()
+        lines = ['{"id": "a", "text": "x"}', '{"id": "b"}', '{"id": "c", "text": "y"}']
+        calls = []
+
+        def predict(text):
+            calls.append(text)
+            return _predict(text)
+
+        written, failed = run_stream(lines, out, predict, ordered=True)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert (written, failed) == (2, 1)
+        assert sorted(calls) == ["x", "y"]
+        assert [row["id"] for row in rows] == ["a", "b", "c"]
+        assert "no 'text' field" in rows[1]["error"]
+
+    def test_resumes_from_checkpoint(self, tmp_path):
+        path = str(tmp_path / "job.ckpt")
+        run_stream(["a", "boom", "c"], io.StringIO(), _predict, checkpoint=path)
+        assert Checkpoint(path).done == {0, 2}
+
+        seen = []
+
+        def predict(text):
+            seen.append(text)
+            return _predict(text.replace("boom", "b"))
+
+        run_stream(["a", "boom", "c"], io.StringIO(), predict, checkpoint=path)
+        assert seen == ["boom"]
+        assert Checkpoint(path).done == {0, 1, 2}
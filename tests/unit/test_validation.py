@@ -0,0 +1,144 @@
+import time
+from unittest.mock import MagicMock
+
+import dspy
+
+from validation import Issue, ValidatedRedactor, repair, validate
+
+
+def _kinds(text, redacted, entities):
+    pred = dspy.Prediction(entities=entities, redacted_text=redacted)
+    return [issue.kind for issue in validate(text, pred)]
+
+
+class TestValidate:
+    def test_clean_redaction(self):
+        entities = [{"value": "John", "label": "GIVENNAME1"}]
+        assert _kinds("Call John now", "Call [GIVENNAME1] now", entities) == []
+
+    def test_unknown_label(self):
+        entities = [{"value": "John", "label": "NAME"}]
+        assert _kinds("Call John now", "Call [NAME] now", entities) == ["unknown_label"]
+
+    def test_leaked_value(self):
+        entities = [{"value": "John", "label": "GIVENNAME1"}]
+        kinds = _kinds("John and John", "[GIVENNAME1] and John", entities)
+        assert kinds == ["leaked_value"]
+
+    def test_entities_and_placeholders_disagree(self):
+        entities = [{"value": "Smith", "label": "LASTNAME1"}]
+        kinds = _kinds("Call John now", "Call [GIVENNAME1] now", entities)
+        assert kinds == ["missing_placeholder", "unlisted_placeholder"]
+
+    def test_surviving_rule_pattern(self):
+        entities = [{"value": "John", "label": "GIVENNAME1"}]
+        kinds = _kinds("John: a@b.com", "[GIVENNAME1]: a@b.com", entities)
+        assert kinds == ["rule_match"]
+
+    def test_rewritten_text(self):
+        entities = [{"value": "John", "label": "GIVENNAME1"}]
+        kinds = _kinds("Call John now", "Please call [GIVENNAME1]", entities)
+        assert kinds == ["rewritten"]
+
+
+_TEXT = "Call John Smith at a@b.com"
+_JOHN = {"value": "John", "label": "GIVENNAME1"}
+_SMITH = {"value": "Smith", "label": "LASTNAME1"}
+
+
+def _repair(redacted, entities):
+    return repair(_TEXT, dspy.Prediction(entities=entities, redacted_text=redacted))
+
+
+class TestRepair:
+    def test_sound_prediction_is_returned_as_is(self):
+        pred = dspy.Prediction(
+            entities=[_JOHN], redacted_text="Call [GIVENNAME1] Smith at [EMAIL]"
+        )
+        pred.entities.append({"value": "a@b.com", "label": "EMAIL"})
+        assert repair(_TEXT, pred) == (pred, [])
+
+    def test_leaked_value_is_replaced(self):
+        fixed, issues = _repair("Call [GIVENNAME1] Smith at [EMAIL]", [_JOHN, _SMITH])
+        assert fixed.redacted_text == "Call [GIVENNAME1] [LASTNAME1] at [EMAIL]"
+        assert issues == []
+
+    def test_unlisted_placeholders_stay_redacted(self):
+        fixed, issues = _repair("Call [GIVENNAME1] [LASTNAME1] at [EMAIL]", [_JOHN])
+        assert fixed.redacted_text == "Call [GIVENNAME1] [LASTNAME1] at [EMAIL]"
+        assert {(e.value, e.label) for e in fixed.entities} >= {
+            ("Smith", "LASTNAME1"),
+            ("a@b.com", "EMAIL"),
+        }
+        assert issues == []
+
+    def test_rewritten_text_is_rebuilt_from_entities(self):
+        fixed, issues = _repair("Contact [GIVENNAME1] [LASTNAME1]", [_JOHN, _SMITH])
+        assert fixed.redacted_text == "Call [GIVENNAME1] [LASTNAME1] at [EMAIL]"
+        assert issues == []
+
+    def test_untraceable_placeholder_is_flagged(self):
+        fixed, issues = _repair("Contact [GIVENNAME1] [LASTNAME1]", [_JOHN])
+        assert fixed.redacted_text == "Call [GIVENNAME1] Smith at [EMAIL]"
+        assert issues == [Issue("unlisted_placeholder", "LASTNAME1")]
+
+    def test_unknown_label_is_flagged_not_repaired(self):
+        pred = dspy.Prediction(
+            entities=[{"value": "John", "label": "NAME"}],
+            redacted_text="Call [NAME]",
+        )
+        assert repair("Call John", pred) == (pred, [Issue("unknown_label", "NAME")])
+
+
+class TestValidatedRedactor:
+    def test_repairs_and_counts(self):
+        program = MagicMock(
+            return_value=dspy.Prediction(entities=[_JOHN], redacted_text=_TEXT)
+        )
+        validated = ValidatedRedactor(program)
+        pred = validated(text=_TEXT)
+        assert pred.redacted_text == "Call [GIVENNAME1] Smith at [EMAIL]"
+        assert (validated.calls, validated.repaired, validated.flagged) == (1, 1, 0)
+
+
+def _long_letter(sentences=40):
+    return " ".join(
+        f"Dear John Smith, your order {i} ships to Leeds on Monday."
+        for i in range(sentences)
+    )
+
+
+class TestAlignmentIsLinear:
+    def test_many_placeholders_over_mismatched_text(self):
+        # a backtracking ".+?" fullmatch never finishes on this
+        text = " ".join(f"word{i}" for i in range(200)) + " end."
+        redacted = " ".join(["[CITY]"] * 15) + " fin."
+        start = time.perf_counter()
+        assert _kinds(text, redacted, [{"value": "word1", "label": "CITY"}]) == [
+            "rewritten"
+        ]
+        assert time.perf_counter() - start < 1.0
+
+    def test_reworded_long_text_is_rejected_quickly(self):
+        text = _long_letter()
+        redacted = text.replace("John", "[GIVENNAME1]").replace("Smith", "[LASTNAME1]")
+        redacted = redacted[: -len("on Monday.")] + "next week."
+        entities = [_JOHN, _SMITH]
+        start = time.perf_counter()
+        kinds = _kinds(text, redacted, entities)
+        assert time.perf_counter() - start < 1.0
+        assert kinds == ["rewritten"]
+
+    def test_repair_of_text_rewritten_between_placeholders(self):
+        text = _long_letter()
+        redacted = text.replace("John", "[GIVENNAME1]").replace("Smith", "[LASTNAME1]")
+        redacted = redacted.replace("ships to", "will be sent to", 3)
+        start = time.perf_counter()
+        fixed, issues = repair(
+            text, dspy.Prediction(entities=[_JOHN, _SMITH], redacted_text=redacted)
+        )
+        assert time.perf_counter() - start < 1.0
+        assert fixed.redacted_text == text.replace("John", "[GIVENNAME1]").replace(
+            "Smith", "[LASTNAME1]"
+        )
+        assert issues == []
@@ -0,0 +1,156 @@
+import logging
+import re
+import threading
+from dataclasses import dataclass
+
+import dspy
+
+from optimizer import PII_LABELS
+from redactor import (
+    PIIEntitySpan,
+    _value_pattern,
+    align_placeholders,
+    apply_entities,
+    as_entity_span,
+)
+from rules import RuleEngine
+
+logger = logging.getLogger(__name__)
+
+_stats_lock = threading.Lock()
+
+_PLACEHOLDER_RE = re.compile(r"\[([A-Z]+\d*)\]")
+_ALLOWED = frozenset(PII_LABELS)
+
+
+@dataclass(frozen=True)
+class Issue:
+    """One local check a redaction failed.
+
+    kind is one of unknown_label, leaked_value, missing_placeholder,
+    unlisted_placeholder, rule_match or rewritten.
+    """
+
+    kind: str
+    detail: str
+
+
+def validate(
+    text: str, pred: dspy.Prediction, engine: RuleEngine | None = None
+) -> list[Issue]:
+    """Check a redaction of text without calling a model.
+
+    - every entity label and placeholder is in PII_LABELS
+    - no entity value is left in redacted_text
+    - every entity label has a placeholder, and every placeholder an entity
+    - no rule-engine pattern (email, phone, IP, ...) survives in redacted_text
+    - redacted_text is text with spans replaced, not rewritten around them
+
+    Returns the issues found; an empty list means the output looks sound.
+    """
+    engine = engine or RuleEngine()
+    redacted = (pred.redacted_text or "").strip()
+    entities = [as_entity_span(e) for e in pred.entities or []]
+    placeholders = set(_PLACEHOLDER_RE.findall(redacted))
+    issues: list[Issue] = []
+
+    labels = {e.label for e in entities}
+    for label in sorted((labels | placeholders) - _ALLOWED):
+        issues.append(Issue("unknown_label", label))
+    for e in entities:
+        if e.value.strip() and _value_pattern(e.value).search(redacted):
+            issues.append(Issue("leaked_value", f"{e.label}: {e.value!r}"))
+    for label in sorted(labels - placeholders):
+        issues.append(Issue("missing_placeholder", label))
+    for label in sorted(placeholders - labels):
+        issues.append(Issue("unlisted_placeholder", label))
+    for start, end, label in engine.find(_PLACEHOLDER_RE.sub(" ", redacted)):
+        issues.append(Issue("rule_match", label))
+    if align_placeholders(text, redacted) is None:
+        issues.append(Issue("rewritten", "redacted_text does not follow the input"))
+    return issues
+
+
+# Kinds a span rebuild can fix; unknown labels need the model.
+REPAIRABLE = frozenset(
+    {
+        "leaked_value",
+        "missing_placeholder",
+        "unlisted_placeholder",
+        "rule_match",
+        "rewritten",
+    }
+)
+
+
+def repair(
+    text: str, pred: dspy.Prediction, engine: RuleEngine | None = None
+) -> tuple[dspy.Prediction, list[Issue]]:
+    """Fix a redaction locally where validate() finds repairable issues.
+
+    redacted_text is rebuilt from text with apply_entities, using the listed
+    entities, the spans the model's own placeholders cover (recovered by
+    aligning redacted_text with text) and rule-engine matches, so no listed
+    value or rule pattern survives and nothing the model redacted is
+    un-redacted.  Returns the (possibly repaired) prediction and the issues
+    left: unknown labels, and placeholders of a rewritten text that could
+    not be traced back to a span.
+    """
+    engine = engine or RuleEngine()
+    issues = validate(text, pred, engine)
+    if not any(issue.kind in REPAIRABLE for issue in issues):
+        return pred, issues
+
+    entities = [as_entity_span(e) for e in pred.entities or []]
+    redacted = (pred.redacted_text or "").strip()
+    placeholders = _PLACEHOLDER_RE.findall(redacted)
+    aligned = align_placeholders(text, redacted)
+    for start, end, label in aligned or []:
+        entities.append(PIIEntitySpan(value=text[start:end], label=label, start=start))
+    for start, end, label in engine.find(text):
+        entities.append(PIIEntitySpan(value=text[start:end], label=label, start=start))
+    entities = list({(e.value, e.label, e.start): e for e in entities}.values())
+
+    repaired = dspy.Prediction(
+        entities=entities, redacted_text=apply_entities(text, entities)
+    )
+    remaining = validate(text, repaired, engine)
+    if aligned is None:
+        listed = {e.label for e in entities}
+        remaining += [
+            Issue("unlisted_placeholder", label)
+            for label in sorted(set(placeholders) - listed)
+        ]
+    return repaired, remaining
+
+
+class ValidatedRedactor(dspy.Module):
+    """Check each prediction locally and repair it without another LLM call.
+
+    See repair(); predictions that still have issues are returned as
+    repaired as possible and logged, and counted in self.flagged.
+    """
+
+    def __init__(self, program: dspy.Module) -> None:
+        super().__init__()
+        self.program = program
+        self.engine = RuleEngine()
+        self.calls = 0
+        self.repaired = 0
+        self.flagged = 0
+
+    def _check(self, text: str, pred: dspy.Prediction) -> dspy.Prediction:
+        fixed, issues = repair(text, pred, self.engine)
+        with _stats_lock:
+            self.calls += 1
+            self.repaired += fixed is not pred
+            self.flagged += bool(issues)
+        if issues:
+            logger.warning("Redaction still fails validation: %s", issues)
+        return fixed
+
+    def forward(self, text: str) -> dspy.Prediction:
+        return self._check(text, self.program(text=text))
+
+    async def aforward(self, text: str) -> dspy.Prediction:
+        return self._check(text, await self.program.acall(text=text))